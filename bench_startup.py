@@ -0,0 +1,51 @@
+"""Time from launching main.py to its first input() prompt.
+
+"lazy" runs main.py as it is; "eager" first imports everything in
+main.HEAVY_MODULES, which is what startup used to cost when the stage
+modules imported their dependencies at the top.
+
+Usage: python bench_startup.py [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from main import HEAVY_MODULES
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+EAGER = (f"for m in {HEAVY_MODULES!r}:\n"
+         "    try:\n"
+         "        __import__(m)\n"
+         "    except Exception:\n"
+         "        pass\n"
+         "import main\n"
+         "main.user_input()\n")
+
+
+def time_to_prompt(cmd):
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=HERE, stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    proc.stdout.read(1)  # input() flushes the prompt before blocking
+    elapsed = time.perf_counter() - start
+    proc.kill()
+    proc.wait()
+    return elapsed
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    results = {}
+    for name, cmd in [("lazy", [sys.executable, "main.py"]),
+                      ("eager", [sys.executable, "-c", EAGER])]:
+        times = [time_to_prompt(cmd) for _ in range(runs)]
+        results[name] = statistics.median(times)
+        print(f"{name:>5}: {results[name] * 1000:8.1f} ms to first prompt (median of {runs})")
+    print(f"speedup: {results['eager'] / results['lazy']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
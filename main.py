@@ -1,22 +1,199 @@
-import asyncio
-from stage_1.audio_separation import audio_separation
-# from stage_2.dedalus import dedalus_main
-from stage_2.melody_extraction import melody_main
+import argparse
+import subprocess
+import sys
 
+# The stages pull in yt_dlp, librosa, scipy and basic_pitch (TensorFlow),
+# which take seconds to import, so they are only imported once the user
+# has entered a URL.
+HEAVY_MODULES = [
+    "stage_1.audio_separation",
+    "stage_2.melody_extraction",
+    "yt_dlp",
+    "numpy",
+    "scipy.signal",
+    "librosa",
+    "soundfile",
+    "pretty_midi",
+    "basic_pitch.inference",
+]
 
-def user_input():
+
+STAGES = ["download", "wav", "fingerprint", "separate", "melody", "chords"]
+
+
+def run_pipeline(url, resume=False, run_dir=None, progress=None, correct_pitch=False,
+                 separation="spleeter", melody_backend="basic_pitch", dedupe=True):
+    """Run every stage for url, checkpointing each one (see pipeline.py).
+
+    With resume=True, stages that already completed for this URL are
+    skipped. progress(stage, state) is called as each stage starts and
+    ends. correct_pitch adds a last stage that fixes the melody against
+    the chords (see stage_2/pitch_correction.py). separation picks the
+    stage 1 backend, "spleeter" or the cheaper "fast" preview split, and
+    melody_backend the transcriber, "basic_pitch" or an f0 tracker ("yin",
+    "pyin"; see stage_2/pitch_tracking.py). With dedupe, a song that an
+    earlier run already processed under another URL is recognized by its
+    audio fingerprint (stage_1/fingerprint.py) and that run's stems and
+    transcriptions are reused wherever the settings match.
+    """
+    import json
+    from pathlib import Path
+
+    from pipeline import RUNS_DIR, RunManifest, run_id, run_stage
+    from stage_1.audio_separation import mp3_to_wav, separate, url_to_mp3
+    from stage_2.melody_extraction import extract_chords, extract_melody
+
+    manifest = RunManifest(run_dir or RUNS_DIR / run_id(url))
+    print(f"Run directory: {manifest.run_dir}")
+
+    def identify(wav):
+        """The wav of the first run of this song: ours if it's new."""
+        from stage_1.fingerprint import SongIndex, fingerprint_file
+
+        index = SongIndex(RUNS_DIR / "fingerprints.sqlite")
+        hashes, frames = fingerprint_file(wav)
+        here = str(manifest.run_dir.resolve())
+        found = {"run_dir": None}
+        # oldest first, and only runs that were new songs are in the index
+        for match in sorted(index.matches(hashes, frames), key=lambda m: m.song):
+            if match.info["run_dir"] == here:
+                break
+            record = RunManifest(match.info["run_dir"]).load("wav") if Path(match.info["run_dir"]).is_dir() else None
+            if record and record.get("status") == "ok" and Path(record["outputs"]["wav"]["path"]).is_file():
+                found = {"run_dir": match.info["run_dir"], "score": match.score, "offset": match.offset}
+                wav = record["outputs"]["wav"]["path"]
+                print(f"Same song as {match.info['run_dir']} ({match.score} matching hashes)")
+                break
+        else:
+            index.add(hashes, frames, {"run_dir": here})
+        path = manifest.run_dir / "match.json"
+        path.write_text(json.dumps(found, indent=2))
+        return {"wav": wav, "match": path}
+
+    def split(wav, backend):
+        vocals, accompaniment = separate(wav, manifest.run_dir / "separated", backend)
+        return {"vocals": vocals, "accompaniment": accompaniment}
+
+    def melody(vocals, bpm, backend):
+        return {"midi": extract_melody(vocals, str(manifest.run_dir / "melody.mid"), bpm, backend, gate=True)}
+
+    def chords(accompaniment):
+        path = manifest.run_dir / "chord_timeline.json"
+        extract_chords(accompaniment, str(path), gate=True)
+        return {"chords": path}
+
+    outputs = {}
+    # every file a run produces lives in its run directory, so runs for
+    # different songs can go at the same time
+    audio_dir = manifest.run_dir / "audio"
+    outputs.update(run_stage(manifest, "download", lambda url: {"mp3": url_to_mp3(url, audio_dir)},
+                             {"url": url}, resume=resume, progress=progress))
+    outputs.update(run_stage(manifest, "wav", lambda mp3: {"wav": mp3_to_wav(mp3, audio_dir)},
+                             {"mp3": outputs["mp3"]}, resume=resume, progress=progress))
+    reuse = None
+    if dedupe:
+        outputs.update(run_stage(manifest, "fingerprint", identify,
+                                 {"wav": outputs["wav"]}, resume=resume, progress=progress))
+        earlier = json.loads(Path(outputs["match"]).read_text())["run_dir"]
+        reuse = RunManifest(earlier) if earlier else None
+    outputs.update(run_stage(manifest, "separate", split,
+                             {"wav": outputs["wav"]}, {"backend": separation}, resume=resume, progress=progress,
+                             reuse=reuse))
+    outputs.update(run_stage(manifest, "melody", melody,
+                             {"vocals": outputs["vocals"]}, {"bpm": 120, "backend": melody_backend}, resume=resume,
+                             progress=progress, reuse=reuse))
+    outputs.update(run_stage(manifest, "chords", chords,
+                             {"accompaniment": outputs["accompaniment"]}, resume=resume, progress=progress,
+                             reuse=reuse))
+    if correct_pitch:
+        from stage_2.pitch_correction import correct_melody
+
+        def correct(midi, chords):
+            return {"midi": correct_melody(midi, chords, str(manifest.run_dir / "melody_corrected.mid"))}
+
+        outputs.update(run_stage(manifest, "correct", correct,
+                                 {"midi": outputs["midi"], "chords": outputs["chords"]},
+                                 resume=resume, progress=progress, reuse=reuse))
+    return outputs
+
+
+def user_input(resume=False, correct_pitch=False, separation="spleeter", melody_backend="basic_pitch",
+               dedupe=True):
     song_name = input("Enter the song name and movie or artist "
                       "(e.g., 'A Million Dreams from the Greatest Showman'): ")
     url = input("Enter the song's Url from YouTube: ")
 
-    original, vocals, accompaniment = audio_separation(url)
-
-    # dedalus_output = asyncio.run(dedalus_main())
+    # from stage_2.dedalus import dedalus_main
+    # import asyncio
+    # dedalus_output = asyncio.run(dedalus_main(song_name))
 
-    melody_main(original, vocals)
+    outputs = run_pipeline(url, resume=resume, correct_pitch=correct_pitch, separation=separation,
+                           melody_backend=melody_backend, dedupe=dedupe)
+    print(f"MIDI File: {outputs['midi']}")
+    print(f"JSON File: {outputs['chords']}")
 
     # print(dedalus_output)
 
-if __name__ == "__main__":
-    user_input()
 
+def parse_importtime(stderr):
+    """Parse `python -X importtime` output into (self_us, cumulative_us, module)."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # header line
+        rows.append((int(fields[0]), int(fields[1]), fields[2].strip()))
+    return rows
+
+
+def import_profile(modules=HEAVY_MODULES, top=15):
+    """Import modules in a fresh interpreter with -X importtime and report
+    the slowest imports. Modules that aren't installed are skipped."""
+    code = (f"for m in {list(modules)!r}:\n"
+            "    try:\n"
+            "        __import__(m)\n"
+            "    except Exception as e:\n"
+            "        print(f'{m}: {type(e).__name__}: {e}')\n")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True)
+    if result.stdout:
+        print(result.stdout, end="")
+    rows = parse_importtime(result.stderr)
+    total = sum(r[0] for r in rows)
+    print(f"{len(rows)} modules imported in {total / 1e6:.2f} s\n")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for self_us, cum_us, name in sorted(rows, key=lambda r: r[1], reverse=True)[:top]:
+        print(f"{cum_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="YouTube video to MuseScore")
+    parser.add_argument("--import-profile", nargs="?", const=15, type=int, metavar="N",
+                        help="report the N slowest imports of the pipeline's modules and exit")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip stages that already completed for this URL")
+    parser.add_argument("--correct-pitch", action="store_true",
+                        help="fix octave jumps and out-of-key notes against the chords")
+    parser.add_argument("--fast-separation", action="store_true",
+                        help="split vocals with STFT masks instead of Spleeter (rough, much cheaper)")
+    parser.add_argument("--melody-backend", choices=["basic_pitch", "yin", "pyin"], default="basic_pitch",
+                        help="yin/pyin track one f0 instead of running Basic Pitch (much cheaper)")
+    parser.add_argument("--no-dedupe", action="store_true",
+                        help="process the song even if another URL of it was processed before")
+    args = parser.parse_args()
+    if args.import_profile is not None:
+        import_profile(top=args.import_profile)
+    else:
+        try:
+            user_input(resume=args.resume, correct_pitch=args.correct_pitch,
+                       separation="fast" if args.fast_separation else "spleeter",
+                       melody_backend=args.melody_backend, dedupe=not args.no_dedupe)
+        except Exception as e:
+            from pipeline import StageFailed
+            if not isinstance(e, StageFailed):
+                raise
+            print(f"\n{e}\nRe-run with --resume to continue from this stage.")
+            sys.exit(1)
@@ -0,0 +1,142 @@
+"""Checkpointed pipeline runs.
+
+run_stage() runs one stage of a run and records it in a RunManifest:
+<run_dir>/manifests/<stage>.json, with the stage's inputs, parameters,
+output paths and hashes, timing and status. Manifests get a directory of
+their own so no stage output can overwrite one.
+
+A completed stage is skipped (resume=True) or taken from another run's
+manifest (reuse=) when it finished on the same inputs and parameters and
+its outputs are still on disk with the recorded hashes. main.py reuses
+the stages of a song that was already processed under another URL.
+"""
+import hashlib
+import json
+import os
+import time
+import traceback
+from pathlib import Path
+
+RUNS_DIR = Path(__file__).parent / "runs"
+
+
+class StageFailed(RuntimeError):
+    def __init__(self, stage, error):
+        super().__init__(f"stage '{stage}' failed: {error}")
+        self.stage = stage
+        self.error = error
+
+
+def file_hash(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def run_id(url):
+    """Runs are keyed by URL, so the same URL resumes the same run."""
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]
+
+
+def describe_inputs(inputs):
+    """Inputs as stored in a manifest: files get their hash, anything else
+    is kept as is."""
+    described = {}
+    for name, value in inputs.items():
+        if isinstance(value, (str, Path)) and os.path.isfile(value):
+            described[name] = {"path": str(value), "sha256": file_hash(value)}
+        else:
+            described[name] = {"value": value if isinstance(value, (int, float, bool, type(None))) else str(value)}
+    return described
+
+
+class RunManifest:
+    def __init__(self, run_dir):
+        self.run_dir = Path(run_dir)
+        self.manifest_dir = self.run_dir / "manifests"
+        self.manifest_dir.mkdir(parents=True, exist_ok=True)
+
+    def path(self, stage):
+        return self.manifest_dir / f"{stage}.json"
+
+    def load(self, stage):
+        p = self.path(stage)
+        if not p.exists():
+            return None
+        with open(p) as f:
+            return json.load(f)
+
+    def save(self, stage, record):
+        tmp = self.path(stage).with_suffix(".json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(record, f, indent=2)
+        os.replace(tmp, self.path(stage))
+
+    def completed(self, stage, inputs, params):
+        """Recorded outputs if stage already ran to completion on the same
+        inputs and params and its outputs are intact, else None."""
+        record = self.load(stage)
+        if not record or record.get("status") != "ok":
+            return None
+        if record.get("params") != params or record.get("inputs") != inputs:
+            return None
+        for out in record["outputs"].values():
+            if not os.path.isfile(out["path"]) or file_hash(out["path"]) != out["sha256"]:
+                return None
+        return {name: out["path"] for name, out in record["outputs"].items()}
+
+    def stages(self):
+        return sorted(p.stem for p in self.manifest_dir.glob("*.json"))
+
+
+def run_stage(manifest, stage, fn, inputs, params=None, resume=False, progress=None, reuse=None):
+    """Run fn(**inputs, **params) as a checkpointed stage.
+
+    fn returns {output name: path}. A failure is recorded in the stage's
+    manifest and re-raised as StageFailed. reuse is another run's
+    RunManifest whose outputs are taken if it completed this stage on the
+    same inputs and params. progress, if given, is called as
+    progress(stage, state) with state "running", "skipped", "reused",
+    "done" or "failed".
+    """
+    progress = progress or (lambda stage, state: None)
+    params = params or {}
+    described = describe_inputs(inputs)
+    if resume:
+        done = manifest.completed(stage, described, params)
+        if done is not None:
+            print(f"[{stage}] already complete, skipping")
+            progress(stage, "skipped")
+            return done
+    if reuse is not None:
+        done = reuse.completed(stage, described, params)
+        if done is not None:
+            record = dict(reuse.load(stage), started=time.time(), seconds=0.0, reused_from=str(reuse.run_dir))
+            manifest.save(stage, record)
+            print(f"[{stage}] reusing the outputs of {reuse.run_dir}")
+            progress(stage, "reused")
+            return done
+
+    progress(stage, "running")
+    record = {"stage": stage, "inputs": described, "params": params,
+              "outputs": {}, "started": time.time()}
+    start = time.perf_counter()
+    try:
+        outputs = fn(**inputs, **params)
+        record["outputs"] = {name: {"path": str(path), "sha256": file_hash(path)}
+                             for name, path in outputs.items()}
+    except Exception as e:
+        record.update(status="failed", error=f"{type(e).__name__}: {e}",
+                      traceback=traceback.format_exc(),
+                      seconds=time.perf_counter() - start)
+        manifest.save(stage, record)
+        progress(stage, "failed")
+        raise StageFailed(stage, e) from e
+
+    record.update(status="ok", seconds=time.perf_counter() - start)
+    manifest.save(stage, record)
+    print(f"[{stage}] done in {record['seconds']:.1f} s")
+    progress(stage, "done")
+    return {name: str(path) for name, path in outputs.items()}
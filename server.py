@@ -0,0 +1,400 @@
+"""Local HTTP transcription service.
+
+    POST /jobs                {"url": ...} or a raw audio body  -> 202 {"id", ...}
+                              ("separation": "fast" or ?separation=fast
+                              for the cheap preview split)
+    GET  /jobs/<id>           job status
+    GET  /jobs/<id>/midi      melody MIDI once the job is done
+    GET  /jobs/<id>/chords    chord timeline JSON once the job is done
+    GET  /metrics             queue, worker and job counters
+    GET  /healthz
+
+Jobs go into a bounded queue; when it is full POST /jobs answers 503
+with Retry-After instead of queueing more work than the workers can get
+through. Each worker is a separate process that loads Spleeter and Basic
+Pitch once (warm_models) and then runs jobs one after another. A job that
+runs past its timeout has its worker killed and replaced. A worker that
+can't be replaced is marked dead, stops taking jobs and shows up in
+/metrics.
+
+The service is plain asyncio, no web framework. The job function is a
+parameter, so tests can run it with a local stand-in for YouTube.
+
+Usage: python server.py [--port 8000] [--workers 2] [--queue 16] [--timeout 900]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import shutil
+import statistics
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from http import HTTPStatus
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+from stage_1.audio_separation import SEPARATION_BACKENDS
+
+JOBS_DIR = Path(__file__).parent / "jobs"
+
+# uploads bigger than this are refused with 413
+MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+
+# tries at replacing a worker process before the worker is given up on
+RESTART_ATTEMPTS = 3
+
+
+def warm_models():
+    """Load the separation and transcription models in a worker process."""
+    from stage_1.audio_separation import spleeter_separator
+    from stage_2.melody_extraction import basic_pitch_model
+
+    try:
+        spleeter_separator()
+    except ImportError:
+        print("spleeter can't be imported here, jobs will use the spleeter CLI")
+    basic_pitch_model()
+
+
+def transcribe_job(job_dir, url=None, upload=None, separation="spleeter", dedupe=True):
+    """Stage 1 and 2 for one job; every file stays in job_dir.
+
+    With dedupe, a song an earlier job already transcribed with the same
+    separation backend (recognized by fingerprint, see
+    stage_1/fingerprint.py) gets that job's outputs copied instead.
+    """
+    from stage_1.audio_separation import mp3_to_wav, separate, separate_in_process, url_to_mp3
+    from stage_1.fingerprint import SongIndex, fingerprint_file
+    from stage_2.melody_extraction import extract_chords, extract_melody
+
+    job_dir = Path(job_dir)
+    audio_dir = job_dir / "audio"
+    audio = url_to_mp3(url, audio_dir) if url else upload
+    # ffmpeg reads whatever was uploaded, not only mp3
+    wav = mp3_to_wav(audio, audio_dir)
+    midi, chords = job_dir / "melody.mid", job_dir / "chords.json"
+    if dedupe:
+        # one index per jobs directory, so --clean drops it with the jobs
+        index = SongIndex(job_dir.parent / "fingerprints.sqlite")
+        hashes, frames = fingerprint_file(wav)
+        for match in index.matches(hashes, frames):
+            info = match.info
+            if info.get("separation") == separation and all(Path(info[k]).is_file() for k in ("midi", "chords")):
+                print(f"Same song as an earlier job ({match.score} matching hashes), reusing its outputs")
+                shutil.copyfile(info["midi"], midi)
+                shutil.copyfile(info["chords"], chords)
+                return {"midi": str(midi), "chords": str(chords)}
+    if separation == "spleeter":
+        vocals, accompaniment = separate_in_process(wav, job_dir / "separated")
+    else:
+        vocals, accompaniment = separate(wav, job_dir / "separated", separation)
+    extract_melody(str(vocals), str(midi))
+    extract_chords(str(accompaniment), str(chords))
+    if dedupe:
+        index.add(hashes, frames, {"separation": separation, "midi": str(midi.resolve()),
+                                   "chords": str(chords.resolve())})
+    return {"midi": str(midi), "chords": str(chords)}
+
+
+def _worker_main(conn, job_fn, warm):
+    if warm is not None:
+        warm()
+    conn.send("ready")
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            return
+        try:
+            conn.send(("ok", job_fn(**msg)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class Worker:
+    """One warm worker process and the pipe to it."""
+
+    def __init__(self, ctx, job_fn, warm):
+        self.ctx, self.job_fn, self.warm = ctx, job_fn, warm
+        self.process = None
+        self.conn = None
+        self.restarts = 0
+        self.dead = False
+        self.error = None   # why the last restart failed
+
+    def start(self):
+        self.conn, child = self.ctx.Pipe()
+        self.process = self.ctx.Process(target=_worker_main, args=(child, self.job_fn, self.warm),
+                                        daemon=True)
+        self.process.start()
+        child.close()  # so recv() sees EOF if the worker dies
+        if self.conn.recv() != "ready":
+            raise RuntimeError("worker failed to start")
+
+    def restart(self, attempts=RESTART_ATTEMPTS):
+        """Replace a dead process; after attempts failed starts in a row
+        the worker is marked dead. Never raises."""
+        for _ in range(attempts):
+            self.restarts += 1
+            try:
+                self.start()
+                return True
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+                if self.process.is_alive():
+                    self.kill()
+                self.conn.close()
+        self.dead = True
+        return False
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.kill()
+        self.conn.close()
+
+    async def run(self, kwargs, timeout):
+        """Run one job; a timeout kills the process and starts a new one."""
+        reply = None
+        try:
+            self.conn.send(kwargs)
+            reply = asyncio.ensure_future(asyncio.to_thread(self.conn.recv))
+            return await asyncio.wait_for(asyncio.shield(reply), timeout)
+        except asyncio.TimeoutError:
+            self.kill()
+            raise
+        except EOFError:
+            # the worker died on its own (out of memory, segfault...)
+            self.process.join()
+            return ("error", "worker process died")
+        finally:
+            if not self.process.is_alive():
+                # the pending recv() ends with EOF once the process is
+                # gone; only then is it safe to close the pipe
+                if reply is not None:
+                    await asyncio.gather(reply, return_exceptions=True)
+                self.conn.close()
+                await asyncio.to_thread(self.restart)
+
+
+@dataclass
+class Job:
+    id: str
+    source: dict
+    status: str = "queued"      # queued, running, done, failed, timeout
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    error: Optional[str] = None
+    outputs: dict = field(default_factory=dict)
+
+
+class TranscriptionService:
+    def __init__(self, job_fn=transcribe_job, warm=warm_models, workers=2, queue_size=16,
+                 timeout=900.0, jobs_dir=JOBS_DIR, max_upload=MAX_UPLOAD_BYTES):
+        self.job_fn, self.warm = job_fn, warm
+        self.nworkers = workers
+        self.timeout = timeout
+        self.jobs_dir = Path(jobs_dir)
+        self.max_upload = max_upload
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.jobs = {}
+        self.workers = []
+        self.rejected = 0
+        self.started = time.time()
+        self._tasks = []
+        self._server = None
+
+    async def start(self, host="127.0.0.1", port=8000):
+        # spawn, not fork: TensorFlow doesn't survive being forked
+        ctx = multiprocessing.get_context("spawn")
+        self.workers = [Worker(ctx, self.job_fn, self.warm) for _ in range(self.nworkers)]
+        await asyncio.gather(*(asyncio.to_thread(w.start) for w in self.workers))
+        self._tasks = [asyncio.create_task(self._work(w)) for w in self.workers]
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await asyncio.gather(*(asyncio.to_thread(w.stop) for w in self.workers))
+
+    # ------------------------- jobs -------------------------
+    def submit(self, source, upload=None):
+        """Queue a job; returns None when the queue is full."""
+        if self.queue.full():
+            self.rejected += 1
+            return None
+        job = Job(uuid.uuid4().hex[:12], source)
+        job_dir = self.jobs_dir / job.id
+        job_dir.mkdir(parents=True)
+        kwargs = {"job_dir": str(job_dir), "url": source.get("url")}
+        if "separation" in source:
+            kwargs["separation"] = source["separation"]
+        if upload is not None:
+            path = job_dir / source["filename"]
+            path.write_bytes(upload)
+            kwargs["upload"] = str(path)
+        self.jobs[job.id] = job
+        self.queue.put_nowait((job, kwargs))
+        return job
+
+    async def _work(self, worker):
+        while not worker.dead:
+            job, kwargs = await self.queue.get()
+            job.status, job.started = "running", time.time()
+            try:
+                status, result = await worker.run(kwargs, self.timeout)
+            except asyncio.TimeoutError:
+                status, result = "timeout", f"timed out after {self.timeout:g} s"
+            except Exception as e:
+                # e.g. the pipe to a worker that died between jobs
+                status, result = "error", f"{type(e).__name__}: {e}"
+            job.finished = time.time()
+            if status == "ok":
+                job.status, job.outputs = "done", result
+            else:
+                job.status = "failed" if status == "error" else status
+                job.error = result
+            self.queue.task_done()
+
+    def metrics(self):
+        counts = dict.fromkeys(["queued", "running", "done", "failed", "timeout"], 0)
+        for job in self.jobs.values():
+            counts[job.status] += 1
+        seconds = [j.finished - j.started for j in self.jobs.values() if j.status == "done"]
+        waits = [j.started - j.created for j in self.jobs.values() if j.started]
+        return {
+            "jobs": counts,
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "rejected": self.rejected,
+            "workers": len(self.workers),
+            "workers_alive": sum(w.process.is_alive() for w in self.workers),
+            "workers_dead": sum(w.dead for w in self.workers),
+            "worker_restarts": sum(w.restarts for w in self.workers),
+            "job_seconds_median": statistics.median(seconds) if seconds else None,
+            "job_seconds_max": max(seconds) if seconds else None,
+            "queue_wait_seconds_median": statistics.median(waits) if waits else None,
+            "uptime_seconds": time.time() - self.started,
+        }
+
+    # ------------------------- HTTP -------------------------
+    async def _handle(self, reader, writer):
+        try:
+            status, headers, body = await self._respond(reader)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            status, headers, body = _json(HTTPStatus.BAD_REQUEST, {"error": "bad request"})
+        head = [f"HTTP/1.1 {status.value} {status.phrase}",
+                f"Content-Length: {len(body)}", "Connection: close"]
+        head += [f"{k}: {v}" for k, v in headers.items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _respond(self, reader):
+        request = await reader.readuntil(b"\r\n\r\n")
+        lines = request.decode("latin-1").split("\r\n")
+        method, target, _ = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+        url = urlsplit(target)
+        parts = [p for p in url.path.split("/") if p]
+
+        if method == "POST" and parts == ["jobs"]:
+            length = int(headers.get("content-length", 0))
+            if length > self.max_upload:
+                return _json(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "upload too large"})
+            body = await reader.readexactly(length)
+            return self._post_job(headers, parse_qs(url.query), body)
+        if method != "GET":
+            return _json(HTTPStatus.METHOD_NOT_ALLOWED, {"error": f"{method} not allowed"})
+        if parts == ["metrics"]:
+            return _json(HTTPStatus.OK, self.metrics())
+        if parts == ["healthz"]:
+            return _json(HTTPStatus.OK, {"ok": True})
+        if len(parts) in (2, 3) and parts[0] == "jobs" and parts[1] in self.jobs:
+            job = self.jobs[parts[1]]
+            if len(parts) == 2:
+                return _json(HTTPStatus.OK, asdict(job))
+            if parts[2] in ("midi", "chords"):
+                if job.status != "done":
+                    return _json(HTTPStatus.CONFLICT, {"error": f"job is {job.status}"})
+                ctype = "audio/midi" if parts[2] == "midi" else "application/json"
+                return HTTPStatus.OK, {"Content-Type": ctype}, Path(job.outputs[parts[2]]).read_bytes()
+        return _json(HTTPStatus.NOT_FOUND, {"error": "not found"})
+
+    def _post_job(self, headers, query, body):
+        if headers.get("content-type", "").startswith("application/json"):
+            source = json.loads(body or b"{}")
+            if not isinstance(source, dict) or not isinstance(source.get("url"), str):
+                return _json(HTTPStatus.BAD_REQUEST, {"error": 'expected {"url": ...}'})
+            job_source, upload = {"url": source["url"]}, None
+            separation = source.get("separation")
+        else:
+            if not body:
+                return _json(HTTPStatus.BAD_REQUEST, {"error": "empty upload"})
+            # only the base name, so an upload can't write outside its job dir
+            name = Path(query.get("filename", ["upload.wav"])[0]).name or "upload.wav"
+            job_source, upload = {"filename": name}, body
+            separation = query.get("separation", [None])[0]
+        if separation is not None:
+            if separation not in SEPARATION_BACKENDS:
+                return _json(HTTPStatus.BAD_REQUEST,
+                             {"error": f"separation must be one of {list(SEPARATION_BACKENDS)}"})
+            job_source["separation"] = separation
+        job = self.submit(job_source, upload=upload)
+        if job is None:
+            return _json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": "queue full"}, {"Retry-After": "30"})
+        return _json(HTTPStatus.ACCEPTED, asdict(job), {"Location": f"/jobs/{job.id}"})
+
+
+def _json(status, payload, headers=None):
+    return status, {"Content-Type": "application/json", **(headers or {})}, json.dumps(payload).encode()
+
+
+async def serve(host, port, **kwargs):
+    service = TranscriptionService(**kwargs)
+    port = await service.start(host, port)
+    print(f"Serving on http://{host}:{port} with {service.nworkers} warm workers")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await service.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local transcription service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--queue", type=int, default=16, help="jobs that may wait before POST /jobs gets 503")
+    parser.add_argument("--timeout", type=float, default=900, help="seconds before a job is killed")
+    parser.add_argument("--jobs-dir", default=JOBS_DIR)
+    parser.add_argument("--clean", action="store_true", help="delete old job directories first")
+    args = parser.parse_args()
+    if args.clean:
+        shutil.rmtree(args.jobs_dir, ignore_errors=True)
+    try:
+        asyncio.run(serve(args.host, args.port, workers=args.workers, queue_size=args.queue,
+                          timeout=args.timeout, jobs_dir=args.jobs_dir))
+    except KeyboardInterrupt:
+        pass
@@ -1,16 +1,22 @@
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import yt_dlp
+import hashlib
+import os
+import shutil
 import subprocess
+import threading
+import uuid
 
 BASE_DIR = Path(__file__).parent
 
 # need to have installed yt-dlp (found in requirements.txt)
-def url_to_mp3(url):
+def url_to_mp3(url, out_dir=None, concurrent_fragments=1):
     # print("Url:", end = " ")
     # url = input()
+    import yt_dlp  # slow to import, only needed once a download starts
 
-    out_dir = BASE_DIR / "mp3-files"
-    out_dir.mkdir(exist_ok=True)
+    out_dir = Path(out_dir) if out_dir else BASE_DIR / "mp3-files"
+    out_dir.mkdir(parents=True, exist_ok=True)
     out_template = str(out_dir / "%(title)s.%(ext)s")
 
     ydl_opts = {
@@ -18,6 +24,7 @@ def url_to_mp3(url):
         'no_warnings': True,
         'format': 'bestaudio/best',
         'outtmpl': out_template,
+        'concurrent_fragment_downloads': concurrent_fragments,
         'postprocessors': [{
             'key': 'FFmpegExtractAudio',
             'preferredcodec': 'mp3',
@@ -32,18 +39,19 @@ def url_to_mp3(url):
     print("Downloaded:", filename)
     return filename
 
-def mp3_to_wav(mp3_file):
+def mp3_to_wav(mp3_file, out_dir=None):
 
     mp3_file = Path(mp3_file)
 
-    out_dir = BASE_DIR / "wav-files"
-    out_dir.mkdir(exist_ok=True)
+    out_dir = Path(out_dir) if out_dir else BASE_DIR / "wav-files"
+    out_dir.mkdir(parents=True, exist_ok=True)
 
     wav_file = out_dir / (mp3_file.stem + ".wav")
 
     cmd = [
         "ffmpeg",
         "-y",
+        "-loglevel", "error",
         "-i", str(mp3_file),
         str(wav_file)
     ]
@@ -55,12 +63,12 @@ def mp3_to_wav(mp3_file):
 
 
 # spleeter requires python 3.10.xx or less
-def separate_with_spleeter(wav_file):
+def separate_with_spleeter(wav_file, out_dir=None):
 
     wav_file = Path(wav_file)
 
-    out_dir = BASE_DIR / "separated"
-    out_dir.mkdir(exist_ok=True)
+    out_dir = Path(out_dir) if out_dir else BASE_DIR / "separated"
+    out_dir.mkdir(parents=True, exist_ok=True)
 
     cmd = [
         "spleeter",
@@ -73,6 +81,8 @@ def separate_with_spleeter(wav_file):
     result = subprocess.run(cmd, capture_output=True, text=True)
     print(result.stdout)
     print(result.stderr)
+    if result.returncode != 0:
+        raise RuntimeError(f"spleeter exited with {result.returncode}: {result.stderr.strip()[-500:]}")
 
     song_folder = out_dir / wav_file.stem
     vocals = song_folder / "vocals.wav"
@@ -84,6 +94,74 @@ def separate_with_spleeter(wav_file):
     return vocals, accompaniment
 
 
+SEPARATION_BACKENDS = ("spleeter", "fast")
+
+def separate(wav_file, out_dir=None, backend="spleeter", name=None):
+    """Split wav_file into vocals and accompaniment.
+
+    backend "spleeter" runs the Spleeter CLI; "fast" uses STFT masks in
+    NumPy/librosa (fast_separation.py), rougher but with no TensorFlow and
+    far cheaper, for previews. Both write <out_dir>/<name>/vocals.wav and
+    accompaniment.wav, name defaulting to the wav's name.
+
+    The backends name their folder after the wav, which is the video's
+    title, so each call separates into a work directory of its own and
+    moves the stems into place: concurrent jobs only share a folder if
+    they pass the same name (separate_song passes the URL's hash).
+    """
+    if backend == "spleeter":
+        split = separate_with_spleeter
+    elif backend == "fast":
+        from stage_1.fast_separation import separate_fast as split
+    else:
+        raise ValueError(f"unknown separation backend {backend!r}, expected one of {SEPARATION_BACKENDS}")
+
+    out_dir = Path(out_dir) if out_dir else BASE_DIR / "separated"
+    dest = out_dir / (name or Path(wav_file).stem)
+    work = out_dir / f".{dest.name}-{uuid.uuid4().hex[:8]}"
+    try:
+        vocals, accompaniment = split(wav_file, work)
+        shutil.rmtree(dest, ignore_errors=True)
+        os.replace(Path(vocals).parent, dest)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return dest / Path(vocals).name, dest / Path(accompaniment).name
+
+
+_separator = None
+_separator_lock = threading.Lock()
+
+def spleeter_separator():
+    """Spleeter's 2-stem separator, loaded once per process.
+
+    Raises ImportError where spleeter can't be imported into this
+    interpreter (it needs python 3.10 or less); use the CLI then.
+    """
+    global _separator
+    with _separator_lock:
+        if _separator is None:
+            from spleeter.separator import Separator
+            _separator = Separator("spleeter:2stems")
+    return _separator
+
+
+def separate_in_process(wav_file, out_dir=None):
+    """Like separate_with_spleeter but with a separator that stays loaded,
+    for long-running workers. Falls back to the CLI without spleeter."""
+    try:
+        separator = spleeter_separator()
+    except ImportError:
+        return separate_with_spleeter(wav_file, out_dir)
+
+    wav_file = Path(wav_file)
+    out_dir = Path(out_dir) if out_dir else BASE_DIR / "separated"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    # same layout as the CLI: <out_dir>/<song>/<stem>.wav
+    separator.separate_to_file(str(wav_file), str(out_dir))
+    song_folder = out_dir / wav_file.stem
+    return song_folder / "vocals.wav", song_folder / "accompaniment.wav"
+
+
 def audio_separation(url):
     mp3_file = url_to_mp3(url)
     wav_file = mp3_to_wav(mp3_file)
@@ -97,6 +175,76 @@ def audio_separation(url):
     return wav_file, vocals, accompaniment
 
 
+def separate_song(url, scratch, stems_dir=None, concurrent_fragments=4, backend="spleeter", index=None):
+    """Download and separate one song, keeping intermediates in scratch.
+
+    The mp3 is deleted once the wav exists and the wav once the stems
+    exist; only the stems are kept, in stems_dir/<hash of url> (the
+    video title would clash between URLs of the same title). With index (a
+    fingerprint.SongIndex), a song whose stems already exist from another
+    URL with the same backend isn't separated again.
+    """
+    name = hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]  # as pipeline.run_id
+    with scratch.job(name) as job_dir:
+        mp3_file = url_to_mp3(url, job_dir, concurrent_fragments)
+        scratch.account(job_dir)
+        wav_file = mp3_to_wav(mp3_file, job_dir)
+        scratch.consumed(job_dir, mp3_file)
+        if index is not None:
+            from stage_1.fingerprint import fingerprint_file
+
+            hashes, frames = fingerprint_file(wav_file)
+            for match in index.matches(hashes, frames):
+                stems = match.info.get("vocals"), match.info.get("accompaniment")
+                if match.info.get("backend") == backend and all(p and Path(p).is_file() for p in stems):
+                    print(f"Already separated under another URL: {url}")
+                    scratch.consumed(job_dir, wav_file)
+                    return Path(stems[0]), Path(stems[1])
+        vocals, accompaniment = separate(wav_file, stems_dir, backend, name=name)
+        scratch.consumed(job_dir, wav_file)
+        if index is not None:
+            index.add(hashes, frames, {"backend": backend, "vocals": str(Path(vocals).resolve()),
+                                       "accompaniment": str(Path(accompaniment).resolve())})
+    return vocals, accompaniment
+
+
+def separate_songs(urls, workers=4, scratch_dir=None, budget_bytes=1 << 30,
+                   stems_dir=None, concurrent_fragments=4, backend="spleeter", dedupe=True):
+    """Run stage 1 for many URLs concurrently with a bounded scratch area.
+
+    Returns {url: (vocals, accompaniment)} for the songs that worked and
+    {url: exception} for the ones that didn't. backend is passed to
+    separate(). With dedupe, songs already separated under another URL
+    are recognized by fingerprint and their stems returned.
+    """
+    from stage_1.fingerprint import SongIndex
+    from stage_1.scratch import ScratchSpace
+
+    scratch = ScratchSpace(scratch_dir or BASE_DIR / "scratch", budget_bytes)
+    index = SongIndex() if dedupe else None
+    done, failed = {}, {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {url: pool.submit(separate_song, url, scratch, stems_dir,
+                                     concurrent_fragments, backend, index)
+                   for url in urls}
+        for url, future in futures.items():
+            try:
+                done[url] = future.result()
+            except Exception as e:
+                print(f"Failed: {url}: {e}")
+                failed[url] = e
+    print(f"Separated {len(done)} songs ({len(failed)} failed), "
+          f"peak scratch reservation {scratch.peak / (1 << 20):.0f} MB")
+    return done, failed
+
+
 if __name__ == "__main__":
-    url = input("Enter the song's Url from YouTube: ")
-    audio_separation(url)
\ No newline at end of file
+    import sys
+
+    if len(sys.argv) > 1:
+        # python -m stage_1.audio_separation [--fast] URL [URL ...]
+        urls = [a for a in sys.argv[1:] if a != "--fast"]
+        separate_songs(urls, backend="fast" if "--fast" in sys.argv else "spleeter")
+    else:
+        url = input("Enter the song's Url from YouTube: ")
+        audio_separation(url)
\ No newline at end of file
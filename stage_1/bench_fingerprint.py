@@ -0,0 +1,75 @@
+"""Robustness and cost of the song fingerprints (stage_1/fingerprint.py).
+
+A synthetic song (bench_separation.synthetic_mix) is indexed next to
+`library` other songs, then looked up as the copies a second URL might
+bring: quieter with noise, shifted, trimmed, filtered, and a different
+song altogether, which must not match. For each, the score of the true
+song (hashes on its best offset), the best score of any other song, the
+offset found and the lookup time.
+
+Usage: python -m stage_1.bench_fingerprint [seconds] [library]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from stage_1.bench_separation import synthetic_mix
+from stage_1.fingerprint import FP_SR, SongIndex, fingerprint
+
+
+def variants(y, rng):
+    """(name, audio, true offset in seconds) of copies of mono y."""
+    import scipy.signal
+
+    b, a = scipy.signal.butter(2, [200, 3000], btype="band", fs=FP_SR)
+    shift = int(3.3 * FP_SR)
+    yield "same", y, 0.0
+    yield "gain + noise", 0.5 * y + 0.02 * rng.standard_normal(len(y)).astype(np.float32), 0.0
+    yield "late start", np.concatenate([np.zeros(shift, np.float32), y]), -3.3
+    yield "trimmed", y[len(y) // 3:], len(y) // 3 / FP_SR
+    yield "band-pass", scipy.signal.lfilter(b, a, y).astype(np.float32), 0.0
+
+
+def mono(seconds, seed):
+    import librosa
+
+    mix, _, _ = synthetic_mix(seconds, seed=seed)
+    return librosa.resample(mix.mean(axis=0), orig_sr=44100, target_sr=FP_SR)
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 60.0
+    library = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rng = np.random.default_rng(0)
+    y = mono(seconds, seed=0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = SongIndex(Path(tmp) / "fingerprints.sqlite")
+        start = time.perf_counter()
+        hashes, frames = fingerprint(y)
+        took = time.perf_counter() - start
+        song = index.add(hashes, frames, {"name": "song"})
+        print(f"{seconds:.0f} s song: {len(hashes)} hashes in {took:.2f} s")
+        for seed in range(1, library + 1):
+            index.add(*fingerprint(mono(seconds, seed)), {"name": f"other {seed}"})
+        print(f"index of {len(index)} songs\n")
+
+        print(f"{'query':>13} {'score':>6} {'others':>7} {'offset':>7} {'true':>6} {'lookup s':>9}")
+        queries = list(variants(y, rng)) + [("other song", mono(seconds, seed=library + 1), None)]
+        for name, audio, offset in queries:
+            hashes, frames = fingerprint(audio)
+            start = time.perf_counter()
+            found = index.matches(hashes, frames, min_matches=0, min_fraction=0)
+            took = time.perf_counter() - start
+            mine = [m for m in found if m.song == song]
+            others = max((m.score for m in found if m.song != song), default=0)
+            score, at = (mine[0].score, f"{mine[0].offset:7.2f}") if mine else (0, f"{'-':>7}")
+            true = f"{offset:6.2f}" if offset is not None else f"{'-':>6}"
+            print(f"{name:>13} {score:6d} {others:7d} {at} {true} {took:9.3f}")
+
+
+if __name__ == "__main__":
+    main()
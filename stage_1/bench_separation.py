@@ -0,0 +1,93 @@
+"""Speed and SDR of the separation backends on a synthetic stereo mix.
+
+The mix has a sung-like lead (harmonics, vibrato, centred), a chord pad
+panned left, a bass line and kick in the centre, and hi-hats panned
+right, so every cue the fast backend relies on (and every way it can go
+wrong) is in there. SDR is 10 log10(|s|^2 / |s - s_hat|^2) per stem
+against the true stems; "mix" is the do-nothing baseline of handing back
+the mix as both stems. Spleeter is run too where it can be imported.
+
+Usage: python -m stage_1.bench_separation [seconds]
+"""
+import sys
+import time
+
+import numpy as np
+
+from stage_1.fast_separation import separate_array
+
+SR = 44100
+
+
+def tone(freqs, sr, harmonics=5, vibrato=0.0):
+    """Harmonic tone following the per-sample frequency track freqs."""
+    tt = np.arange(len(freqs)) / sr
+    f = freqs * (1 + vibrato * np.sin(2 * np.pi * 5.5 * tt))
+    phase = 2 * np.pi * np.cumsum(f) / sr
+    return sum(np.sin(k * phase) / k for k in range(1, harmonics + 1))
+
+
+def synthetic_mix(seconds=30.0, sr=SR, seed=0):
+    """(mix, vocals, accompaniment), each (2, samples)."""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sr)
+    beat = sr // 2  # 120 bpm
+
+    # lead: a new note every beat, short gap between notes
+    notes = rng.choice([60, 62, 64, 65, 67, 69, 71, 72], size=n // beat + 1)
+    freqs = np.repeat(440.0 * 2 ** ((notes - 69) / 12.0), beat)[:n]
+    env = np.tile(np.minimum(1, np.arange(beat) / 400) * (np.arange(beat) < 0.9 * beat), n // beat + 1)[:n]
+    lead = 0.25 * tone(freqs, sr, vibrato=0.006) * env
+
+    # pad: one triad per bar, 80% left
+    roots = np.repeat(rng.choice([48, 53, 55, 57], size=n // (4 * beat) + 1), 4 * beat)[:n]
+    pad = sum(tone(440.0 * 2 ** ((roots + i - 69) / 12.0), sr, harmonics=3) for i in (0, 4, 7)) * 0.06
+    bass = 0.2 * tone(440.0 * 2 ** ((roots - 12 - 69) / 12.0), sr, harmonics=2)
+
+    t_beat = np.arange(beat) / sr
+    kick = np.tile(np.sin(2 * np.pi * 55 * t_beat) * np.exp(-t_beat * 25), n // beat + 1)[:n] * 0.4
+    hats = rng.standard_normal(n) * np.tile(np.exp(-np.arange(beat // 2) / sr * 60), n // (beat // 2) + 1)[:n] * 0.05
+
+    vocals = np.stack([lead, lead])
+    accompaniment = np.stack([0.9 * pad + bass + kick + 0.2 * hats,
+                              0.2 * pad + bass + kick + 0.9 * hats])
+    return (vocals + accompaniment).astype(np.float32), vocals, accompaniment
+
+
+def sdr(reference, estimate):
+    noise = np.sum((reference - estimate) ** 2)
+    return 10 * np.log10(np.sum(reference ** 2) / max(noise, 1e-12))
+
+
+def spleeter_stems(mix, sr):
+    from stage_1.audio_separation import spleeter_separator
+
+    stems = spleeter_separator().separate(mix.T)
+    return stems["vocals"].T[:, :mix.shape[1]], stems["accompaniment"].T[:, :mix.shape[1]]
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 30.0
+    mix, vocals, accompaniment = synthetic_mix(seconds)
+
+    results = [("mix", 0.0, mix, mix)]
+    separate_array(mix[:, :SR], SR)  # librosa's lazy imports, outside the timing
+    start = time.perf_counter()
+    est_v, est_a = separate_array(mix, SR)
+    results.append(("fast", time.perf_counter() - start, est_v, est_a))
+    try:
+        start = time.perf_counter()
+        est_v, est_a = spleeter_stems(mix, SR)
+        results.append(("spleeter", time.perf_counter() - start, est_v, est_a))
+    except ImportError:
+        print("spleeter not importable here, skipped")
+
+    print(f"{seconds:.0f} s synthetic stereo mix\n")
+    print(f"{'backend':>9} {'seconds':>8} {'x realtime':>11} {'SDR vocals':>11} {'SDR accomp':>11}")
+    for name, took, est_v, est_a in results:
+        speed = f"{seconds / took:11.1f}" if took else f"{'-':>11}"
+        print(f"{name:>9} {took:8.2f} {speed} {sdr(vocals, est_v):9.1f}dB {sdr(accompaniment, est_a):9.1f}dB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Fast vocals/accompaniment split without Spleeter or TensorFlow.
+
+Rough stems for previews, from three soft masks on the STFT:
+
+    centre  lead vocals are mixed to the middle, so a bin counts as vocal
+            as far as its left and right channels agree in level and phase
+    HPSS    librosa's harmonic/percussive split keeps drums (also centred)
+            out of the vocals
+    band    the voice lives roughly between 120 Hz and 7 kHz, which keeps
+            the centred bass and kick out too
+
+The vocal stem is the product of the masks applied to each channel, and
+the accompaniment is the mix minus the vocals, so the two stems always add
+back up to the input. A mono file has no stereo cue, so only HPSS and the
+band mask do anything there.
+
+The song is processed in blocks with a second of context on each side,
+so memory stays bounded however long the file is. Output has the same
+layout as separate_with_spleeter: <out_dir>/<song>/vocals.wav and
+accompaniment.wav.
+
+See bench_separation.py for speed and SDR on synthetic mixes.
+"""
+from pathlib import Path
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+BASE_DIR = Path(__file__).parent
+
+N_FFT = 2048
+HOP = 1024
+BLOCK_SECONDS = 20.0
+PAD_SECONDS = 1.0      # context each side of a block; more than the HPSS kernel
+PAN_POWER = 4.0        # how sharply the centre mask falls off off-centre
+HPSS_KERNEL = 17       # frames and bins; ~0.4 s and ~370 Hz
+HPSS_MARGIN = 1.0
+VOCAL_BAND = (120.0, 7000.0)
+BAND_ROLLOFF = 1.0     # octaves over which the band mask fades out
+
+
+def band_mask(sr, n_fft=N_FFT, band=VOCAL_BAND):
+    """(n_bins,) weight per STFT bin: 1 inside band, fading to 0 over
+    BAND_ROLLOFF octaves outside it."""
+    freqs = np.maximum(librosa.fft_frequencies(sr=sr, n_fft=n_fft), 1.0)
+    below = np.log2(band[0] / freqs)
+    above = np.log2(freqs / band[1])
+    outside = np.maximum(np.maximum(below, above), 0.0)
+    return np.clip(1.0 - outside / BAND_ROLLOFF, 0.0, 1.0).astype(np.float32)
+
+
+def vocal_mask(spec, band):
+    """Soft vocal mask for a (channels, bins, frames) STFT."""
+    if spec.shape[0] >= 2:
+        left, right = spec[0], spec[1]
+        power = np.abs(left) ** 2 + np.abs(right) ** 2
+        # 1 where the channels are identical, 0 when one side is silent or
+        # they are out of phase
+        similarity = 2.0 * np.maximum(np.real(left * np.conj(right)), 0.0) / np.maximum(power, 1e-12)
+        centre = similarity ** PAN_POWER
+        mid = 0.5 * (left + right)
+    else:
+        centre = 1.0
+        mid = spec[0]
+    # the median filters are most of the cost, so skip bins the band mask
+    # zeroes anyway
+    bins = np.flatnonzero(band)
+    lo, hi = bins[0], bins[-1] + 1
+    mask = np.zeros(mid.shape, dtype=np.float32)
+    harmonic, _ = librosa.decompose.hpss(np.abs(mid[lo:hi]), kernel_size=HPSS_KERNEL,
+                                         margin=HPSS_MARGIN, mask=True)
+    centre = centre[lo:hi] if np.ndim(centre) else centre
+    mask[lo:hi] = centre * harmonic * band[lo:hi, None]
+    return mask
+
+
+def separate_array(audio, sr, block_seconds=BLOCK_SECONDS):
+    """(vocals, accompaniment) for a (channels, samples) float array."""
+    audio = np.atleast_2d(np.asarray(audio, dtype=np.float32))
+    n = audio.shape[1]
+    band = band_mask(sr)
+    vocals = np.zeros_like(audio)
+    block = max(int(block_seconds * sr), HOP)
+    pad = int(PAD_SECONDS * sr)
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        lo, hi = max(0, start - pad), min(n, stop + pad)
+        segment = audio[:, lo:hi]
+        spec = librosa.stft(segment, n_fft=N_FFT, hop_length=HOP)
+        part = librosa.istft(spec * vocal_mask(spec, band)[None], hop_length=HOP, length=hi - lo)
+        vocals[:, start:stop] = part[:, start - lo:stop - lo]
+    return vocals, audio - vocals
+
+
+def separate_fast(wav_file, out_dir=None):
+    """Drop-in for separate_with_spleeter: writes and returns the paths of
+    vocals.wav and accompaniment.wav."""
+    wav_file = Path(wav_file)
+    out_dir = Path(out_dir) if out_dir else BASE_DIR / "separated"
+    song_folder = out_dir / wav_file.stem
+    song_folder.mkdir(parents=True, exist_ok=True)
+
+    audio, sr = sf.read(str(wav_file), dtype="float32", always_2d=True)
+    vocals, accompaniment = separate_array(audio.T, sr)
+
+    vocals_path = song_folder / "vocals.wav"
+    accompaniment_path = song_folder / "accompaniment.wav"
+    sf.write(str(vocals_path), vocals.T, sr)
+    sf.write(str(accompaniment_path), accompaniment.T, sr)
+    print("Vocals:", vocals_path)
+    print("Accompaniment:", accompaniment_path)
+    return vocals_path, accompaniment_path
@@ -0,0 +1,179 @@
+"""Recognize a song we have already processed, from its audio.
+
+The same song arrives under many URLs (re-uploads, lyric videos, official
+audio), each encoded differently, so file hashes never match. Landmark
+fingerprints do:
+
+  1. the song is mixed to mono and resampled to FP_SR;
+  2. peaks of its spectrogram: bins that are the maximum of their
+     PEAK_BINS x PEAK_FRAMES neighbourhood and within PEAK_RANGE_DB of the
+     loudest bin;
+  3. every peak is paired with the next FAN_OUT peaks less than MAX_DT
+     frames after it and less than MAX_DF bins away, and each pair packed
+     into one integer (frequency, frequency step, time step). Encoding
+     changes level, noise and EQ, but rarely where the peaks are.
+
+SongIndex keeps the hashes of every song seen in an sqlite file. A query
+fetches all rows sharing a hash with it; for the song it has already
+heard, most of those agree on a single time offset between the two
+recordings, while chance collisions with other songs scatter. The best
+offset's count is the score.
+
+Each song in the index carries an `info` dict from whoever added it (a
+run directory, the paths of its stems), so callers decide what can be
+reused. bench_fingerprint.py checks robustness and the cost per song.
+"""
+import json
+import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).parent
+
+FP_SR = 11025
+N_FFT = 1024
+HOP = 256               # 23 ms
+PEAK_BINS = 31          # neighbourhood a peak must dominate, ~330 Hz
+PEAK_FRAMES = 31        # ... and ~0.7 s
+PEAK_RANGE_DB = 60.0
+FAN_OUT = 5
+MAX_DT = 63             # frames; 6 bits
+MAX_DF = 63             # bins either way; 7 bits
+MIN_MATCHES = 20        # hashes agreeing on one offset
+MIN_FRACTION = 0.02     # ... and at least this fraction of the query's
+
+
+def load_mono(path):
+    """The audio at path as mono float32 at FP_SR."""
+    import librosa
+    import soundfile as sf
+
+    audio, sr = sf.read(str(path), dtype="float32", always_2d=True)
+    # a matrix-vector product; mean(axis=1) over interleaved channels is
+    # several times slower
+    y = audio @ np.full(audio.shape[1], 1.0 / audio.shape[1], dtype=np.float32)
+    return librosa.resample(y, orig_sr=sr, target_sr=FP_SR)
+
+
+def peaks(y):
+    """(frame, bin) of the spectral peaks of y, sorted by frame then bin."""
+    import librosa
+    from scipy.ndimage import maximum_filter
+
+    spec = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP))
+    floor = spec.max() * 10 ** (-PEAK_RANGE_DB / 20)
+    is_peak = (spec == maximum_filter(spec, size=(PEAK_BINS, PEAK_FRAMES))) & (spec > floor)
+    is_peak[0] = False  # DC
+    bins, frames = np.nonzero(is_peak)
+    order = np.lexsort((bins, frames))
+    return frames[order], bins[order]
+
+
+def fingerprint(y):
+    """(hashes, anchor frames) of mono audio y at FP_SR, as uint32 and
+    int32 arrays."""
+    frames, bins = peaks(y)
+    hashes, anchors = [], []
+    taken = np.zeros(len(frames), dtype=np.int64)
+    # partners are the next peaks in time order; going outward one step at
+    # a time keeps it vectorized, and a partner only counts while its
+    # anchor has fewer than FAN_OUT
+    for step in range(1, 4 * FAN_OUT):
+        if step >= len(frames):
+            break
+        dt = frames[step:] - frames[:-step]
+        df = bins[step:] - bins[:-step]
+        ok = (dt > 0) & (dt <= MAX_DT) & (np.abs(df) <= MAX_DF) & (taken[:-step] < FAN_OUT)
+        a = np.flatnonzero(ok)
+        taken[a] += 1
+        hashes.append((bins[a] << 13) | ((df[a] + MAX_DF) << 6) | dt[a])
+        anchors.append(frames[a])
+    if not hashes:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.int32)
+    return np.concatenate(hashes).astype(np.uint32), np.concatenate(anchors).astype(np.int32)
+
+
+def fingerprint_file(path):
+    return fingerprint(load_mono(path))
+
+
+@dataclass
+class Match:
+    song: int           # row id in the index
+    info: dict          # what the song was added with
+    score: int          # hashes agreeing on the best offset
+    offset: float       # seconds; where the query starts in the indexed song
+
+
+class SongIndex:
+    """Fingerprints of processed songs in an sqlite file.
+
+    Safe to share between processes: sqlite serializes the writers.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else BASE_DIR / "fingerprints.sqlite"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS songs "
+                       "(id INTEGER PRIMARY KEY, info TEXT, hashes INTEGER, added REAL)")
+            db.execute("CREATE TABLE IF NOT EXISTS hashes (hash INTEGER, song INTEGER, t INTEGER)")
+            db.execute("CREATE INDEX IF NOT EXISTS hashes_hash ON hashes (hash)")
+
+    @contextmanager
+    def _connect(self):
+        """A connection that commits, or rolls back on error, and is then
+        closed; sqlite3's own context manager never closes it."""
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def add(self, hashes, frames, info):
+        """Add a song; returns its id."""
+        with self._connect() as db:
+            song = db.execute("INSERT INTO songs (info, hashes, added) VALUES (?, ?, ?)",
+                              (json.dumps(info), len(hashes), time.time())).lastrowid
+            db.executemany("INSERT INTO hashes VALUES (?, ?, ?)",
+                           zip(hashes.tolist(), [song] * len(hashes), frames.tolist()))
+        return song
+
+    def matches(self, hashes, frames, min_matches=MIN_MATCHES, min_fraction=MIN_FRACTION):
+        """Songs the query matches, best first."""
+        if not len(hashes):
+            return []
+        with self._connect() as db:
+            db.execute("CREATE TEMP TABLE query (hash INTEGER, t INTEGER)")
+            db.executemany("INSERT INTO query VALUES (?, ?)", zip(hashes.tolist(), frames.tolist()))
+            rows = np.array(db.execute("SELECT h.song, h.t - q.t FROM query q JOIN hashes h ON h.hash = q.hash")
+                            .fetchall(), dtype=np.int64).reshape(-1, 2)
+            if not len(rows):
+                return []
+            # a one frame slip between recordings still counts as the same offset
+            keys, counts = np.unique((rows[:, 0] << 32) + rows[:, 1] // 2 + (1 << 31), return_counts=True)
+            songs = keys >> 32
+            # the best offset of each song: last of its run once sorted by count
+            order = np.lexsort((counts, songs))
+            best = order[np.append(songs[order][1:] != songs[order][:-1], True)]
+            best = best[counts[best] >= max(min_matches, min_fraction * len(hashes))]
+            found = []
+            for song, count, offset in zip(songs[best].tolist(), counts[best].tolist(),
+                                           ((keys[best] & 0xFFFFFFFF) - (1 << 31)).tolist()):
+                info, = db.execute("SELECT info FROM songs WHERE id = ?", (song,)).fetchone()
+                found.append(Match(song, json.loads(info), count, 2 * offset * HOP / FP_SR))
+            return sorted(found, key=lambda m: m.score, reverse=True)
+
+    def remove(self, song):
+        with self._connect() as db:
+            db.execute("DELETE FROM hashes WHERE song = ?", (song,))
+            db.execute("DELETE FROM songs WHERE id = ?", (song,))
+
+    def __len__(self):
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM songs").fetchone()[0]
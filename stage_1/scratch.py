@@ -0,0 +1,81 @@
+"""Scratch space for stage 1 intermediates with a byte budget.
+
+Each song gets its own job directory under the scratch root for its mp3 and
+wav. Starting a job reserves an estimated number of bytes and blocks while
+the running jobs' reservations would go over the budget; a job's
+reservation grows if its files turn out bigger. Intermediates are deleted
+as soon as the next stage has consumed them and the job directory goes
+away when the job ends, so the disk footprint stays bounded however many
+songs are queued.
+"""
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+# a few minutes of audio: ~10 MB of mp3 plus ~50 MB of 44.1 kHz stereo wav
+DEFAULT_JOB_ESTIMATE = 80 * 1024 * 1024
+
+
+def dir_size(path):
+    return sum(p.stat().st_size for p in Path(path).rglob("*") if p.is_file())
+
+
+class ScratchSpace:
+    def __init__(self, root, budget_bytes, job_estimate=DEFAULT_JOB_ESTIMATE):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.budget = budget_bytes
+        self.job_estimate = job_estimate
+        self._reserved = {}
+        self._cond = threading.Condition()
+        self.peak = 0  # largest total reservation seen, for reporting
+
+    def reserved(self):
+        with self._cond:
+            return self._total()
+
+    def _total(self):
+        return sum(self._reserved.values())
+
+    @contextmanager
+    def job(self, name=None):
+        """Reserve room for one song and yield its job directory.
+
+        Blocks until the reservation fits in the budget. A single job is
+        always let through, even if its estimate alone is over budget.
+        """
+        key = f"{name or 'job'}-{uuid.uuid4().hex[:8]}"
+        with self._cond:
+            while self._reserved and self._total() + self.job_estimate > self.budget:
+                self._cond.wait()
+            self._reserved[key] = self.job_estimate
+            self.peak = max(self.peak, self._total())
+        job_dir = self.root / key
+        job_dir.mkdir(parents=True)
+        try:
+            yield job_dir
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            with self._cond:
+                del self._reserved[key]
+                self._cond.notify_all()
+
+    def account(self, job_dir):
+        """Set the job's reservation to its estimate or what it actually
+        uses on disk, whichever is larger."""
+        key = Path(job_dir).name
+        used = dir_size(job_dir)
+        with self._cond:
+            if key in self._reserved:
+                self._reserved[key] = max(self.job_estimate, used)
+                self.peak = max(self.peak, self._total())
+                self._cond.notify_all()
+        return used
+
+    def consumed(self, job_dir, *paths):
+        """Delete intermediates the next stage no longer needs."""
+        for p in paths:
+            Path(p).unlink(missing_ok=True)
+        return self.account(job_dir)
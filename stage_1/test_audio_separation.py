@@ -0,0 +1,81 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import soundfile as sf
+
+from stage_1.audio_separation import separate
+
+SR = 22050
+
+
+def write_song(path, freq):
+    t = np.arange(SR) / SR
+    tone = 0.3 * np.sin(2 * np.pi * freq * t)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    sf.write(path, np.stack([tone, tone]).T, SR)
+    return path
+
+
+def peak_hz(path):
+    audio, sr = sf.read(path, always_2d=True)
+    spectrum = np.abs(np.fft.rfft(audio[:, 0]))
+    return np.argmax(spectrum) * sr / len(audio)
+
+
+def test_same_titles_separate_into_their_own_folders(tmp_path):
+    # two different songs whose videos have the same title
+    songs = [write_song(tmp_path / f"job{i}" / "Official Audio.wav", freq) for i, freq in enumerate((330, 550))]
+    out = tmp_path / "separated"
+    with ThreadPoolExecutor(2) as pool:
+        stems = list(pool.map(lambda i: separate(songs[i], out, "fast", name=f"job{i}"), range(2)))
+
+    assert [s[0].parent for s in stems] == [out / "job0", out / "job1"]
+    for (vocals, accompaniment), freq in zip(stems, (330, 550)):
+        assert abs(peak_hz(vocals) - freq) < 2
+    # the work directories are gone
+    assert sorted(p.name for p in out.iterdir()) == ["job0", "job1"]
+
+    # without a name the folder is named after the wav
+    vocals, _ = separate(songs[0], out, "fast")
+    assert vocals == out / "Official Audio" / "vocals.wav"
+
+
+def test_separate_songs_keeps_to_the_budget(tmp_path, monkeypatch):
+    import stage_1.audio_separation as audio_separation
+    from stage_1.scratch import DEFAULT_JOB_ESTIMATE
+
+    freqs = {f"https://example.com/{i}": 220 + 110 * i for i in range(5)}
+    running, most = [0], [0]
+    lock = threading.Lock()
+
+    # every video has the same title; "downloading" takes a while
+    def fake_download(url, out_dir=None, concurrent_fragments=1):
+        with lock:
+            running[0] += 1
+            most[0] = max(most[0], running[0])
+        time.sleep(0.1)
+        with lock:
+            running[0] -= 1
+        if url.endswith("/4"):
+            raise OSError("video unavailable")
+        path = out_dir / "Official Audio.mp3"
+        path.write_text(url)
+        return path
+
+    def fake_convert(mp3, out_dir=None):
+        return write_song(out_dir / "Official Audio.wav", freqs[mp3.read_text()])
+
+    monkeypatch.setattr(audio_separation, "url_to_mp3", fake_download)
+    monkeypatch.setattr(audio_separation, "mp3_to_wav", fake_convert)
+    done, failed = audio_separation.separate_songs(
+        list(freqs), workers=5, scratch_dir=tmp_path / "scratch", budget_bytes=2 * DEFAULT_JOB_ESTIMATE,
+        stems_dir=tmp_path / "stems", backend="fast", dedupe=False)
+
+    assert list(failed) == ["https://example.com/4"]
+    assert most[0] == 2
+    assert len({vocals.parent for vocals, _ in done.values()}) == 4
+    for url, (vocals, _) in done.items():
+        assert abs(peak_hz(vocals) - freqs[url]) < 2
+    assert list((tmp_path / "scratch").iterdir()) == []
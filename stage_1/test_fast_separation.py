@@ -0,0 +1,21 @@
+import numpy as np
+
+from stage_1.fast_separation import separate_array
+
+SR = 22050
+
+
+def test_centre_tone_is_vocals_and_panned_tone_is_accompaniment():
+    t = np.arange(2 * SR) / SR
+    voice = 0.3 * np.sin(2 * np.pi * 440 * t)     # centred
+    guitar = 0.3 * np.sin(2 * np.pi * 660 * t)    # hard left
+    mix = np.stack([voice + guitar, voice]).astype(np.float32)
+
+    vocals, accompaniment = separate_array(mix, SR, block_seconds=0.5)
+    assert np.allclose(vocals + accompaniment, mix, atol=1e-6)
+
+    def level(x, freq):
+        return np.abs(np.fft.rfft(x[0]))[int(freq * len(t) / SR)]
+
+    assert level(vocals, 440) > 5 * level(accompaniment, 440)
+    assert level(accompaniment, 660) > 5 * level(vocals, 660)
@@ -0,0 +1,51 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+import stage_1.fingerprint as fp
+from stage_1.bench_separation import synthetic_mix
+from stage_1.fingerprint import FP_SR, SongIndex, fingerprint
+
+
+def mono(seconds, seed):
+    mix, _, _ = synthetic_mix(seconds, sr=FP_SR, seed=seed)
+    return mix.mean(axis=0)
+
+
+def test_a_noisy_trimmed_copy_matches_and_another_song_does_not(tmp_path):
+    y = mono(20, seed=0)
+    index = SongIndex(tmp_path / "fingerprints.sqlite")
+    song = index.add(*fingerprint(y), {"run_dir": "first"})
+    index.add(*fingerprint(mono(20, seed=1)), {"run_dir": "other"})
+
+    rng = np.random.default_rng(0)
+    copy = 0.5 * y[5 * FP_SR:] + 0.01 * rng.standard_normal(len(y) - 5 * FP_SR).astype(np.float32)
+    found = index.matches(*fingerprint(copy))
+    assert [m.song for m in found] == [song]
+    assert found[0].info == {"run_dir": "first"}
+    assert abs(found[0].offset - 5.0) < 0.1
+
+    assert index.matches(*fingerprint(mono(20, seed=2))) == []
+
+
+def test_every_index_call_closes_its_connection(tmp_path, monkeypatch):
+    opened = []
+    real_connect = sqlite3.connect
+
+    def connect(*args, **kwargs):
+        opened.append(real_connect(*args, **kwargs))
+        return opened[-1]
+
+    monkeypatch.setattr(fp.sqlite3, "connect", connect)
+    hashes, frames = fingerprint(mono(20, seed=0))
+    index = SongIndex(tmp_path / "fp.sqlite")
+    song = index.add(hashes, frames, {"title": "a"})
+    assert [m.song for m in index.matches(hashes, frames)] == [song]
+    assert len(index) == 1
+    index.remove(song)
+
+    assert len(opened) == 5
+    for db in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            db.execute("SELECT 1")
@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+
+from stage_1.scratch import ScratchSpace
+
+MB = 1 << 20
+
+
+def test_jobs_block_at_the_budget(tmp_path):
+    scratch = ScratchSpace(tmp_path, budget_bytes=2 * MB, job_estimate=MB)
+    release = threading.Event()
+    running, most = [], [0]
+    lock = threading.Lock()
+
+    def job(i):
+        with scratch.job(f"song{i}"):
+            with lock:
+                running.append(i)
+                most[0] = max(most[0], len(running))
+            release.wait()
+            with lock:
+                running.remove(i)
+
+    threads = [threading.Thread(target=job, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    time.sleep(0.2)
+    assert len(running) == 2 and scratch.reserved() == 2 * MB
+    release.set()
+    for t in threads:
+        t.join()
+    assert most[0] == 2
+    assert scratch.peak == 2 * MB and scratch.reserved() == 0
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_a_single_job_over_budget_still_runs(tmp_path):
+    scratch = ScratchSpace(tmp_path, budget_bytes=MB, job_estimate=2 * MB)
+    with scratch.job() as job_dir:
+        assert job_dir.is_dir()
+    assert scratch.reserved() == 0
+
+
+def test_reservation_grows_with_the_files_and_shrinks_when_consumed(tmp_path):
+    scratch = ScratchSpace(tmp_path, budget_bytes=4 * MB, job_estimate=MB)
+    with scratch.job() as job_dir:
+        big = job_dir / "song.wav"
+        big.write_bytes(bytes(3 * MB))
+        assert scratch.account(job_dir) == 3 * MB
+        assert scratch.reserved() == 3 * MB
+        scratch.consumed(job_dir, big)
+        assert not big.exists() and scratch.reserved() == MB
+    assert scratch.peak == 3 * MB
+
+
+def test_a_failed_job_is_cleaned_up_and_released(tmp_path):
+    scratch = ScratchSpace(tmp_path, budget_bytes=MB, job_estimate=MB)
+    with pytest.raises(RuntimeError):
+        with scratch.job() as job_dir:
+            (job_dir / "song.mp3").write_bytes(b"partial")
+            raise RuntimeError("download failed")
+    assert not job_dir.exists() and scratch.reserved() == 0
+    # and the next job isn't kept waiting
+    with scratch.job():
+        pass
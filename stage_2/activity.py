@@ -0,0 +1,90 @@
+"""Where a stem has anything in it.
+
+Separated stems are mostly near-silence: a vocal stem is bleed through
+intros, solos and outros, and both stems have silent tails. Running Basic
+Pitch or HPSS + CQT over that costs time and produces notes and chords
+that cleanup has to throw away. active_regions() finds the parts worth
+analysing, from two features of the stem's STFT (a spectral.Spectrum, so
+the chord pass reuses it):
+
+    RMS     loud enough, relative to the loudest hop of the stem
+    flux    positive spectral flux in dB, for quiet entries (a breathy
+            first note) that are under the RMS threshold but clearly
+            start something. Bins under FLUX_FLOOR_DB are clamped to the
+            floor first, so broadband bleed, whose energy is spread thin
+            over every bin, has next to no flux however much it flickers.
+            A quiet onset is only a hop or two of flux, too short to be a
+            region by itself, but it joins the region after it when that
+            starts within MIN_GAP
+
+Hops that pass either test are active. Gaps shorter than MIN_GAP are
+closed, then regions shorter than MIN_REGION or without a single hop over
+the RMS threshold are dropped, and the rest are padded by PAD on both
+sides so onsets and releases aren't cut. Callers only analyse inside the
+regions and keep times absolute (see extract_melody and extract_chords).
+"""
+import numpy as np
+
+# STFT for a stem nothing else analyses; the hop can be coarse, PAD is
+# far longer
+FRAME_LENGTH = 2048
+HOP_LENGTH = 1024
+RMS_THRESHOLD_DB = -30.0    # below the loudest hop
+FLUX_FLOOR_DB = -50.0       # below the loudest bin
+FLUX_THRESHOLD = 10.0       # dB rise summed over bins
+FLUX_MARGIN_DB = 15.0       # flux only counts this far under the RMS threshold
+PAD = 0.25                  # seconds added before and after each region
+MIN_GAP = 1.0               # shorter silences don't split a region
+MIN_REGION = 0.1            # shorter activity is dropped
+
+
+def activity_features(spectrum):
+    """(RMS in dB below the loudest hop, positive spectral flux in dB) per
+    hop of a spectral.Spectrum."""
+    return spectrum.rms_db(), spectrum.flux_db(FLUX_FLOOR_DB)
+
+
+def active_regions(spectrum, rms_threshold_db=RMS_THRESHOLD_DB, flux_threshold=FLUX_THRESHOLD,
+                   pad=PAD, min_gap=MIN_GAP, min_region=MIN_REGION):
+    """(n, 2) array of [start, end] seconds where the stem of a
+    spectral.Spectrum is active."""
+    sr, hop_length = spectrum.sr, spectrum.hop_length
+    duration = len(spectrum.y) / sr
+    if not np.any(spectrum.y):
+        return np.zeros((0, 2))
+    rms_db, flux = activity_features(spectrum)
+    loud = rms_db > rms_threshold_db
+    active = loud | ((rms_db > rms_threshold_db - FLUX_MARGIN_DB) & (flux > flux_threshold))
+
+    edges = np.diff(np.concatenate([[0], active.astype(np.int8), [0]]))
+    first, last = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    if not len(first):
+        return np.zeros((0, 2))
+
+    # close short gaps, then drop regions that are too short or that flux
+    # alone made: flux only extends what RMS found
+    keep = np.concatenate([[True], (first[1:] - last[:-1]) * hop_length / sr >= min_gap])
+    first, last = first[keep], np.maximum.reduceat(last, np.flatnonzero(keep))
+    loud_before = np.concatenate([[0], np.cumsum(loud)])
+    real = ((last - first) * hop_length / sr >= min_region) & (loud_before[last] > loud_before[first])
+    # frame i is centred on i * hop (librosa's default centring)
+    starts, ends = first[real] * hop_length / sr, last[real] * hop_length / sr
+
+    starts = np.maximum(starts - pad, 0.0)
+    ends = np.minimum(ends + pad, duration)
+    # padding can make neighbours overlap again
+    if len(starts):
+        new = np.concatenate([[True], starts[1:] > ends[:-1]])
+        starts, ends = starts[new], np.maximum.reduceat(ends, np.flatnonzero(new))
+    return np.stack([starts, ends], axis=1)
+
+
+def region_slices(regions, sr, n_samples):
+    """(start sample, stop sample) of each region."""
+    bounds = np.clip(np.round(np.asarray(regions) * sr).astype(np.int64), 0, n_samples)
+    return [(int(a), int(b)) for a, b in bounds if b > a]
+
+
+def region_frames(regions, spectrum):
+    """(start frame, stop frame) of each region in a spectral.Spectrum."""
+    return region_slices(regions, spectrum.sr / spectrum.hop_length, spectrum.n_frames)
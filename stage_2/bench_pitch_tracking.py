@@ -0,0 +1,121 @@
+"""Speed and note accuracy of the melody backends on rendered MIDI.
+
+Each fixture's melody is made monophonic (clean_melody_notes), folded by
+octaves into the bandpass range, and rendered as a sung-like tone
+(harmonics, vibrato, soft attack, a little noise). Every backend then
+transcribes the audio, and the notes it finds are matched against the
+fixture: a hit is the right pitch with an onset within ONSET_TOLERANCE,
+as in mir_eval's onset-only note metric. Basic Pitch is run wherever it
+can be imported.
+
+Usage: python -m stage_2.bench_pitch_tracking [fixture.mid ...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+from stage_2.melody_extraction import clean_melody_notes
+from stage_2.pitch_tracking import track_melody
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+FIXTURES = [
+    os.path.join(ROOT, "mil_dreams_low_priority.mid"),
+    os.path.join(ROOT, "mid-files", "The Greatest Showman Cast - The Greatest Show (Official Audio).mid"),
+    os.path.join(ROOT, "stage_2", "melody_fixed.mid"),
+]
+SR = 44100
+ONSET_TOLERANCE = 0.05
+LOW, HIGH = 45, 79  # rendered pitch range (110-784 Hz)
+
+
+def fixture_notes(path):
+    import pretty_midi
+
+    notes = clean_melody_notes([n for i in pretty_midi.PrettyMIDI(path).instruments for n in i.notes])
+    out = []
+    for n in notes:
+        pitch = n.pitch
+        while pitch < LOW:
+            pitch += 12
+        while pitch > HIGH:
+            pitch -= 12
+        out.append((n.start, n.end, pitch))
+    return out
+
+
+def render(notes, sr=SR, seed=0):
+    rng = np.random.default_rng(seed)
+    audio = np.zeros(int((max(e for _, e, _ in notes) + 0.5) * sr))
+    for start, end, pitch in notes:
+        i0, i1 = int(start * sr), int(end * sr)
+        tt = np.arange(i1 - i0) / sr
+        f0 = 440.0 * 2 ** ((pitch - 69) / 12) * (1 + 0.005 * np.sin(2 * np.pi * 5.5 * tt))
+        phase = 2 * np.pi * np.cumsum(f0) / sr
+        tone = sum(np.sin(k * phase) / k for k in range(1, 6))
+        env = np.minimum(1.0, tt / 0.02) * np.minimum(1.0, (tt[::-1]) / 0.02)
+        audio[i0:i1] += 0.3 * tone * env
+    return audio + 0.003 * rng.standard_normal(len(audio))
+
+
+def note_f1(truth, found):
+    """Greedy one-to-one matching on pitch and onset; (precision, recall, F1)."""
+    used = set()
+    hits = 0
+    for start, _, pitch in truth:
+        for j, (s, _, p) in enumerate(found):
+            if j not in used and p == pitch and abs(s - start) <= ONSET_TOLERANCE:
+                used.add(j)
+                hits += 1
+                break
+    precision = hits / len(found) if found else 0.0
+    recall = hits / len(truth) if truth else 0.0
+    return precision, recall, 2 * precision * recall / (precision + recall) if hits else 0.0
+
+
+def basic_pitch_melody(y, sr):
+    import tempfile
+
+    import soundfile as sf
+    from basic_pitch.inference import predict
+
+    from stage_2.melody_extraction import basic_pitch_model, preprocess_audio
+
+    with tempfile.NamedTemporaryFile(suffix=".wav") as tmp:
+        sf.write(tmp.name, preprocess_audio(y, sr), sr)
+        _, midi, _ = predict(tmp.name, basic_pitch_model())
+    for instrument in midi.instruments:
+        instrument.notes = clean_melody_notes(instrument.notes)
+    return midi
+
+
+def main():
+    fixtures = sys.argv[1:] or FIXTURES
+    backends = [("yin", lambda y, sr: track_melody(y, sr, "yin")),
+                ("pyin", lambda y, sr: track_melody(y, sr, "pyin"))]
+    try:
+        import basic_pitch.inference  # noqa: F401
+        backends.append(("basic_pitch", basic_pitch_melody))
+    except ImportError:
+        print("basic_pitch not importable here, skipped")
+
+    print(f"{'fixture':>28} {'backend':>12} {'notes':>6} {'seconds':>8} {'x realtime':>11} "
+          f"{'P':>5} {'R':>5} {'F1':>5}")
+    for path in fixtures:
+        truth = fixture_notes(path)
+        y = render(truth)
+        seconds = len(y) / SR
+        for name, run in backends:
+            run(y[:SR], SR)  # imports and caches outside the timing
+            start = time.perf_counter()
+            midi = run(y, SR)
+            took = time.perf_counter() - start
+            found = sorted((n.start, n.end, n.pitch) for i in midi.instruments for n in i.notes)
+            p, r, f = note_f1(truth, found)
+            print(f"{os.path.basename(path)[:28]:>28} {name:>12} {len(found):6d} {took:8.2f} "
+                  f"{seconds / took:11.1f} {p:5.2f} {r:5.2f} {f:5.2f}")
+
+
+if __name__ == "__main__":
+    main()
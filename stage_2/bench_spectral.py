@@ -0,0 +1,87 @@
+"""The chord pass before and after the shared spectral front end.
+
+A synthetic accompaniment stem: one random major or minor chord per bar
+(voiced around E3, sometimes with a 7th, decaying), a bass note on the
+root, a kick on every beat and noisy hi-hats. "old" is the chord pass as
+it was: an activity STFT, librosa.effects.harmonic, then chroma_cqt (which
+estimates tuning with another STFT). "shared" is Spectrum: one STFT for
+the gate and the tuning, one CQT, HPSS on the CQT. Accuracy is the
+fraction of frames whose best template is the true chord, ignoring 0.1 s
+either side of each change.
+
+Usage: python -m stage_2.bench_spectral [seconds]
+"""
+import sys
+import time
+
+import numpy as np
+
+from stage_1.bench_separation import tone
+from stage_2.activity import active_regions
+from stage_2.spectral import Spectrum
+
+SR = 22050
+BAR = 2.0
+MAJ = np.array([1, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0])
+MIN = np.array([1, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0])
+TEMPLATES = np.array([np.roll(MAJ, i) for i in range(12)] + [np.roll(MIN, i) for i in range(12)])
+
+
+def synthetic_accompaniment(seconds, sr=SR, seed=0):
+    """(audio, template index per bar)."""
+    rng = np.random.default_rng(seed)
+    n, bar = int(seconds * sr), int(BAR * sr)
+    chords = rng.integers(24, size=n // bar + 1)
+    y = np.zeros(n)
+    for b, chord in enumerate(chords[:-1]):
+        i0, i1 = b * bar, min((b + 1) * bar, n)
+        root, minor = chord % 12, chord >= 12
+        intervals = [0, 3 if minor else 4, 7] + ([10] if rng.random() < 0.3 else [])
+        env = np.exp(-np.arange(i1 - i0) / sr * 1.5)
+        for interval in intervals:
+            pitch = 48 + (root + interval) % 12 + (12 if (root + interval) % 12 < 4 else 0)
+            y[i0:i1] += 0.08 * env * tone(np.full(i1 - i0, 440.0 * 2 ** ((pitch - 69) / 12)), sr, harmonics=6)
+        y[i0:i1] += 0.3 * tone(np.full(i1 - i0, 440.0 * 2 ** ((36 + root - 69) / 12)), sr, harmonics=3)
+    beat = sr // 2
+    tb = np.arange(beat) / sr
+    y += 0.4 * np.tile(np.sin(2 * np.pi * 55 * tb) * np.exp(-tb * 25), n // beat + 1)[:n]
+    y += 0.1 * rng.standard_normal(n) * np.tile(np.exp(-np.arange(beat // 2) / sr * 30), n // (beat // 2) + 1)[:n]
+    return y.astype(np.float32), chords
+
+
+def old_chroma(y, sr):
+    import librosa
+
+    np.abs(librosa.stft(y, n_fft=2048, hop_length=512))  # the gate's own STFT
+    return librosa.feature.chroma_cqt(y=librosa.effects.harmonic(y), sr=sr)
+
+
+def shared_chroma(y, sr):
+    spectrum = Spectrum(y, sr)
+    active_regions(spectrum)
+    return spectrum.chroma()
+
+
+def accuracy(chroma, chords, hop=512):
+    best = np.argmax(TEMPLATES @ chroma, axis=0)
+    t = np.arange(len(best)) * hop / SR
+    truth = chords[(t // BAR).astype(int)]
+    away = np.abs(t - np.round(t / BAR) * BAR) > 0.1
+    return float(np.mean(best[away] == truth[away]))
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 60.0
+    y, chords = synthetic_accompaniment(seconds)
+    print(f"{seconds:.0f} s synthetic accompaniment\n")
+    print(f"{'pass':>7} {'seconds':>8} {'accuracy':>9}")
+    for name, run in (("old", old_chroma), ("shared", shared_chroma)):
+        run(y[:SR], SR)  # librosa's lazy imports and filter caches
+        start = time.perf_counter()
+        chroma = run(y, SR)
+        took = time.perf_counter() - start
+        print(f"{name:>7} {took:8.2f} {accuracy(chroma, chords):9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Accuracy, latency and speed of the streaming transcriber.
+
+A synthetic sung-like melody (harmonics, vibrato, attacks, short gaps and
+a repeated pitch) is pushed through StreamingTranscriber block by block.
+Reports how many notes came out at the right pitch and onset, how long
+after each note really ended it was emitted, and the processing time
+per block against the block's duration.
+
+Usage: python -m stage_2.bench_streaming
+"""
+import time
+
+import numpy as np
+
+from stage_2.streaming import StreamingTranscriber
+
+SR = 44100
+BLOCK = 512
+BPM = 120
+
+# (midi pitch, seconds); None is a rest
+MELODY = [(60, 0.5), (62, 0.5), (64, 0.5), (64, 0.5), (65, 0.25), (67, 0.25),
+          (None, 0.25), (69, 0.75), (67, 0.5), (65, 0.5), (64, 1.0), (None, 0.5),
+          (72, 0.25), (71, 0.25), (69, 0.5), (67, 1.0)] * 4
+
+
+def synthesize(melody, sr=SR, gap=0.03, seed=0):
+    rng = np.random.default_rng(seed)
+    out, truth, t = [], [], 0.0
+    for pitch, dur in melody:
+        n = int(dur * sr)
+        if pitch is None:
+            out.append(np.zeros(n))
+        else:
+            f0 = 440.0 * 2 ** ((pitch - 69) / 12)
+            tt = np.arange(n) / sr
+            phase = 2 * np.pi * np.cumsum(f0 * (1 + 0.004 * np.sin(2 * np.pi * 5.5 * tt))) / sr
+            tone = sum(np.sin(k * phase) / k for k in range(1, 6))
+            env = np.minimum(1.0, tt / 0.02) * np.exp(-tt * 0.8)
+            env[int((dur - gap) * sr):] = 0  # articulation gap
+            out.append(0.3 * tone * env)
+            truth.append((t, t + dur - gap, pitch))
+        t += dur
+    audio = np.concatenate(out)
+    audio += 0.002 * rng.standard_normal(len(audio))
+    return audio, truth
+
+
+def main():
+    audio, truth = synthesize(MELODY)
+    transcriber = StreamingTranscriber(SR, BPM)
+    notes, block_times = [], []
+    for i in range(0, len(audio), BLOCK):
+        start = time.perf_counter()
+        notes.extend(transcriber.push(audio[i:i + BLOCK]))
+        block_times.append(time.perf_counter() - start)
+    notes.extend(transcriber.flush())
+
+    # latency is measured from where the note really ends in the audio
+    matched, latency = 0, []
+    for t0, t1, pitch in truth:
+        hits = [n for n in notes if n.pitch == pitch and abs(n.start - t0) < 0.06]
+        matched += bool(hits)
+        if hits and hits[0] is not notes[-1]:  # the last one waits for flush()
+            latency.append(hits[0].emitted_at - t1)
+    latency = np.array(latency) * 1000
+    block_ms = BLOCK / SR * 1000
+    times = np.array(block_times) * 1000
+
+    print(f"{len(audio) / SR:.1f} s of audio, {len(truth)} notes, {len(notes)} emitted, "
+          f"{matched} matched (pitch exact, onset within 60 ms)")
+    print(f"emit latency after note end: median {np.median(latency):.0f} ms, "
+          f"max {latency.max():.0f} ms")
+    print(f"per {BLOCK}-sample block ({block_ms:.1f} ms of audio): "
+          f"mean {times.mean():.2f} ms, max {times.max():.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,13 +7,11 @@ BPM: [number]
 Time Signature: [number]/[number]
 '''
 
-song_name = ""
-
-async def dedalus_main():
+async def dedalus_main(song_name):
+    """Ask for the BPM and time signature of song_name."""
     client = AsyncDedalus()
     runner = DedalusRunner(client)
 
-    # 3. Reference the global variable here
     response = await runner.run(
         input=get_input(song_name), 
         model="anthropic/claude-opus-4-6",
@@ -25,7 +23,7 @@ async def dedalus_main():
 
 # if __name__ == "__main__":
 #     # song_name = input("Enter the song name and movie or artist (e.g., 'A Million Dreams from the Greatest Showman'): ")
-#     asyncio.run(main())
+#     asyncio.run(dedalus_main(song_name))
 
 # chat_completion = client.chat.completions.create(
 #     model="openai/gpt-5-nano",
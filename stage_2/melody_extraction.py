@@ -1,101 +1,210 @@
-import numpy as np
-import librosa
-import soundfile as sf
 import json
 import os
-import pretty_midi
-from basic_pitch.inference import predict
-from scipy.signal import butter, sosfilt
+import tempfile
+import threading
+
+# numpy, librosa, soundfile, scipy and basic_pitch (which loads TensorFlow)
+# take seconds to import, so each stage imports them where it needs them
 
 # --- PREPROCESSING UTILITY ---
 
+# Notes starting within GHOST_WINDOW seconds of an accepted note at the
+# same pitch or an octave away are ghosts; notes cut shorter than
+# MIN_NOTE_LENGTH by the monophonic pass are dropped
+GHOST_WINDOW = 0.05
+MIN_NOTE_LENGTH = 0.05
+
+def bandpass_sos(sr, lowcut=80.0, highcut=880.0):
+    from scipy.signal import butter
+
+    nyquist = 0.5 * sr
+    low = lowcut / nyquist
+    high = highcut / nyquist
+
+    # 5th order Butterworth filter for a sharp cutoff without phase distortion
+    return butter(5, [low, high], btype='band', output='sos')
+
 def preprocess_audio(y, sr, lowcut=80.0, highcut=880.0):
     """
     Applies a Butterworth bandpass filter to clean up vocals for MIDI extraction.
     Restricts frequencies to the typical human melodic range.
     """
+    import librosa
+    from scipy.signal import sosfilt
+
     print(f"  > Preprocessing: Bandpass Filter ({lowcut}Hz - {highcut}Hz)")
     
-    nyquist = 0.5 * sr
-    low = lowcut / nyquist
-    high = highcut / nyquist
-    
-    # 5th order Butterworth filter for a sharp cutoff without phase distortion
-    sos = butter(5, [low, high], btype='band', output='sos')
-    filtered_y = sosfilt(sos, y)
+    filtered_y = sosfilt(bandpass_sos(sr, lowcut, highcut), y)
     
     # Normalize to ensure Basic Pitch has a strong signal to analyze
     filtered_y = librosa.util.normalize(filtered_y)
     
     return filtered_y
 
-def extract_melody(vocal_path, output_filename='mil_dreams_low_priority.mid', bpm=120):
+def is_ghost(note, accepted_notes):
+    """True if note starts with an accepted note at the same pitch or an
+    octave away."""
+    for accepted in accepted_notes:
+        # If notes start at the same time
+        if abs(note.start - accepted.start) < GHOST_WINDOW:
+            interval = abs(note.pitch - accepted.pitch)
+            # If it's the same note or an octave higher, skip it
+            if interval == 0 or interval % 12 == 0:
+                return True
+    return False
+
+def clean_melody_notes(notes):
+    """Drop ghost notes and truncate overlaps so at most one note sounds.
+
+    notes are anything with start, end and pitch (pretty_midi.Note); ends
+    are modified in place.
+    """
+    # 1. NEW SORTING: Sort by start time, then by PITCH (lowest first)
+    # This ensures the 'accepted' note is the bottom one in an octave pair
+    notes = sorted(notes, key=lambda x: (x.start, x.pitch))
     
+    cleaned_notes = []
+    for current_note in notes:
+        if not is_ghost(current_note, cleaned_notes):
+            cleaned_notes.append(current_note)
+
+    # 2. Monophonic Truncation (No two notes at once)
+    final_notes = []
+    if cleaned_notes:
+        cleaned_notes.sort(key=lambda x: x.start)
+        active = cleaned_notes[0]
+        for next_n in cleaned_notes[1:]:
+            if next_n.start < active.end:
+                active.end = next_n.start 
+            
+            if active.end > active.start + MIN_NOTE_LENGTH:
+                final_notes.append(active)
+            active = next_n
+        final_notes.append(active)
+    return final_notes
+
+_model = None
+_model_lock = threading.Lock()
+
+def basic_pitch_model():
+    """basic_pitch's model, loaded once per process.
+
+    The model is only read after loading, so concurrent extract_melody
+    calls share it instead of each loading TensorFlow weights again.
+    """
+    global _model
+    with _model_lock:
+        if _model is None:
+            from basic_pitch import ICASSP_2022_MODEL_PATH
+            from basic_pitch.inference import Model
+            _model = Model(ICASSP_2022_MODEL_PATH)
+    return _model
+
+MELODY_BACKENDS = ("basic_pitch", "yin", "pyin")
+
+def _basic_pitch_notes(y_filtered, sr):
+    """Basic Pitch's notes and pitch bends for one stretch of filtered audio."""
+    import soundfile as sf
+    from basic_pitch.inference import predict
+
+    # basic_pitch reads from a path, so each call gets its own temp file
+    fd, temp_filtered_path = tempfile.mkstemp(prefix="vocal_cleaned_", suffix=".wav")
+    os.close(fd)
+    try:
+        sf.write(temp_filtered_path, y_filtered, sr)
+        _, midi_data, _ = predict(temp_filtered_path, basic_pitch_model())
+    finally:
+        os.remove(temp_filtered_path)
+    notes = [n for instrument in midi_data.instruments for n in instrument.notes]
+    bends = [b for instrument in midi_data.instruments for b in instrument.pitch_bends]
+    return notes, bends
+
+def extract_melody(vocal_path, output_filename, bpm=120, backend="basic_pitch", gate=False):
+    """Transcribe the vocal stem at vocal_path into a MIDI file at
+    output_filename. Safe to call from several threads at once.
+
+    backend "basic_pitch" runs the polyphonic model and keeps one line of
+    it; "yin" and "pyin" track a single f0 instead (pitch_tracking.py),
+    much cheaper on a clean vocal stem. With gate, only the active regions
+    of the stem are transcribed (see activity.py), so notes picked up from
+    bleed in the quiet parts are dropped.
+    """
+    import librosa
+    import pretty_midi
+
+    if backend not in MELODY_BACKENDS:
+        raise ValueError(f"unknown melody backend {backend!r}, expected one of {MELODY_BACKENDS}")
+
     y, sr = librosa.load(vocal_path, sr=None)
     y_filtered = preprocess_audio(y, sr)
-    
-    temp_filtered_path = "temp_vocal_cleaned.wav"
-    sf.write(temp_filtered_path, y_filtered, sr)
+    if gate:
+        from stage_2.activity import FRAME_LENGTH, HOP_LENGTH, active_regions, region_slices
+        from stage_2.spectral import Spectrum
 
-    _, midi_data, _ = predict(temp_filtered_path)
+        regions = active_regions(Spectrum(y_filtered, sr, FRAME_LENGTH, HOP_LENGTH))
+        slices = region_slices(regions, sr, len(y_filtered))
+        print(f"  > Activity gate: {sum(b - a for a, b in slices) / sr:.1f} s of {len(y) / sr:.1f} s active")
+    else:
+        slices = [(0, len(y_filtered))]
 
-    for instrument in midi_data.instruments:
-        # 1. NEW SORTING: Sort by start time, then by PITCH (lowest first)
-        # This ensures the 'accepted' note is the bottom one in an octave pair
-        instrument.notes.sort(key=lambda x: (x.start, x.pitch))
-        
-        cleaned_notes = []
-        if instrument.notes:
-            for current_note in instrument.notes:
-                is_ghost = False
-                
-                for accepted in cleaned_notes:
-                    # If notes start at the same time
-                    if abs(current_note.start - accepted.start) < 0.05:
-                        interval = abs(current_note.pitch - accepted.pitch)
-                        # If it's the same note or an octave higher, skip it
-                        if interval == 0 or interval % 12 == 0:
-                            is_ghost = True
-                            break
-                
-                if not is_ghost:
-                    cleaned_notes.append(current_note)
-
-        # 2. Monophonic Truncation (No two notes at once)
-        final_notes = []
-        if cleaned_notes:
-            cleaned_notes.sort(key=lambda x: x.start)
-            active = cleaned_notes[0]
-            for next_n in cleaned_notes[1:]:
-                if next_n.start < active.end:
-                    active.end = next_n.start 
-                
-                if active.end > active.start + 0.05:
-                    final_notes.append(active)
-                active = next_n
-            final_notes.append(active)
-
-        instrument.notes = final_notes
-        
-        # Reset velocity for a clean score
-        for n in instrument.notes:
-            n.velocity = 100
+    midi_data = pretty_midi.PrettyMIDI(initial_tempo=bpm)
+    instrument = pretty_midi.Instrument(program=0)
+    for start, stop in slices:
+        segment = y_filtered[start:stop]
+        if backend == "basic_pitch":
+            notes, bends = _basic_pitch_notes(segment, sr)
+        else:
+            from stage_2.pitch_tracking import track_notes
+
+            notes = [pretty_midi.Note(velocity=100, pitch=p, start=s, end=e)
+                     for s, e, p in track_notes(segment, sr, backend)]
+            bends = []
+        # back to the stem's time
+        offset = start / sr
+        for n in notes:
+            n.start += offset
+            n.end += offset
+        for b in bends:
+            b.time += offset
+        instrument.notes.extend(notes)
+        instrument.pitch_bends.extend(bends)
+
+    instrument.notes = clean_melody_notes(instrument.notes)
+    # Reset velocity for a clean score
+    for n in instrument.notes:
+        n.velocity = 100
+    midi_data.instruments.append(instrument)
 
     midi_data.write(output_filename)
-    if os.path.exists(temp_filtered_path): os.remove(temp_filtered_path)
-    print(f"Success: Saved lower-octave priority MIDI to {output_filename}")
+    print(f"Success: Saved {backend} melody MIDI to {output_filename}")
     return output_filename
 
 
-def extract_chords(instrumental_path, output_filename='chords.json'):
-    """Analyzes harmonic content to identify major/minor chords."""
+def extract_chords(instrumental_path, output_filename=None, gate=False):
+    """Analyzes harmonic content to identify major/minor chords.
+
+    Returns the chord timeline; it is also saved as JSON if
+    output_filename is given. With gate, only the active regions of the
+    stem are analysed and each silence after one is marked with an "N"
+    (no chord) entry.
+    """
+    import numpy as np
+    import librosa
+
+    from stage_2.spectral import Spectrum
+    from stage_3.timing import ROOTS
+
     print(f"\n--- Stage 2B: Processing Chords from {instrumental_path} ---")
     
     y, sr = librosa.load(instrumental_path)
-    
-    # Use harmonic separation to ignore drums/percussion
-    y_harmonic = librosa.effects.harmonic(y)
-    chroma = librosa.feature.chroma_cqt(y=y_harmonic, sr=sr)
+    # one STFT serves the gate, the tuning and the harmonic mask
+    spectrum = Spectrum(y, sr)
+    if gate:
+        from stage_2.activity import active_regions, region_frames
+
+        spans = region_frames(active_regions(spectrum), spectrum)
+    else:
+        spans = [(0, spectrum.n_frames)]
     
     # Define templates for Major and Minor chords
     maj_template = np.array([1,0,0,0,1,0,0,1,0,0,0,0])
@@ -103,81 +212,84 @@ def extract_chords(instrumental_path, output_filename='chords.json'):
     
     chord_templates = []
     chord_names = []
-    roots = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-    
+
     for i in range(12):
         chord_templates.append(np.roll(maj_template, i))
-        chord_names.append(f"{roots[i]} Maj")
+        chord_names.append(f"{ROOTS[i]} Maj")
     for i in range(12):
         chord_templates.append(np.roll(min_template, i))
-        chord_names.append(f"{roots[i]} min")
+        chord_names.append(f"{ROOTS[i]} min")
 
     chord_templates = np.array(chord_templates)
-    matches = np.dot(chord_templates, chroma)
-    best_matches = np.argmax(matches, axis=0)
-    
-    times = librosa.frames_to_time(np.arange(len(best_matches)), sr=sr)
     chord_timeline = []
     last_chord = None
-    
-    for i, chord_idx in enumerate(best_matches):
-        current_chord = chord_names[chord_idx]
-        if current_chord != last_chord:
-            chord_timeline.append({
-                "time": round(float(times[i]), 3),
-                "chord": current_chord
-            })
-            last_chord = current_chord
-
-    with open(output_filename, 'w') as f:
-        json.dump(chord_timeline, f, indent=4)
-    
-    print(f"✓ Success: Saved {output_filename}")
+
+    for start, stop in spans:
+        # Harmonic mask on the CQT to ignore drums/percussion
+        chroma = spectrum.chroma(start, stop)
+        matches = np.dot(chord_templates, chroma)
+        best_matches = np.argmax(matches, axis=0)
+
+        times = spectrum.frame_times(np.arange(start, stop))
+        for i, chord_idx in enumerate(best_matches):
+            current_chord = chord_names[chord_idx]
+            if current_chord != last_chord:
+                chord_timeline.append({
+                    "time": round(float(times[i]), 3),
+                    "chord": current_chord
+                })
+                last_chord = current_chord
+        if stop < spectrum.n_frames:
+            chord_timeline.append({"time": round(float(spectrum.frame_times(stop)), 3), "chord": "N"})
+            last_chord = "N"
+
+    if output_filename:
+        with open(output_filename, 'w') as f:
+            json.dump(chord_timeline, f, indent=4)
+        print(f"✓ Success: Saved {output_filename}")
     print(f"Detected {len(chord_timeline)} chord changes.")
     return chord_timeline
 
 # --- MAIN EXECUTION BLOCK ---
 
-def melody_main(original_audio_path, v_test_i, i_test_path):
+def melody_main(original_audio_path, out_dir="."):
+    """Run stage 2 on a 30 second excerpt of original_audio_path, writing
+    <name>_melody.mid and <name>_chords.json into out_dir."""
+    import librosa
+    import soundfile as sf
+
     print("Initializing Stage 2 Test (30 Second Trim)...")
 
     # Ensure paths exist
     # original_audio_path = "inputs/vocals.wav"
-    # v_test_path = "v_test_30s.wav"
-    # i_test_path = "i_test_30s.wav"
 
-    if not os.path.exists("inputs"):
-        os.makedirs("inputs")
+    if not os.path.exists(original_audio_path):
+        raise FileNotFoundError(f"{original_audio_path} not found. Please place a file there.")
+
+    name = os.path.splitext(os.path.basename(original_audio_path))[0]
+    melody_path = os.path.join(out_dir, f"{name}_melody.mid")
+    chords_path = os.path.join(out_dir, f"{name}_chords.json")
+
+    # the temporary 30s wav files are removed with the directory
+    with tempfile.TemporaryDirectory() as tmp:
+        v_test_path = os.path.join(tmp, "v_test_30s.wav")
+        i_test_path = os.path.join(tmp, "i_test_30s.wav")
 
-    try:
         # 1. TRIMMING STEP
-        if os.path.exists(original_audio_path):
-            print(f"Reading {original_audio_path}...")
-            y_30s, sr = librosa.load(original_audio_path, offset=60, duration=30)        
-            sf.write(v_test_path, y_30s, sr)
-            sf.write(i_test_path, y_30s, sr) 
-        else:
-            print(f"Error: {original_audio_path} not found. Please place a file there.")
-            exit()
+        print(f"Reading {original_audio_path}...")
+        y_30s, sr = librosa.load(original_audio_path, offset=60, duration=30)        
+        sf.write(v_test_path, y_30s, sr)
+        sf.write(i_test_path, y_30s, sr) 
         
         # 2. RUN EXTRACTION
-        melody_file = extract_melody(v_test_path)
-        chord_data = extract_chords(i_test_path)
+        melody_file = extract_melody(v_test_path, melody_path)
+        chord_data = extract_chords(i_test_path, chords_path)
         
-        # 3. SUMMARY
-        print("\n" + "="*30)
-        print("EXTRACTION COMPLETE")
-        print("="*30)
-        print(f"First 5 Chords: {[c['chord'] for c in chord_data[:5]]}")
-        print(f"MIDI File: {os.path.abspath(melody_file)}")
-        print(f"JSON File: {os.path.abspath('chords.json')}")
-
-    except Exception as e:
-        print(f"\nError during execution: {e}")
-    
-    finally:
-        # CLEANUP: Remove the temporary 30s wav files
-        for f in [v_test_path, i_test_path]:
-            if os.path.exists(f):
-                os.remove(f)
-                print(f"Cleaned up {f}")
\ No newline at end of file
+    # 3. SUMMARY
+    print("\n" + "="*30)
+    print("EXTRACTION COMPLETE")
+    print("="*30)
+    print(f"First 5 Chords: {[c['chord'] for c in chord_data[:5]]}")
+    print(f"MIDI File: {os.path.abspath(melody_file)}")
+    print(f"JSON File: {os.path.abspath(chords_path)}")
+    return melody_file, chords_path
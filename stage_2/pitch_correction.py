@@ -0,0 +1,161 @@
+"""Chord-aware pitch correction for the transcribed melody.
+
+Basic Pitch often puts a sung note an octave off, or a semitone off into
+a note that belongs to neither the key nor the chord. The ghost filter in
+clean_melody_notes only catches octave doubles that start together.
+This pass looks at each note against the chord sounding at its onset,
+found by binary search over the change times in chords.json, and against
+a key estimated from aggregated chroma. It then picks the best of:
+
+    keep the pitch / an octave down / an octave up / a semitone down / up
+
+Each candidate is scored on chord-tone and in-key fit, how far it leaps
+from the neighbouring notes, and a cost for changing anything at all.
+Semitone moves are only considered for notes outside the key, so
+chromatic passing notes inside it are left alone. Everything is computed
+for all notes at once as (notes x candidates) arrays.
+"""
+import json
+
+import numpy as np
+
+from stage_3.timing import ROOTS
+
+# same triads as extract_chords
+MAJ_TEMPLATE = np.array([1, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0], dtype=np.float64)
+MIN_TEMPLATE = np.array([1, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0], dtype=np.float64)
+
+# Krumhansl-Kessler key profiles, tonic first
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+MAJOR_SCALE = np.array([1, 0, 1, 0, 1, 1, 0, 1, 0, 1, 0, 1], dtype=bool)
+MINOR_SCALE = np.array([1, 0, 1, 1, 0, 1, 0, 1, 1, 0, 1, 0], dtype=bool)
+
+# candidate moves and what each costs before any fit is counted
+OFFSETS = np.array([0, -12, 12, -1, 1])
+CHANGE_COST = np.array([0.0, 0.45, 0.45, 0.6, 0.6])
+CHORD_WEIGHT = 1.0
+KEY_WEIGHT = 0.5
+LEAP_WEIGHT = 1.0
+LEAP_FREE = 6          # semitones from the neighbours that cost nothing
+CONTEXT = 2            # neighbours on each side for the leap reference
+
+
+def chord_templates(chords):
+    """(n_chords, 12) chord-tone masks for a chords.json timeline."""
+    out = np.zeros((len(chords), 12))
+    for i, c in enumerate(chords):
+        root, _, quality = c['chord'].partition(' ')
+        if root in ROOTS:
+            template = MIN_TEMPLATE if quality.startswith('min') else MAJ_TEMPLATE
+            out[i] = np.roll(template, ROOTS.index(root))
+    return out
+
+
+def active_chords(times, chords):
+    """Index into chords of the chord sounding at each time (-1 before the
+    first change)."""
+    change = np.array([c['time'] for c in chords], dtype=np.float64)
+    return np.searchsorted(change, times, side='right') - 1
+
+
+def aggregate_chroma(start, end, pitch, chords):
+    """Duration-weighted pitch-class profile of the melody plus the chord
+    timeline, each normalized to sum to 1."""
+    dur = np.maximum(end - start, 0.0)
+    melody = np.bincount(pitch % 12, weights=dur, minlength=12)
+    profile = melody / melody.sum() if melody.sum() > 0 else melody
+    if chords:
+        change = np.array([c['time'] for c in chords], dtype=np.float64)
+        until = np.append(change[1:], max(change[-1], float(end.max()) if len(end) else 0.0))
+        harmony = (chord_templates(chords) * np.maximum(until - change, 0.0)[:, None]).sum(axis=0)
+        if harmony.sum() > 0:
+            profile = profile + harmony / harmony.sum()
+    return profile
+
+
+def estimate_key(chroma):
+    """(tonic pitch class, 'major' or 'minor') whose Krumhansl profile
+    correlates best with the 12-bin chroma."""
+    shifts = (np.arange(12)[None, :] - np.arange(12)[:, None]) % 12  # [tonic, pc]
+    profiles = np.concatenate([MAJOR_PROFILE[shifts], MINOR_PROFILE[shifts]])  # (24, 12)
+    p = profiles - profiles.mean(axis=1, keepdims=True)
+    c = np.asarray(chroma, dtype=np.float64) - np.mean(chroma)
+    denom = np.linalg.norm(p, axis=1) * np.linalg.norm(c)
+    corr = p @ c / np.where(denom > 0, denom, 1.0)
+    best = int(np.argmax(corr))
+    return best % 12, 'major' if best < 12 else 'minor'
+
+
+def scale_mask(key):
+    tonic, mode = key
+    return np.roll(MAJOR_SCALE if mode == 'major' else MINOR_SCALE, tonic)
+
+
+def _context_pitch(pitch):
+    """Median of the CONTEXT notes on either side of each note (itself
+    excluded); a lone note is its own context."""
+    padded = np.concatenate([np.full(CONTEXT, np.nan), pitch.astype(np.float64), np.full(CONTEXT, np.nan)])
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * CONTEXT + 1)
+    neighbours = np.delete(windows, CONTEXT, axis=1)  # a copy, safe to write
+    alone = np.isnan(neighbours).all(axis=1)
+    neighbours[alone] = pitch[alone, None]
+    return np.nanmedian(neighbours, axis=1)
+
+
+def correct_pitches(start, end, pitch, chords, key=None):
+    """Corrected pitch for every note, and the key that was used.
+
+    start/end are seconds, pitch MIDI numbers; chords is the chords.json
+    timeline. Notes before the first chord are only checked against the
+    key.
+    """
+    start = np.asarray(start, dtype=np.float64)
+    end = np.asarray(end, dtype=np.float64)
+    pitch = np.asarray(pitch, dtype=np.int64)
+    if key is None:
+        key = estimate_key(aggregate_chroma(start, end, pitch, chords))
+    if not len(pitch):
+        return pitch.copy(), key
+    in_key = scale_mask(key)
+
+    templates = np.vstack([np.zeros((1, 12)), chord_templates(chords)]) if chords else np.zeros((1, 12))
+    chord = active_chords(start, chords) + 1 if chords else np.zeros(len(pitch), dtype=np.int64)
+
+    cand = pitch[:, None] + OFFSETS[None, :]
+    pc = cand % 12
+    chord_fit = templates[chord[:, None], pc]
+    key_fit = in_key[pc]
+    leap = np.abs(cand - _context_pitch(pitch)[:, None])
+    score = (CHORD_WEIGHT * chord_fit + KEY_WEIGHT * key_fit
+             - LEAP_WEIGHT * np.maximum(leap - LEAP_FREE, 0) / 12.0 - CHANGE_COST[None, :])
+
+    # semitone moves only for notes outside the key, nothing out of range
+    allowed = np.ones_like(score, dtype=bool)
+    allowed[:, 3:] = ~in_key[pitch % 12][:, None]
+    allowed &= (cand >= 0) & (cand <= 127)
+    score = np.where(allowed, score, -np.inf)
+    return cand[np.arange(len(pitch)), np.argmax(score, axis=1)], key
+
+
+def correct_melody(midi_path, chords_path, output_filename):
+    """Apply correct_pitches to every instrument of a melody MIDI file."""
+    import pretty_midi
+
+    with open(chords_path) as f:
+        chords = json.load(f)
+    midi = pretty_midi.PrettyMIDI(str(midi_path))
+    changed = 0
+    for instrument in midi.instruments:
+        notes = instrument.notes
+        start = np.array([n.start for n in notes])
+        end = np.array([n.end for n in notes])
+        pitch = np.array([n.pitch for n in notes], dtype=np.int64)
+        fixed, key = correct_pitches(start, end, pitch, chords)
+        for n, p in zip(notes, fixed.tolist()):
+            n.pitch = p
+        changed += int(np.count_nonzero(fixed != pitch))
+        print(f"Key estimate: {ROOTS[key[0]]} {key[1]}")
+    midi.write(str(output_filename))
+    print(f"Pitch correction changed {changed} notes, saved {output_filename}")
+    return output_filename
@@ -0,0 +1,116 @@
+"""Monophonic f0 backends for extract_melody.
+
+Basic Pitch transcribes every note it hears and extract_melody then throws
+most of them away to get one line. A separated vocal stem is one voice
+already, so a single f0 track is enough and far cheaper:
+
+  1. preprocess_audio's bandpass and normalize, resampled to TRACK_SR;
+  2. f0 per hop: the vectorized YIN from yin.py ("yin"), or
+     librosa's probabilistic YIN with its Viterbi voicing ("pyin"; slower,
+     steadier on breathy or noisy stems);
+  3. voicing: YIN found a period and the hop around the frame centre is
+     above an energy gate;
+  4. notes: runs of frames on the same semitone. Runs shorter than
+     HOLD_FRAMES (vibrato crossing a semitone edge, dropouts) are given to
+     the run before them, and an energy jump starts a new note so repeated
+     pitches aren't merged.
+
+The notes land in a pretty_midi instrument like Basic Pitch's, and go
+through the same clean_melody_notes pass, so nothing downstream changes.
+
+bench_pitch_tracking.py compares speed and note accuracy with Basic Pitch
+on audio rendered from MIDI fixtures.
+"""
+import numpy as np
+
+from stage_2.melody_extraction import MIN_NOTE_LENGTH, clean_melody_notes, preprocess_audio
+from stage_2.yin import yin
+
+TRACK_SR = 22050
+FRAME_LENGTH = 1024     # 46 ms, two periods of the lowest note
+HOP_LENGTH = 256        # 11.6 ms
+CHUNK_FRAMES = 4096     # frames per yin() call, bounds memory on long songs
+FMIN, FMAX = 80.0, 880.0
+GATE_DB = -35.0         # below the loudest frame
+HOLD_FRAMES = 3
+ONSET_RATIO = 2.5       # rise in hop RMS over the quietest of the last
+ONSET_LAG = 3           # ONSET_LAG hops that starts a new note
+
+
+def frame_f0(y, sr, method="yin"):
+    """(f0 Hz with 0 where unvoiced, RMS) per hop of y.
+
+    The RMS is over the hop at each frame's centre rather than the whole
+    frame, so the short dip between two articulated notes still shows.
+    """
+    frames = np.lib.stride_tricks.sliding_window_view(y, FRAME_LENGTH)[::HOP_LENGTH]
+    first = FRAME_LENGTH // 2 - HOP_LENGTH // 2
+    hops = np.lib.stride_tricks.sliding_window_view(y[first:], HOP_LENGTH)[::HOP_LENGTH][:len(frames)]
+    rms = np.sqrt(np.mean(hops ** 2, axis=1))
+    if method == "pyin":
+        import librosa
+
+        f0, voiced, _ = librosa.pyin(y, fmin=FMIN, fmax=FMAX, sr=sr, frame_length=FRAME_LENGTH,
+                                     hop_length=HOP_LENGTH, center=False)
+        f0 = np.where(voiced, np.nan_to_num(f0), 0.0)[:len(frames)]
+    else:
+        f0 = np.concatenate([yin(frames[i:i + CHUNK_FRAMES], sr, FMIN, FMAX)[0]
+                             for i in range(0, len(frames), CHUNK_FRAMES)] or [np.zeros(0)])
+    return f0, rms
+
+
+def _runs(values):
+    """(starts, lengths) of runs of equal values."""
+    starts = np.flatnonzero(np.concatenate([[True], values[1:] != values[:-1]])) if len(values) else np.zeros(0, int)
+    return starts, np.diff(np.append(starts, len(values)))
+
+
+def segment_notes(f0, rms, sr, hop=HOP_LENGTH):
+    """(start s, end s, midi pitch) of the notes in an f0 track."""
+    voiced = (f0 > 0) & (rms > 10 ** (GATE_DB / 20) * (rms.max() if len(rms) else 0.0))
+    pitch = np.where(voiced, np.round(69 + 12 * np.log2(np.maximum(f0, 1e-6) / 440.0)), -1).astype(np.int64)
+
+    # short runs belong to the run before them
+    starts, lengths = _runs(pitch)
+    for s, n in zip(starts.tolist(), lengths.tolist()):
+        if n < HOLD_FRAMES and s > 0:
+            pitch[s:s + n] = pitch[s - 1]
+
+    quietest = np.full(len(rms), np.inf)
+    for lag in range(1, ONSET_LAG + 1):
+        quietest[lag:] = np.minimum(quietest[lag:], rms[:-lag])
+    onset = voiced & (rms > ONSET_RATIO * quietest)
+    # a new note id wherever the pitch changes or the energy jumps
+    note_id = np.cumsum(np.concatenate([[True], pitch[1:] != pitch[:-1]]) | onset)
+    starts, lengths = _runs(note_id)
+    keep = pitch[starts] >= 0
+    # frame i covers [i * hop, i * hop + FRAME_LENGTH); times are frame centres
+    t0 = (starts[keep] * hop + FRAME_LENGTH / 2) / sr
+    t1 = ((starts[keep] + lengths[keep]) * hop + FRAME_LENGTH / 2) / sr
+    long_enough = t1 - t0 > MIN_NOTE_LENGTH
+    return list(zip(t0[long_enough].tolist(), t1[long_enough].tolist(), pitch[starts[keep]][long_enough].tolist()))
+
+
+def track_notes(filtered, sr, method="yin"):
+    """(start s, end s, pitch) notes of audio that has been through
+    preprocess_audio already."""
+    import librosa
+
+    if sr != TRACK_SR:
+        filtered = librosa.resample(filtered, orig_sr=sr, target_sr=TRACK_SR)
+    if len(filtered) < FRAME_LENGTH:
+        filtered = np.pad(filtered, (0, FRAME_LENGTH - len(filtered)))
+    f0, rms = frame_f0(filtered, TRACK_SR, method)
+    return segment_notes(f0, rms, TRACK_SR)
+
+
+def track_melody(y, sr, method="yin", bpm=120):
+    """pretty_midi.PrettyMIDI holding the melody of y as one instrument."""
+    import pretty_midi
+
+    midi = pretty_midi.PrettyMIDI(initial_tempo=bpm)
+    instrument = pretty_midi.Instrument(program=0)
+    instrument.notes = clean_melody_notes([pretty_midi.Note(velocity=100, pitch=p, start=s, end=e)
+                                           for s, e, p in track_notes(preprocess_audio(y, sr), sr, method)])
+    midi.instruments.append(instrument)
+    return midi
@@ -0,0 +1,136 @@
+"""One spectral front end per stem, shared by every stage 2 analysis.
+
+extract_chords used to run librosa.effects.harmonic (an STFT, HPSS and an
+inverse STFT), then chroma_cqt (a tuning estimate with its own STFT, then
+a CQT of the resynthesized signal), and the activity gate took another
+STFT on top. Spectrum takes one STFT per stem and derives the rest:
+
+    RMS, dB flux        the activity gate
+    tuning              piptrack on the STFT, for the CQT
+    harmonic mask       HPSS on the STFT, only up to the top of the CQT
+    chroma              one CQT of the masked STFT, resynthesized; a 2048
+                        point STFT can't tell semitones apart in the bass,
+                        so chords are still read from a CQT
+
+Everything is computed on first use and memoized per parameter set, so
+the gate, the chord pass and anything added later share the work. The
+harmonic mask, harmonic part and chroma take a frame range: the median
+filters are the expensive part and only need to run over the active
+regions.
+
+bench_spectral.py times the old chord pass against this one.
+"""
+import numpy as np
+
+N_FFT = 2048
+HOP_LENGTH = 512
+BINS_PER_OCTAVE = 36    # chroma_cqt's defaults
+N_OCTAVES = 7
+HPSS_KERNEL = 31        # librosa.effects.harmonic's default
+CQT_MARGIN = 1.1        # HPSS covers bins this far over the top CQT bin
+
+
+class Spectrum:
+    """The STFT of a mono signal y and the features derived from it.
+    Frames are centred on multiples of hop_length."""
+
+    def __init__(self, y, sr, n_fft=N_FFT, hop_length=HOP_LENGTH):
+        self.y = np.asarray(y, dtype=np.float32)
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self._cache = {}
+
+    def _memo(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    @property
+    def n_frames(self):
+        return 1 + len(self.y) // self.hop_length
+
+    def frame_times(self, frames):
+        return np.asarray(frames) * self.hop_length / self.sr
+
+    def stft(self):
+        import librosa
+
+        return self._memo(("stft",), lambda: librosa.stft(self.y, n_fft=self.n_fft, hop_length=self.hop_length))
+
+    def magnitude(self):
+        return self._memo(("magnitude",), lambda: np.abs(self.stft()))
+
+    def rms(self):
+        import librosa
+
+        return self._memo(("rms",), lambda: librosa.feature.rms(S=self.magnitude(), frame_length=self.n_fft)[0])
+
+    def rms_db(self):
+        """RMS per frame in dB below the loudest frame."""
+        import librosa
+
+        return self._memo(("rms_db",), lambda: librosa.amplitude_to_db(self.rms(), ref=np.max, top_db=None))
+
+    def flux_db(self, floor_db):
+        """Positive spectral flux per frame, summed in dB over bins clamped
+        to floor_db below the loudest bin."""
+        import librosa
+
+        def compute():
+            spec_db = np.maximum(librosa.amplitude_to_db(self.magnitude(), ref=np.max, top_db=None), floor_db)
+            return np.concatenate([[0.0], np.maximum(np.diff(spec_db, axis=1), 0).sum(axis=0)])
+        return self._memo(("flux_db", floor_db), compute)
+
+    def tuning(self):
+        """Deviation from A440 in fractions of a CQT bin, as chroma_cqt
+        would estimate it."""
+        import librosa
+
+        return self._memo(("tuning",), lambda: float(librosa.estimate_tuning(
+            S=self.magnitude(), sr=self.sr, n_fft=self.n_fft, bins_per_octave=BINS_PER_OCTAVE)))
+
+    def harmonic_mask(self, start=0, stop=None, kernel_size=HPSS_KERNEL):
+        """Soft HPSS harmonic mask of the STFT over frames [start, stop).
+        Bins above the top of the chroma CQT are left at 0: the median
+        filters are most of the cost and chroma never looks there."""
+        import librosa
+
+        stop = self.n_frames if stop is None else stop
+
+        def compute():
+            top = librosa.cqt_frequencies(N_OCTAVES * BINS_PER_OCTAVE, fmin=librosa.note_to_hz("C1"),
+                                          bins_per_octave=BINS_PER_OCTAVE, tuning=self.tuning())[-1]
+            bins = int(np.searchsorted(librosa.fft_frequencies(sr=self.sr, n_fft=self.n_fft), top * CQT_MARGIN))
+            mask = np.zeros((1 + self.n_fft // 2, stop - start), dtype=np.float32)
+            mask[:bins], _ = librosa.decompose.hpss(self.magnitude()[:bins, start:stop],
+                                                    kernel_size=kernel_size, mask=True)
+            return mask
+        return self._memo(("harmonic_mask", start, stop, kernel_size), compute)
+
+    def harmonic(self, start=0, stop=None):
+        """The harmonic part of y over frames [start, stop), resynthesized
+        from the masked STFT; sample 0 is at frame start."""
+        import librosa
+
+        stop = self.n_frames if stop is None else stop
+        length = min((stop - start) * self.hop_length, len(self.y) - start * self.hop_length)
+        return self._memo(("harmonic", start, stop), lambda: librosa.istft(
+            self.stft()[:, start:stop] * self.harmonic_mask(start, stop), hop_length=self.hop_length,
+            n_fft=self.n_fft, length=max(length, 1)))
+
+    def chroma(self, start=0, stop=None):
+        """(12, stop - start) chroma of the harmonic part, from one CQT at
+        the estimated tuning (chroma_cqt's defaults otherwise)."""
+        import librosa
+
+        stop = self.n_frames if stop is None else stop
+
+        def compute():
+            cqt = librosa.cqt(self.harmonic(start, stop), sr=self.sr, hop_length=self.hop_length,
+                              n_bins=N_OCTAVES * BINS_PER_OCTAVE, bins_per_octave=BINS_PER_OCTAVE,
+                              tuning=self.tuning())
+            chroma = librosa.feature.chroma_cqt(C=np.abs(cqt), sr=self.sr, bins_per_octave=BINS_PER_OCTAVE)
+            # the CQT of [start, stop) can be a frame short or long at the end
+            return np.pad(chroma, ((0, 0), (0, max(0, stop - start - chroma.shape[1]))), mode="edge")[:, :stop - start]
+        return self._memo(("chroma", start, stop), compute)
@@ -0,0 +1,232 @@
+"""Streaming melody transcription for live audio.
+
+extract_melody() needs the whole file before basic_pitch can run. Here
+audio is pushed in small blocks instead:
+
+  1. the same bandpass as preprocess_audio, run with persistent filter
+     state (sosfilt zi) so block boundaries don't click;
+  2. YIN pitch per hop over the newest frame, plus an energy gate and an
+     energy-jump onset for repeated notes;
+  3. a note tracker that commits a pitch once it has held for a few hops
+     and ends it when the pitch changes or the voice stops;
+  4. extract_melody's ghost-note check against the notes emitted in the
+     last `window` seconds and its minimum note length (the tracker is
+     monophonic already);
+  5. the stage 3 quantizer, so every emitted note carries its snapped
+     onset and duration in beats.
+
+A note is emitted about half a frame plus a hop or two after it ends
+(under 100 ms at 44.1 kHz with the defaults, see bench_streaming); `sounding` reports the note being
+held so a live score can draw it before it is finished.
+
+Usage: python -m stage_2.streaming song.wav [--bpm 120] [--realtime]
+"""
+import os
+import sys
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from stage_2.melody_extraction import MIN_NOTE_LENGTH, is_ghost
+from stage_2.yin import BandpassStream, yin
+
+DIVISION = 480
+STAGE_3 = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'stage_3')
+
+
+def stage_3_quantizer():
+    """(NoteArrays, quantize_notes) from stage 3, whose modules import each
+    other by bare name. Loaded on demand, not when this module is imported."""
+    if STAGE_3 not in sys.path:
+        sys.path.insert(0, STAGE_3)
+    from notepairs import NoteArrays
+    from rhythmic_quantization import quantize_notes
+
+    return NoteArrays, quantize_notes
+
+
+@dataclass
+class StreamNote:
+    start: float        # seconds since the stream started
+    end: float
+    pitch: int
+    beat: float         # quantized onset, in beats
+    beats: float        # quantized duration, in beats
+    emitted_at: float   # stream time when the note was emitted
+    velocity: int = 100
+
+
+class StreamingTranscriber:
+    """Turn pushed audio blocks into quantized melody notes.
+
+    push() returns the notes that finished in that block, flush() ends the
+    stream and returns whatever was still sounding.
+    """
+
+    def __init__(self, sr, bpm=120, frame_length=2048, hop_length=512,
+                 hold_frames=3, gate_db=-35.0, onset_ratio=2.5, window=2.0,
+                 lowcut=80.0, highcut=880.0):
+        self.sr = sr
+        self.bpm = bpm
+        self.frame_length = frame_length
+        self.hop_length = hop_length
+        self.hold_frames = hold_frames
+        self.gate = 10 ** (gate_db / 20)
+        self.onset_ratio = onset_ratio
+        self.window = window
+        self.fmin, self.fmax = lowcut, highcut
+        self.bandpass = BandpassStream(sr, lowcut, highcut)
+        self._quantizer = stage_3_quantizer()  # here, so no block pays for the import
+
+        self._buf = np.zeros(0)
+        self._buf_start = 0       # stream sample index of _buf[0]
+        self._next_frame = 0      # stream sample index of the next frame
+        self._received = 0
+        self._peak = 0.0          # running peak, stands in for normalize()
+        self._prev_rms = 0.0
+
+        self._note = None         # (pitch, start) of the sounding note
+        self._candidate = None    # (pitch, start, frames held)
+        self._recent = []         # emitted notes inside the ghost window
+
+    @property
+    def now(self):
+        return self._received / self.sr
+
+    @property
+    def sounding(self):
+        """(pitch, start) of the note being held, or None."""
+        return self._note
+
+    def push(self, block):
+        block = np.asarray(block, dtype=np.float64)
+        if block.ndim > 1:
+            block = block.mean(axis=1)
+        self._received += len(block)
+        filtered = self.bandpass.process(block)
+        if len(filtered):
+            self._peak = max(self._peak, float(np.max(np.abs(filtered))))
+        self._buf = np.concatenate([self._buf, filtered])
+
+        end = self._buf_start + len(self._buf)
+        n_frames = max(0, (end - self._next_frame - self.frame_length) // self.hop_length + 1)
+        emitted = []
+        if n_frames:
+            offset = self._next_frame - self._buf_start
+            frames = np.lib.stride_tricks.sliding_window_view(
+                self._buf[offset:], self.frame_length)[::self.hop_length][:n_frames]
+            f0, aperiodicity = yin(frames, self.sr, self.fmin, self.fmax)
+            rms = np.sqrt(np.mean(frames ** 2, axis=1))
+            for i in range(n_frames):
+                t = (self._next_frame + i * self.hop_length + self.frame_length / 2) / self.sr
+                emitted.extend(self._step(t, f0[i], rms[i]))
+            self._next_frame += n_frames * self.hop_length
+
+        # keep only what the next frame needs
+        drop = self._next_frame - self._buf_start
+        if drop > 0:
+            self._buf = self._buf[drop:]
+            self._buf_start += drop
+        return emitted
+
+    def flush(self):
+        if self._note is None:
+            return []
+        return self._finish(self.now)
+
+    def _step(self, t, f0, rms):
+        voiced = f0 > 0 and rms > self.gate * self._peak
+        pitch = int(round(69 + 12 * np.log2(f0 / 440.0))) if voiced else None
+        onset = voiced and self._prev_rms > 0 and rms > self.onset_ratio * self._prev_rms
+        self._prev_rms = rms
+
+        out = []
+        if pitch is None:
+            self._candidate = None
+            if self._note is not None:
+                out = self._finish(t)
+            return out
+
+        if onset or self._candidate is None or self._candidate[0] != pitch:
+            if self._note is not None and pitch == self._note[0] and not onset:
+                self._candidate = None  # still the same note
+                return out
+            self._candidate = (pitch, t, 1)
+        else:
+            self._candidate = (pitch, self._candidate[1], self._candidate[2] + 1)
+        if self._candidate[2] >= self.hold_frames:
+            pitch, start, _ = self._candidate
+            if self._note is not None:
+                out = self._finish(start)
+            self._note = (pitch, start)
+            self._candidate = None
+        return out
+
+    def _finish(self, end):
+        pitch, start = self._note
+        self._note = None
+        if end <= start + MIN_NOTE_LENGTH:
+            return []
+        self._recent = [n for n in self._recent if n.start > start - self.window]
+        note = StreamNote(start, end, pitch, 0.0, 0.0, self.now)
+        if is_ghost(note, self._recent):
+            return []
+        self._quantize(note)
+        self._recent.append(note)
+        return [note]
+
+    def _quantize(self, note):
+        NoteArrays, quantize_notes = self._quantizer
+        ticks_per_second = self.bpm / 60.0 * DIVISION
+        one = np.ones(1, dtype=np.int64)
+        q = quantize_notes(NoteArrays(
+            onset=np.array([note.start * ticks_per_second]),
+            duration=np.array([(note.end - note.start) * ticks_per_second]),
+            pitch=one * note.pitch, channel=one * 0, velocity=one * note.velocity),
+            DIVISION)
+        note.beat = q.onset[0] / DIVISION
+        note.beats = q.duration[0] / DIVISION
+
+
+def wav_blocks(path, block_size=512, realtime=False):
+    """Blocks of a WAV file, paced at playback speed if realtime is set,
+    as a stand-in for a live input."""
+    import soundfile as sf
+
+    start = time.perf_counter()
+    sent = 0
+    with sf.SoundFile(path) as f:
+        for block in f.blocks(blocksize=block_size, dtype='float64'):
+            if realtime:
+                time.sleep(max(0.0, start + sent / f.samplerate - time.perf_counter()))
+            sent += len(block)
+            yield block
+
+
+def stream_file(path, bpm=120, block_size=512, realtime=False):
+    import soundfile as sf
+
+    transcriber = StreamingTranscriber(sf.info(path).samplerate, bpm)
+    notes = []
+    for block in wav_blocks(path, block_size, realtime):
+        for note in transcriber.push(block):
+            print(f"{note.start:8.2f}s  pitch {note.pitch:3d}  "
+                  f"beat {note.beat:7.2f}  {note.beats:.2f} beats  "
+                  f"(+{(note.emitted_at - note.end) * 1000:.0f} ms)")
+            notes.append(note)
+    notes.extend(transcriber.flush())
+    return notes
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Stream a WAV file through live melody transcription")
+    parser.add_argument("path")
+    parser.add_argument("--bpm", type=float, default=120)
+    parser.add_argument("--block-size", type=int, default=512)
+    parser.add_argument("--realtime", action="store_true",
+                        help="feed blocks at playback speed, like a live input")
+    args = parser.parse_args()
+    stream_file(args.path, args.bpm, args.block_size, args.realtime)
@@ -0,0 +1,45 @@
+import numpy as np
+import pretty_midi
+import soundfile as sf
+
+from stage_2.activity import PAD, active_regions
+from stage_2.melody_extraction import extract_chords, extract_melody
+from stage_2.spectral import Spectrum
+from stage_2.test_pitch_tracking import MELODY, render
+
+SR = 22050
+
+
+def test_regions_skip_silence_and_bleed():
+    rng = np.random.default_rng(0)
+    y = 0.003 * rng.standard_normal(10 * SR)  # bleed, ~37 dB down
+    tt = np.arange(2 * SR) / SR
+    y[2 * SR:4 * SR] += 0.3 * np.sin(2 * np.pi * 220 * tt)
+    y[7 * SR:9 * SR] += 0.3 * np.sin(2 * np.pi * 330 * tt)
+    regions = active_regions(Spectrum(y, SR))
+    assert regions.shape == (2, 2)
+    assert np.allclose(regions, [[2 - PAD, 4 + PAD], [7 - PAD, 9 + PAD]], atol=0.1)
+    assert len(active_regions(Spectrum(np.zeros(SR), SR))) == 0
+
+
+def test_gated_melody_keeps_absolute_times(tmp_path):
+    sung = render(MELODY, SR)
+    y = np.zeros(5 * SR + len(sung))
+    y[5 * SR:] = sung
+    path = str(tmp_path / "vocals.wav")
+    sf.write(path, y, SR)
+    out = extract_melody(path, str(tmp_path / "melody.mid"), backend="yin", gate=True)
+    notes = pretty_midi.PrettyMIDI(out).instruments[0].notes
+    assert [n.pitch for n in notes] == [p for _, _, p in MELODY]
+    for (start, _, _), n in zip(MELODY, notes):
+        assert abs(n.start - (start + 5)) < 0.05
+
+
+def test_chords_are_only_gated_on_request(tmp_path):
+    tt = np.arange(2 * SR) / SR
+    triad = sum(np.sin(2 * np.pi * f * tt) for f in (261.63, 329.63, 392.0))
+    y = np.concatenate([0.2 * triad, np.zeros(3 * SR), 0.2 * triad])
+    path = str(tmp_path / "accompaniment.wav")
+    sf.write(path, y, SR)
+    assert "N" not in [c["chord"] for c in extract_chords(path)]
+    assert "N" in [c["chord"] for c in extract_chords(path, gate=True)]
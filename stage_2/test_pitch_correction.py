@@ -0,0 +1,28 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from pitch_correction import active_chords, aggregate_chroma, correct_pitches, estimate_key
+
+CHORDS = [{"time": 0.0, "chord": "C Maj"}, {"time": 2.0, "chord": "F Maj"},
+          {"time": 4.0, "chord": "G Maj"}, {"time": 6.0, "chord": "C Maj"}]
+
+
+def test_active_chord_and_key():
+    assert active_chords(np.array([-0.5, 0.0, 1.9, 2.0, 7.5]), CHORDS).tolist() == [-1, 0, 0, 1, 3]
+    melody = np.array([60, 64, 67, 65, 69, 72, 67, 71, 74, 72])
+    start = np.arange(len(melody)) * 0.8
+    assert estimate_key(aggregate_chroma(start, start + 0.7, melody, CHORDS)) == (0, 'major')
+
+
+def test_octave_jump_and_out_of_key_note_are_fixed():
+    #             C   E   G   G+12 E   C#  E   D   C
+    pitch = np.array([60, 64, 67, 79, 64, 61, 64, 62, 60])
+    start = np.array([0.0, 0.25, 0.5, 0.75, 1.0, 1.25, 1.5, 6.0, 6.5])
+    fixed, key = correct_pitches(start, start + 0.2, pitch, CHORDS, key=(0, 'major'))
+    # the lone octave jump comes down, C# over a C chord becomes C, and the
+    # in-key passing D is left alone
+    assert fixed.tolist() == [60, 64, 67, 67, 64, 60, 64, 62, 60]
@@ -0,0 +1,26 @@
+import numpy as np
+
+from stage_2.pitch_tracking import TRACK_SR, track_melody
+
+# (start, end, pitch); the two 64s are back to back and must stay two notes
+MELODY = [(0.1, 0.5, 60), (0.5, 0.9, 64), (0.9, 1.3, 64), (1.5, 2.1, 67)]
+
+
+def render(notes, sr=TRACK_SR):
+    audio = np.zeros(int((notes[-1][1] + 0.3) * sr))
+    for start, end, pitch in notes:
+        i0, i1 = int(start * sr), int(end * sr)
+        tt = np.arange(i1 - i0) / sr
+        f0 = 440.0 * 2 ** ((pitch - 69) / 12) * (1 + 0.005 * np.sin(2 * np.pi * 5.5 * tt))
+        phase = 2 * np.pi * np.cumsum(f0) / sr
+        env = np.minimum(1.0, tt / 0.02) * np.minimum(1.0, tt[::-1] / 0.02)
+        audio[i0:i1] += 0.3 * env * sum(np.sin(k * phase) / k for k in range(1, 5))
+    return audio
+
+
+def test_yin_backend_finds_notes_and_repeated_pitch():
+    midi = track_melody(render(MELODY), TRACK_SR, "yin")
+    notes = [(n.start, n.end, n.pitch) for n in midi.instruments[0].notes]
+    assert [p for _, _, p in notes] == [p for _, _, p in MELODY]
+    for (start, end, _), (s, e, _) in zip(MELODY, notes):
+        assert abs(s - start) < 0.05 and abs(e - end) < 0.06
@@ -0,0 +1,26 @@
+import numpy as np
+
+from stage_2.spectral import Spectrum
+
+SR = 22050
+
+
+def triad(seconds, sr=SR):
+    tt = np.arange(int(seconds * sr)) / sr
+    # C major over a C bass
+    return sum(0.2 * np.sin(2 * np.pi * 440.0 * 2 ** ((p - 69) / 12) * tt) for p in (36, 60, 64, 67))
+
+
+def test_features_are_memoized_and_share_the_stft():
+    spectrum = Spectrum(triad(2.0), SR)
+    stft = spectrum.stft()
+    assert spectrum.rms_db() is spectrum.rms_db()
+    assert spectrum.chroma() is spectrum.chroma()
+    assert spectrum.stft() is stft
+    assert spectrum.chroma().shape == (12, spectrum.n_frames)
+    assert spectrum.chroma(10, 30).shape == (12, 20)
+
+
+def test_chroma_of_a_triad():
+    chroma = Spectrum(triad(2.0), SR).chroma().mean(axis=1)
+    assert set(np.argsort(chroma)[-3:]) == {0, 4, 7}
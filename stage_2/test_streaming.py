@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+from scipy.signal import sosfilt
+
+from stage_2.bench_streaming import BLOCK, MELODY, SR, synthesize
+from stage_2.streaming import StreamingTranscriber
+from stage_2.yin import BandpassStream
+
+
+def test_bandpass_state_carries_across_blocks():
+    x = np.random.default_rng(0).standard_normal(SR)
+    stream = BandpassStream(SR)
+    # uneven blocks, including an empty one
+    bounds = [0, 1, 513, 513, 4000, 30000, SR]
+    streamed = np.concatenate([stream.process(x[a:b]) for a, b in zip(bounds[:-1], bounds[1:])])
+    assert np.allclose(streamed, sosfilt(stream.sos, x), atol=1e-10)
+
+
+def transcribe(audio):
+    transcriber = StreamingTranscriber(SR, bpm=120)
+    notes = []
+    for i in range(0, len(audio), BLOCK):
+        notes.extend(transcriber.push(audio[i:i + BLOCK]))
+    last = transcriber.flush()
+    return notes, last
+
+
+def test_melody_notes_and_emit_latency():
+    audio, truth = synthesize(MELODY[:16])
+    notes, last = transcribe(audio)
+    everything = notes + last
+
+    hits = 0
+    for t0, t1, pitch in truth:
+        found = [n for n in everything if n.pitch == pitch and abs(n.start - t0) < 0.06]
+        hits += bool(found)
+        if found and found[0] in notes:
+            # the module docstring's promise: out within 100 ms of the end
+            assert 0 <= found[0].emitted_at - t1 < 0.1
+    assert hits >= len(truth) - 1
+    assert len(everything) <= len(truth) + 1
+
+    # quantized to the beat grid at 120 bpm: the first note (0.5 s less
+    # the articulation gap) is a quarter on beat 0
+    first = everything[0]
+    assert (first.pitch, first.beat, first.beats) == (60, 0.0, 1.0)
+
+
+def test_importing_stage_2_leaves_stage_3_alone():
+    code = ("import sys; before = list(sys.path)\n"
+            "import stage_2.pitch_tracking, stage_2.streaming\n"
+            "assert sys.path == before\n"
+            "assert 'rhythmic_quantization' not in sys.modules\n")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", code], cwd=root, check=True)
@@ -1,39 +1,38 @@
-import pretty_midi
-
-def verify_midi(file_path):
-    try:
-        pm = pretty_midi.PrettyMIDI(file_path)
-        print(f"✅ File Loaded: {file_path}")
-        print(f"Duration: {pm.get_end_time():.2f} seconds")
-        
-        for i, instrument in enumerate(pm.instruments):
-            print(f"\nInstrument {i}: {instrument.name}")
-            print(f"Number of notes: {len(instrument.notes)}")
-            note = 0
-            for note in range(len(instrument.notes)):
-                # Check the first note for duration
-                n = instrument.notes[note]
-                duration = n.end - n.start
-                print(f"Sample Note: Pitch={n.pitch}, Start={n.start:.2f}s, Duration={duration:.2f}s")
-                
-                if duration <= 0:
-                    print("WARNING: Note has zero or negative duration!")
-            else:
-                print("WARNING: This instrument has no notes!")
-                
-    except Exception as e:
-        print(f"Corrupt File: {e}")
-
-verify_midi('melody.mid')
-import pygame
-
-def play_midi_simple(file_path):
-    pygame.mixer.init()
-    pygame.mixer.music.load(file_path)
-    pygame.mixer.music.play()
-    
-    print(f"Playing {file_path}... Press Ctrl+C to stop.")
-    while pygame.mixer.music.get_busy():
-        pygame.time.Clock().tick(10)
-
-play_midi_simple('melody.mid')
\ No newline at end of file
+import json
+import os
+import sys
+
+# the stage 3 modules import each other by bare name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'stage_3'))
+
+from validate_midi import validate_file, validate_paths
+
+
+def verify_midi(file_path, monophonic=True):
+    """Check a stage 2 melody MIDI and print the report as JSON.
+
+    Stage 2 output is monophonic, so overlapping notes count as problems.
+    Returns True if the file passed every check.
+    """
+    report = validate_file(file_path, monophonic)
+    print(json.dumps(report, indent=2))
+    if not report['ok']:
+        failed = {k: v for k, v in report['problems'].items() if v}
+        print(f"WARNING: {file_path} failed validation: {failed}")
+    return report['ok']
+
+
+def verify_dir(dir_path, monophonic=True, workers=None):
+    """Validate every MIDI file under dir_path in parallel."""
+    reports = validate_paths([dir_path], monophonic, workers)
+    return all(r['ok'] for r in reports), reports
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else 'melody.mid'
+    if os.path.isdir(path):
+        ok, reports = verify_dir(path)
+        print(json.dumps(reports, indent=2))
+    else:
+        ok = verify_midi(path)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,67 @@
+"""YIN pitch tracking and a block-at-a-time bandpass.
+
+Shared by the streaming transcriber and the yin backend of pitch_tracking;
+kept apart from streaming.py so the latter's stage 3 quantizer isn't
+loaded by code that only needs f0.
+"""
+import numpy as np
+
+from stage_2.melody_extraction import bandpass_sos
+
+
+class BandpassStream:
+    """preprocess_audio's bandpass, one block at a time."""
+
+    def __init__(self, sr, lowcut=80.0, highcut=880.0):
+        self.sos = bandpass_sos(sr, lowcut, highcut)
+        self.zi = np.zeros((self.sos.shape[0], 2))
+
+    def process(self, block):
+        from scipy.signal import sosfilt
+
+        if not len(block):
+            return np.zeros(0)  # sosfilt can't take an empty block with zi
+        out, self.zi = sosfilt(self.sos, block, zi=self.zi)
+        return out
+
+
+def yin(frames, sr, fmin=80.0, fmax=880.0, threshold=0.15):
+    """YIN pitch of every row of frames.
+
+    Returns (f0, aperiodicity): f0 is 0 where no lag dips under threshold.
+    """
+    n_frames, width = frames.shape
+    tau_min = max(1, int(sr / fmax))
+    tau_max = min(int(sr / fmin) + 1, width // 2)
+    win = width - tau_max
+
+    # d(tau) = sum_j (x_j - x_{j+tau})^2 over the first win samples,
+    # expanded into energies and an FFT cross-correlation
+    n_fft = 1 << int(np.ceil(np.log2(width + win)))
+    spec = np.fft.rfft(frames, n_fft)
+    head = np.fft.rfft(frames[:, :win], n_fft)
+    corr = np.fft.irfft(spec * np.conj(head), n_fft)[:, :tau_max + 1]
+    sq = np.concatenate([np.zeros((n_frames, 1)), np.cumsum(frames ** 2, axis=1)], axis=1)
+    taus = np.arange(tau_max + 1)
+    energy = sq[:, taus + win] - sq[:, taus]
+    diff = energy[:, :1] + energy - 2 * corr
+    diff[:, 0] = 0
+
+    # cumulative mean normalized difference
+    cmnd = np.ones_like(diff)
+    running = np.cumsum(diff[:, 1:], axis=1)
+    cmnd[:, 1:] = diff[:, 1:] * taus[1:] / np.maximum(running, 1e-12)
+
+    f0 = np.zeros(n_frames)
+    aperiodicity = np.ones(n_frames)
+    below = cmnd[:, tau_min:tau_max] < threshold
+    for i in np.flatnonzero(below.any(axis=1)):
+        tau = tau_min + int(np.argmax(below[i]))
+        while tau + 1 < tau_max and cmnd[i, tau + 1] < cmnd[i, tau]:
+            tau += 1
+        # parabolic interpolation around the dip
+        a, b, c = cmnd[i, tau - 1], cmnd[i, tau], cmnd[i, min(tau + 1, tau_max)]
+        shift = 0.5 * (a - c) / (a - 2 * b + c) if a - 2 * b + c > 0 else 0.0
+        f0[i] = sr / (tau + shift)
+        aperiodicity[i] = b
+    return f0, aperiodicity
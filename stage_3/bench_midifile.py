@@ -0,0 +1,284 @@
+"""Differential check and throughput of MidiFile on random files.
+
+Every variant generates random MIDI files offline, then:
+
+1. MidiFile.read and reference_midi.decode (a plain byte-at-a-time
+   decoder) must agree on every event, the tempo map, the division, how
+   each track ended and how many bytes were read, or raise the same
+   exception;
+2. MidiFile.write of what was read must decode to
+   reference_midi.after_write() of it, and reading and writing that again
+   must give the same bytes, in both plain and compact mode.
+
+The variants:
+
+    notes           every channel message, a status byte on each
+    running         the same with running status, also across meta events
+    long vlq        deltas up to 2^28, lengths over 127, padded VLQs
+    meta/sysex      text, tempo, time and key signatures, 0xf0/0xf7
+    system bytes    0xf1-0xfe before status bytes, a status in the second
+                    data byte, data with no status yet, bytes after EOT
+    format 0        one track of everything, SMPTE divisions, a longer MThd
+    format 1        eight tracks of everything
+    malformed       the above truncated, with bytes changed, inserted or
+                    dropped, or with a track of random bytes
+
+and the table shows parse and write throughput for each (MB/s of file,
+and million events/s for the parse). Speed work on midifile.py should
+keep the mismatch column at 0.
+
+Usage: python stage_3/bench_midifile.py [files_per_variant] [events_per_track]
+"""
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from midifile import MidiFile
+from reference_midi import after_write, decode, midifile_state
+
+CHANNEL_KINDS = [0x80, 0x90, 0xa0, 0xb0, 0xc0, 0xd0, 0xe0]
+SYSTEM_BYTES = [b for b in range(0xf1, 0xff) if b != 0xf7]
+TEXT_METAS = [0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x7f]
+
+VARIANTS = {
+    'notes': {},
+    'running': {'running': 0.9, 'meta': 0.05},
+    'long vlq': {'running': 0.5, 'long_vlq': 0.5, 'meta': 0.1, 'sysex': 0.05},
+    'meta/sysex': {'running': 0.5, 'meta': 0.3, 'sysex': 0.2},
+    'system bytes': {'running': 0.5, 'meta': 0.05, 'system': 0.2, 'quirks': 0.05, 'trailing': 0.5},
+    'format 0': {'running': 0.5, 'meta': 0.1, 'sysex': 0.05, 'long_vlq': 0.1, 'system': 0.05,
+                 'quirks': 0.02, 'format': 0},
+    'format 1': {'running': 0.5, 'meta': 0.1, 'sysex': 0.05, 'long_vlq': 0.1, 'system': 0.05,
+                 'quirks': 0.02, 'tracks': 8},
+}
+MALFORMED = 'malformed'
+
+
+def vlq(value, pad=0):
+    """VLQ of value, with pad extra leading 0x80 bytes (legal, if wasteful)."""
+    groups = [value & 0x7f]
+    value >>= 7
+    while value:
+        groups.append(value & 0x7f)
+        value >>= 7
+    groups.extend([0] * pad)
+    return bytes([g | 0x80 for g in groups[:0:-1]] + [groups[0]])
+
+
+def random_track(rng, n, running=0.0, meta=0.0, sysex=0.0, long_vlq=0.0, system=0.0,
+                 quirks=0.0, trailing=0.0):
+    """MTrk body of n random events ending in EOT. The keyword arguments
+    are how often each feature turns up (see VARIANTS)."""
+    out = bytearray()
+    last = None  # the running status the parser will use
+    for _ in range(n):
+        if rng.random() < long_vlq:
+            out += vlq(int(rng.integers(0, 1 << int(rng.choice([7, 14, 21, 28])))), int(rng.integers(0, 4)))
+        else:
+            out += vlq(int(rng.integers(0, 200)))
+        r = rng.random()
+        if r < meta:
+            kind = int(rng.choice([0x51, 0x58, 0x59] + TEXT_METAS))
+            if kind == 0x51:
+                payload = int(rng.integers(100000, 2000000)).to_bytes(3, 'big')
+            elif kind == 0x58:
+                payload = bytes([int(rng.integers(1, 13)), int(rng.integers(1, 5)), 24, 8])
+            elif kind == 0x59:
+                payload = bytes([int(rng.integers(-7, 8)) & 0xff, int(rng.integers(0, 2))])
+            else:
+                size = int(rng.integers(0, 300 if rng.random() < long_vlq + 0.1 else 20))
+                payload = bytes(rng.integers(0x20, 0x7f, size).astype(np.uint8))
+            out += bytes([0xff, kind]) + vlq(len(payload)) + payload
+            continue
+        if r < meta + sysex:
+            payload = bytes(rng.integers(0, 0x80, int(rng.integers(0, 200))).astype(np.uint8))
+            st = 0xf0 if rng.random() < 0.7 else 0xf7
+            if st == 0xf0:
+                payload += b'\xf7'
+            out += bytes([st]) + vlq(len(payload)) + payload
+            continue
+        if rng.random() < system:
+            out += bytes(rng.choice(SYSTEM_BYTES, int(rng.integers(1, 3))).astype(np.uint8))
+        if rng.random() < quirks:
+            if last is None:
+                # a data byte before any status: an empty event
+                out.append(int(rng.integers(0, 0x80)))
+                continue
+            # a status in the second data byte becomes the running status
+            st = int(rng.choice([0x80, 0x90, 0xa0, 0xb0, 0xe0])) | int(rng.integers(0, 16))
+            last = int(rng.choice(CHANNEL_KINDS)) | int(rng.integers(0, 16))
+            out += bytes([st, int(rng.integers(0, 0x80)), last])
+            continue
+        if last is not None and rng.random() < running:
+            st = last
+        else:
+            st = int(rng.choice(CHANNEL_KINDS)) | int(rng.integers(0, 16))
+            out.append(st)
+            last = st
+        out += bytes(rng.integers(0, 0x80, 1 if st & 0xf0 in (0xc0, 0xd0) else 2).astype(np.uint8))
+    out += b'\x00\xff\x2f\x00'
+    if rng.random() < trailing:
+        out += bytes(rng.integers(0, 256, int(rng.integers(1, 8))).astype(np.uint8))
+    return bytes(out)
+
+
+def midi_file(tracks, fmt=1, division=480, header_extra=b''):
+    header = (b'MThd' + (6 + len(header_extra)).to_bytes(4, 'big') + fmt.to_bytes(2, 'big')
+              + len(tracks).to_bytes(2, 'big') + division.to_bytes(2, 'big') + header_extra)
+    return header + b''.join(b'MTrk' + len(t).to_bytes(4, 'big') + t for t in tracks)
+
+
+def random_file(rng, variant, events):
+    opts = dict(VARIANTS[variant])
+    fmt = opts.pop('format', 1)
+    ntracks = opts.pop('tracks', 1 if fmt == 0 else 2)
+    division, extra = 480, b''
+    if fmt == 0:
+        if rng.random() < 0.3:
+            # SMPTE: -24, -25, -29 or -30 fps and ticks per frame
+            division = ((0x100 - int(rng.choice([24, 25, 29, 30]))) << 8) | int(rng.integers(1, 256))
+        if rng.random() < 0.3:
+            extra = bytes(int(rng.integers(1, 5)))
+    return midi_file([random_track(rng, events, **opts) for _ in range(ntracks)], fmt, division, extra)
+
+
+def malformed_file(rng, events):
+    """A random file of one of the other variants, broken one way."""
+    data = bytearray(random_file(rng, str(rng.choice(list(VARIANTS))), events))
+    how = rng.integers(6)
+    if how == 0:
+        del data[int(rng.integers(len(data))):]
+    elif how == 1:
+        data[int(rng.integers(len(data)))] = int(rng.integers(256))
+    elif how == 2:
+        data.insert(int(rng.integers(len(data))), int(rng.integers(256)))
+    elif how == 3:
+        del data[int(rng.integers(len(data)))]
+    elif how == 4:
+        # a track of random bytes, mostly data with some status bytes, and
+        # a correct chunk length
+        body = rng.integers(0, 0x80, events * 3)
+        status = rng.random(len(body)) < 0.15
+        body[status] = rng.integers(0x80, 0x100, int(status.sum()))
+        ntracks = int.from_bytes(data[10:12], 'big')
+        data = bytearray(midi_file([bytes(body.astype(np.uint8))] * max(1, ntracks), 1))
+    else:
+        # the header: format 2, a short MThd, or no MThd
+        at, value = [(9, 2), (7, 5), (0, ord('X'))][int(rng.integers(3))]
+        data[at] = value
+    return bytes(data)
+
+
+def read(data):
+    mf = MidiFile()
+    mf.verbose = False
+    mf.read_from_file(io.BytesIO(data))
+    return mf
+
+
+def write(mf, compact=False):
+    out = io.BytesIO()
+    mf.write_to_file(out, compact)
+    return out.getvalue()
+
+
+def check(data):
+    """Differences between MidiFile and the reference for one file, as
+    strings; empty if they agree."""
+    try:
+        mf = read(data)
+        got = midifile_state(mf)
+    except (EOFError, ValueError, NotImplementedError, ZeroDivisionError) as e:
+        mf, got = None, ('error', type(e).__name__)
+    want = decode(data)
+    if got != want:
+        return [f'read: {_first_difference(got, want)}']
+    if mf is None:
+        return []
+
+    problems = []
+    written = write(mf)
+    got = decode(written)
+    if got != after_write(want):
+        problems.append(f'write: {_first_difference(got, after_write(want))}')
+    elif write(read(written)) != written:
+        problems.append('write: rewriting the written file changes it')
+    compact = write(mf, compact=True)
+    if write(read(compact), compact=True) != compact:
+        problems.append('compact write: rewriting the written file changes it')
+    return problems
+
+
+def _first_difference(got, want):
+    if got[0] != want[0] or got[0] == 'error':
+        return f'MidiFile {got[:2]}, reference {want[:2]}'
+    for name, a, b in zip(('format', 'division', 'tempo map', 'bytes read'), got[1:5], want[1:5]):
+        if a != b:
+            return f'{name}: MidiFile {a}, reference {b}'
+    if len(got[5]) != len(want[5]):
+        return f'tracks: MidiFile {len(got[5])}, reference {len(want[5])}'
+    for i, ((rows, eot, unread), (ref_rows, ref_eot, ref_unread)) in enumerate(zip(got[5], want[5])):
+        for j, (row, ref) in enumerate(zip(rows, ref_rows)):
+            if row != ref:
+                return f'track {i} row {j}: MidiFile {row}, reference {ref}'
+        if len(rows) != len(ref_rows):
+            return f'track {i}: MidiFile {len(rows)} rows, reference {len(ref_rows)}'
+        if (eot, unread) != (ref_eot, ref_unread):
+            return f'track {i} end: MidiFile {(eot, unread)}, reference {(ref_eot, ref_unread)}'
+    return 'same'
+
+
+def generate(variant, files, events, seed=0):
+    rng = np.random.default_rng([seed, list(VARIANTS).index(variant) if variant in VARIANTS else len(VARIANTS)])
+    if variant == MALFORMED:
+        return [malformed_file(rng, events) for _ in range(files)]
+    return [random_file(rng, variant, events) for _ in range(files)]
+
+
+def throughput(corpus):
+    """(read MB/s, read million events/s, write MB/s, compact write MB/s)."""
+    size = sum(len(d) for d in corpus)
+    start = time.perf_counter()
+    files = [read(d) for d in corpus]
+    t_read = time.perf_counter() - start
+    nevents = sum(len(t) for mf in files for t in mf._tracks)
+    start = time.perf_counter()
+    written = sum(len(write(mf)) for mf in files)
+    t_write = time.perf_counter() - start
+    start = time.perf_counter()
+    compact = sum(len(write(mf, compact=True)) for mf in files)
+    t_compact = time.perf_counter() - start
+    return size / t_read / 1e6, nevents / t_read / 1e6, written / t_write / 1e6, compact / t_compact / 1e6
+
+
+def main():
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    events = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    print(f'{files} files per variant, {events} events per track\n')
+    print(f"{'variant':>13} {'MB':>6} {'read MB/s':>10} {'Mev/s':>6} {'write MB/s':>11} "
+          f"{'compact':>8} {'mismatch':>9}")
+    failures = []
+    for variant in list(VARIANTS) + [MALFORMED]:
+        corpus = generate(variant, files, events)
+        bad = [(i, p) for i, d in enumerate(corpus) for p in check(d)]
+        failures += [(variant, i, p) for i, p in bad]
+        size = sum(len(d) for d in corpus) / 1e6
+        if variant == MALFORMED:
+            rejected = sum(decode(d)[0] == 'error' for d in corpus)
+            print(f'{variant:>13} {size:6.2f} {f"{rejected}/{files} rejected":>38} {len(bad):9d}')
+            continue
+        read_mb, read_ev, write_mb, compact_mb = throughput(corpus)
+        print(f'{variant:>13} {size:6.2f} {read_mb:10.2f} {read_ev:6.2f} {write_mb:11.2f} '
+              f'{compact_mb:8.2f} {len(bad):9d}')
+    for variant, i, problem in failures[:10]:
+        print(f'{variant} #{i}: {problem}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
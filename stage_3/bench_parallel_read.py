@@ -0,0 +1,69 @@
+"""Time MidiFile.read() against read_parallel() on a synthetic many-track
+file (think orchestral score or one track per separated stem).
+
+Usage: python stage_3/bench_parallel_read.py [tracks] [notes_per_track] [workers]
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from midifile import MidiFile, MidiTrack
+from notepairs import NoteArrays
+from rhythmic_quantization import notes_to_track
+
+
+def make_file(path, ntracks, notes_per_track, seed=0):
+    rng = np.random.default_rng(seed)
+    mf = MidiFile()
+    mf.verbose = False
+    mf._tempoMap = {0: 2.0}
+    empty = MidiTrack(mf)
+    for t in range(ntracks):
+        # uneven tracks: the last is twice the size of the first
+        n = notes_per_track * (ntracks + t) // ntracks
+        onset = np.cumsum(rng.integers(1, 4, n)) * 120
+        notes = NoteArrays(onset=onset, duration=np.full(n, 100, np.int64),
+                           pitch=rng.integers(40, 90, n), channel=np.full(n, t % 16, np.int64),
+                           velocity=np.full(n, 90, np.int64))
+        mf._tracks.append(notes_to_track(MidiTrack(mf), notes, np.zeros(0, np.int64),
+                                         np.zeros(0, np.int64), empty))
+    mf.write(path)
+
+
+def main():
+    ntracks = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    notes_per_track = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "big.mid")
+        make_file(path, ntracks, notes_per_track)
+        print(f"{ntracks} tracks, {os.path.getsize(path) / 1e6:.1f} MB, {workers} workers")
+
+        seq = MidiFile()
+        seq.verbose = False
+        t = time.perf_counter()
+        seq.read(path)
+        t_seq = time.perf_counter() - t
+
+        with ProcessPoolExecutor(workers) as pool:
+            list(pool.map(abs, range(workers)))  # start the workers before timing
+            par = MidiFile()
+            par.verbose = False
+            t = time.perf_counter()
+            par.read_parallel(path, executor=pool)
+            t_par = time.perf_counter() - t
+
+        same = all(a.columns() == b.columns() for a, b in zip(seq._tracks, par._tracks))
+        print(f"read():          {t_seq * 1000:8.1f} ms")
+        print(f"read_parallel(): {t_par * 1000:8.1f} ms  ({t_seq / t_par:.1f}x, identical: {same})")
+
+
+if __name__ == "__main__":
+    main()
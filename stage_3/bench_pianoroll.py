@@ -0,0 +1,72 @@
+"""Time the piano-roll preview of a synthetic 10 minute song.
+
+Usage: python stage_3/bench_pianoroll.py [minutes] [notes_per_second]
+"""
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from midifile import MidiFile, MidiTrack
+from notepairs import NoteArrays
+from pianoroll import png_bytes, render, render_svg, roll_from_midi
+from rhythmic_quantization import notes_to_track
+
+
+def make_song(minutes, notes_per_second, bpm=120, seed=0):
+    """A melody on the 16th grid plus chords every two beats, as MIDI bytes."""
+    rng = np.random.default_rng(seed)
+    mf = MidiFile()
+    mf.verbose = False
+    mf._tempoMap = {0: bpm / 60.0}
+    n = int(minutes * 60 * notes_per_second)
+    step = mf._division * bpm / 60.0 / notes_per_second
+    onset = np.round(np.arange(n) * step / 120.0).astype(np.int64) * 120
+    notes = NoteArrays(onset=onset, duration=np.full(n, 240, np.int64),
+                       pitch=60 + np.cumsum(rng.integers(-3, 4, n)) % 24,
+                       channel=np.zeros(n, np.int64), velocity=np.full(n, 100, np.int64))
+    empty = MidiTrack(mf)
+    mf._tracks = [notes_to_track(MidiTrack(mf), notes, np.zeros(0, np.int64), np.zeros(0, np.int64), empty)]
+    out = io.BytesIO()
+    mf.write_to_file(out)
+
+    roots = ['C', 'F', 'G', 'A']
+    chords = [{"time": t, "chord": f"{roots[i % 4]} {'min' if i % 4 == 3 else 'Maj'}"}
+              for i, t in enumerate(np.arange(0, minutes * 60, 1.0).tolist())]
+    return out.getvalue(), chords, n
+
+
+def main():
+    minutes = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 4
+    data, chords, n = make_song(minutes, rate)
+
+    t0 = time.perf_counter()
+    mf = MidiFile()
+    mf.verbose = False
+    mf.read_from_file(io.BytesIO(data))
+    t1 = time.perf_counter()
+    roll = roll_from_midi(mf, chords)
+    t2 = time.perf_counter()
+    img = render(roll)
+    t3 = time.perf_counter()
+    png = png_bytes(img)
+    t4 = time.perf_counter()
+    svg = render_svg(roll)
+    t5 = time.perf_counter()
+
+    print(f'{minutes:g} min, {n} notes, {len(chords)} chords -> {img.shape[1]}x{img.shape[0]} px')
+    print(f'parse   {1000 * (t1 - t0):7.1f} ms')
+    print(f'notes   {1000 * (t2 - t1):7.1f} ms')
+    print(f'render  {1000 * (t3 - t2):7.1f} ms')
+    print(f'png     {1000 * (t4 - t3):7.1f} ms  ({len(png) / 1024:.0f} KiB)')
+    print(f'total   {1000 * (t4 - t0):7.1f} ms to PNG')
+    print(f'svg     {1000 * (t5 - t4):7.1f} ms  ({len(svg) / 1024:.0f} KiB)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Compare the greedy and per-beat DP onset quantizers on synthetic notes.
+
+Usage: python stage_3/bench_quantization.py [n_notes]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from grid_inference import snap_beats_dp
+from rhythmic_quantization import snap_beats
+
+
+def make_onsets(n, seed=0):
+    """Bars of straight 16ths or triplets in random order, with jitter."""
+    rng = np.random.default_rng(seed)
+    per_beat = np.repeat(rng.choice([3, 4], size=n // 12 + 1), 4)
+    subdiv = np.repeat(per_beat, per_beat)[:n]
+    beat = np.repeat(np.arange(len(per_beat)), per_beat)[:n]
+    pos = np.concatenate([np.arange(k) for k in per_beat])[:n]
+    onsets = beat + pos / subdiv + rng.normal(0.0, 0.04, size=n)
+    return onsets, beat + pos / subdiv
+
+
+def timed(fn, x, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = fn(x)
+        best = min(best, time.perf_counter() - t)
+    return best, out
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    onsets, truth = make_onsets(n)
+
+    t_greedy, greedy = timed(snap_beats, onsets)
+    t_dp, dp = timed(snap_beats_dp, onsets)
+
+    print(f'{n} notes')
+    print(f'greedy: {t_greedy * 1000:.1f} ms, {np.mean(np.isclose(greedy, truth)) * 100:.1f}% on the written grid')
+    print(f'dp:     {t_dp * 1000:.1f} ms, {np.mean(np.isclose(dp, truth)) * 100:.1f}% on the written grid')
+    print(f'dp / greedy: {t_dp / t_greedy:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
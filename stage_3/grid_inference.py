@@ -0,0 +1,95 @@
+"""Per-beat grid inference for quantization.
+
+snap_beats() in rhythmic_quantization picks the 16th or triplet grid for
+every onset on its own, so a little timing jitter makes notes flip between
+straight and triplet inside one beat. snap_beats_dp() instead picks one
+subdivision per beat with a Viterbi pass over the beats, where changing
+grid from one beat to the next costs switch_penalty.
+"""
+
+import numpy as np
+
+# Subdivisions per beat the DP chooses between: straight 16ths and
+# eighth-note triplets
+GRIDS = (4, 3)
+
+# Cost of changing grid between two consecutive beats, in the same units as
+# the snapping error (beats)
+SWITCH_PENALTY = 0.08
+
+
+def grid_costs(beats, grids=GRIDS):
+    """Snapping error of every onset on every grid, summed per beat.
+
+    Returns (beat_of_note, cost) where cost has one row per beat that has
+    onsets, one column per grid, and beat_of_note indexes its rows.
+    """
+    beats = np.asarray(beats, dtype=np.float64)
+    subdiv = np.asarray(grids, dtype=np.float64)
+    err = np.abs(beats[:, None] - np.round(beats[:, None] * subdiv) / subdiv)
+
+    # onsets that round up onto the next beat line are on every grid, so it
+    # doesn't matter which beat they are counted in
+    beat = np.floor(beats).astype(np.int64)
+    beat -= beat.min()
+    occupied = np.bincount(beat) > 0
+    row_of_beat = np.cumsum(occupied) - 1
+    beat_of_note = row_of_beat[beat]
+    nrows = int(row_of_beat[-1]) + 1
+    cost = np.empty((nrows, len(subdiv)))
+    for g in range(len(subdiv)):
+        cost[:, g] = np.bincount(beat_of_note, weights=err[:, g], minlength=nrows)
+    return beat_of_note, cost
+
+
+def viterbi_grids(cost, switch_penalty=SWITCH_PENALTY):
+    """Cheapest grid index per row of a two-column cost, paying
+    switch_penalty per change.
+
+    A two-state Viterbi. Let d be the cost of the cheapest path ending on
+    grid 0 minus that of the cheapest ending on grid 1. Once one of them
+    is more than switch_penalty dearer, switching from the other is
+    cheaper, so from beat to beat d becomes
+    clip(d, -switch_penalty, switch_penalty) + cost[b, 0] - cost[b, 1].
+    """
+    nbeats, ngrids = cost.shape
+    if ngrids != 2:
+        raise ValueError(f'viterbi_grids chooses between two grids, got {ngrids}')
+    if nbeats == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # forward, one beat at a time
+    p = switch_penalty
+    step = (cost[:, 0] - cost[:, 1]).tolist()
+    d = step[0]
+    diff = [d]
+    for s in step[1:]:
+        d = (p if d > p else -p if d < -p else d) + s
+        diff.append(d)
+    diff = np.array(diff)
+
+    # backtrack: where d was clipped, the path into the next beat came
+    # from the cheaper grid whichever grid it went on to, so that beat's
+    # grid is fixed; every other beat stays on the grid of the beat after
+    # it. The last beat takes the cheaper grid
+    grid = (diff > 0).astype(np.int64)
+    fixed = np.abs(diff) > p
+    fixed[-1] = True
+    nxt = np.where(fixed, np.arange(nbeats), nbeats)
+    nxt = np.minimum.accumulate(nxt[::-1])[::-1]
+    return grid[nxt]
+
+
+def snap_beats_dp(beats, grids=GRIDS, switch_penalty=SWITCH_PENALTY):
+    """Snap beat positions using one grid per beat (see module docstring).
+
+    Slower than the greedy snap_beats: on bench_quantization's 100k notes
+    it takes about 10 ms against 2.5 ms, 4-6x.
+    """
+    beats = np.asarray(beats, dtype=np.float64)
+    if len(beats) == 0:
+        return beats
+    beat_of_note, cost = grid_costs(beats, grids)
+    path = viterbi_grids(cost, switch_penalty)
+    subdiv = np.asarray(grids, dtype=np.float64)[path[beat_of_note]]
+    return np.round(beats * subdiv) / subdiv
@@ -89,12 +89,12 @@ class MetaEventConstants(IntEnum):
 class MidiEvent:
     _type: MidiEventType = None
     _channel: int = 0
-    _dataA: int = 0
+    _dataA: int = 0     # meta type for META events
     _dataB: int = 0
 
-    # # meta event fields
-    # meta_type: int = 0
-    # meta_data: bytes = b''
+    # meta/sysex payload; as read from a file this is a memoryview into the
+    # track buffer, so nothing is copied unless the caller asks for it
+    _edata: bytes = b''
 
     def set(self, t: MidiEventType, c: int, a: int, b: int):
         self._type = t
@@ -102,13 +102,10 @@ class MidiEvent:
         self._dataA = a
         self._dataB = b
 
-    # def set_meta(self, meta_type: int, data: bytes):
-    #     self._type = MidiEventType.META
-    #     self.meta_type = meta_type & 0xff
-    #     if data is None:
-    #         self.meta_data = b''
-    #     else:
-    #         self.meta_data = data
+    def setMeta(self, meta_type: int, data: bytes):
+        self._type = MidiEventType.META
+        self._dataA = meta_type & 0xff
+        self.setEData(data)
 
     def type(self) -> MidiEventType:
         return self._type
@@ -124,3 +121,23 @@ class MidiEvent:
 
     def dataB(self) -> int:
         return self._dataB
+
+    def metaType(self) -> int:
+        return self._dataA
+
+    def isMeta(self) -> bool:
+        return self._type == MidiEventType.META
+
+    def isSysex(self) -> bool:
+        return self._type in (MidiEventType.SYSEX, MidiEventType.ENDSYSEX)
+
+    def edata(self):
+        """Meta/sysex payload as stored (bytes or a memoryview)."""
+        return self._edata
+
+    def setEData(self, data):
+        self._edata = b'' if data is None else data
+
+    def text(self) -> str:
+        """Payload of a text-like meta event (track name, lyric, marker...)."""
+        return bytes(self._edata).decode('latin-1')
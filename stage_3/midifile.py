@@ -6,9 +6,13 @@ This is a functional, fairly direct port using built-in file I/O.
 It implements reading and writing of basic MIDI files (format 0/1),
 including variable-length values, running status, and tempo meta events.
 """
+import mmap
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
 from enum import IntEnum
 from dataclasses import dataclass, field
-from typing import Dict, List, BinaryIO
+from array import array
+from typing import Dict, List, BinaryIO, Optional, Tuple
 from midievent import MidiEventType
 from midievent import ControllerConstants
 from midievent import MetaEventConstants
@@ -16,6 +20,35 @@ from midievent import MidiEvent
 from tempomap import TempoMap
 
 
+# Status byte dispatch tables, indexed by the raw byte read where a status
+# is expected. _STATUS_KIND says what kind of message follows and
+# _STATUS_LEN how many data bytes a channel status takes (0 for anything
+# that can't be used as running status).
+KIND_DATA = 0       # 0x00-0x7f: first data byte under running status
+KIND_CHANNEL = 1    # 0x80-0xef: channel voice message
+KIND_SYSEX = 2      # 0xf0, 0xf7
+KIND_META = 3       # 0xff
+KIND_SKIP = 4       # 0xf1-0xfe except 0xf7: ignored system messages
+
+
+def _build_status_tables():
+    kind = bytearray(256)
+    length = bytearray(256)
+    for st in range(0x80, 0xf0):
+        kind[st] = KIND_CHANNEL
+        length[st] = 1 if 0xc0 <= st < 0xe0 else 2  # PROGRAM, AFTERTOUCH
+    for st in range(0xf1, 0xff):
+        kind[st] = KIND_SKIP
+    kind[0xf0] = KIND_SYSEX
+    kind[0xf7] = KIND_SYSEX
+    kind[0xff] = KIND_META
+    return bytes(kind), bytes(length)
+
+
+_STATUS_KIND, _STATUS_LEN = _build_status_tables()
+_CHANNEL_TYPES = {int(t): t for t in MidiEventType if t < 0xf0}
+
+
 # class MidiEventType(IntEnum):
 #     NOTEOFF = 0x80
 #     NOTEON = 0x90
@@ -46,29 +79,127 @@ from tempomap import TempoMap
 #         self.b = b
 
 
+def _getvl(buf: bytes, pos: int):
+    """Read a variable-length value from buf; returns (value, new pos)."""
+    l = 0
+    for i in range(16):
+        c = buf[pos]
+        pos += 1
+        l = (l << 7) | (c & 0x7f)
+        if not (c & 0x80):
+            return l, pos
+    return -1, pos
+
+
+def _decode_chunk(path: str, start: int, length: int):
+    """Process pool task: decode the MTrk body at start in path.
+
+    Each task maps the file itself, so the pool only passes offsets in and
+    the decoded columns (plus payload bytes and tempo entries) out.
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        buf = mm[start:start + length]
+    mf = MidiFile()
+    track = MidiTrack(mf)
+    tempo_map: Dict[int, float] = {}
+    mf._decode_track(buf, track, start, tempo_map)
+    edata = {row: bytes(payload) for row, payload in track.edata.items()}
+    return (track.ticks, track.status, track.dataA, track.dataB, edata,
+            track.eot, track.unread, tempo_map)
+
+
 class MidiTrack:
+    """Events of one MTrk chunk.
+
+    The reader decodes straight into parallel columns (absolute tick,
+    status byte, data bytes); MidiEvent objects are only built when
+    events() is called. Meta and sysex rows keep their payload in edata
+    as a memoryview into the chunk that was read.
+    """
+
     def __init__(self, mf: 'MidiFile'):
         self.mf = mf
-        self._events: Dict[int, MidiEvent] = {}
-
-    def events(self):
+        self.ticks = array('q')
+        self.status = array('B')
+        self.dataA = array('B')     # meta type for meta rows
+        self.dataB = array('B')
+        self.edata: Dict[int, memoryview] = {}  # row -> meta/sysex payload
+        self._events: Optional[Dict[int, List[MidiEvent]]] = None
+        # how decoding ended: EOT seen, and chunk bytes left after it
+        self.eot = False
+        self.unread = 0
+
+    def __len__(self) -> int:
+        if self._events is not None:
+            return sum(len(evs) for evs in self._events.values())
+        return len(self.ticks)
+
+    def event(self, i: int) -> MidiEvent:
+        """Build the MidiEvent for row i of the columns."""
+        st = self.status[i]
+        if st == 0:
+            # data byte seen before any status byte (see _decode_track)
+            return MidiEvent()
+        if st >= 0xf0:
+            return MidiEvent(MidiEventType(st), 0, self.dataA[i], 0, self.edata.get(i, b''))
+        return MidiEvent(_CHANNEL_TYPES[st & 0xf0], st & 0x0f, self.dataA[i], self.dataB[i])
+
+    def events(self) -> Dict[int, List[MidiEvent]]:
+        """tick -> events at that tick, in file order (a multimap, as in
+        MuseScore's MidiTrack)."""
+        if self._events is None:
+            evs: Dict[int, List[MidiEvent]] = {}
+            ticks = self.ticks
+            for i in range(len(ticks)):
+                tick = ticks[i]
+                if tick in evs:
+                    evs[tick].append(self.event(i))
+                else:
+                    evs[tick] = [self.event(i)]
+            self._events = evs
         return self._events
 
-
-class MidiFile:
-    def __init__(self):
-        self.fp: BinaryIO = None
-        self._format = 1
-        self._division = 480 # ticks per beat
-        self._tracks: List[MidiTrack] = []
+    def insert(self, tick: int, event: MidiEvent):
+        self.events().setdefault(tick, []).append(event)
+
+    def columns(self):
+        """Return (ticks, status, dataA, dataB) arrays for this track.
+
+        Once events() has been handed out the dict is authoritative, so the
+        columns are rebuilt from it.
+        """
+        if self._events is not None:
+            self.ticks = array('q')
+            self.status = array('B')
+            self.dataA = array('B')
+            self.dataB = array('B')
+            self.edata = {}
+            for tick, evs in sorted(self._events.items()):
+                for ev in evs:
+                    t = ev.type()
+                    if t is None:
+                        st = 0
+                    elif t >= 0xf0:
+                        st = int(t)
+                        if ev.edata():
+                            self.edata[len(self.ticks)] = memoryview(ev.edata())
+                    else:
+                        st = (int(t) & 0xf0) | (ev.channel() & 0x0f)
+                    self.ticks.append(tick)
+                    self.status.append(st)
+                    self.dataA.append(ev.dataA() & 0xff)
+                    self.dataB.append(ev.dataB() & 0xff)
+        return self.ticks, self.status, self.dataA, self.dataB
+
+
+class _Reader:
+    """Cursor over the file being read, owned by a single read() call."""
+
+    def __init__(self, fp: BinaryIO):
+        self.fp = fp
         self.curPos = 0
-        self.status = -1
-        self.sstatus = -1
-        self.click = 0
-        self._tempoMap: Dict[int, float] = {} # beats per second
 
-    # ------------------------- low-level reads -------------------------
-    def _read(self, n: int) -> bytes:
+    def read(self, n: int) -> bytes:
         data = self.fp.read(n)
         # print(bytes(data), '\n')
         if data is None or len(data) != n:
@@ -77,195 +208,61 @@ class MidiFile:
         self.curPos += n
         return data
 
-    def _read_byte(self) -> int:
-        return self._read(1)[0]
+    def read_byte(self) -> int:
+        return self.read(1)[0]
 
     def read_short(self) -> int:
-        b = self._read(2)
+        b = self.read(2)
         return int.from_bytes(b, byteorder='big', signed=False)
 
     def read_long(self) -> int:
-        b = self._read(4)
+        b = self.read(4)
         return int.from_bytes(b, byteorder='big', signed=False)
 
     def skip(self, n: int):
         if n <= 0:
             return
-        _ = self._read(n)
+        _ = self.read(n)
 
     def getvl(self) -> int:
         l = 0
         for i in range(16):
-            c = self._read_byte()
+            c = self.read_byte()
             l = (l << 7) | (c & 0x7f)
             if not (c & 0x80):
                 return l
             # l <<= 7
         return -1
 
-    # ------------------------- high-level read -------------------------
-    def read(self, path: str) -> bool:
-        with open(path, 'rb') as f:
-            return self.read_from_file(f)
-
-    def read_from_file(self, f: BinaryIO) -> bool:
-        self.fp = f
-        self._tracks.clear()
-        self.curPos = 0
-
-        hdr = self._read(4)
-        length = self.read_long()
-        if hdr != b'MThd' or length < 6:
-            raise ValueError('bad midifile: MThd expected')
-
-        self._format = self.read_short()
-        ntracks = self.read_short()
-        self._division = self.read_short()
 
-        if self._division < 0:
-            # SMPTE style division handling (port of original logic)
-            self._division = (- (self._division // 256)) * (self._division & 0xff)
-        if length > 6:
-            self.skip(length - 6)
+class _Writer:
+    """Encodes one write() call: output buffer and running status.
 
-        if self._format == 0:
-            self.read_track()
-        elif self._format == 1:
-            for i in range(ntracks):
-                print(f"ReadING track {i+1} of {ntracks} at 0x{self.curPos:x}...")
-                self.read_track()
-                print(f"Read track {i+1} of {ntracks} ending at 0x{self.curPos:x}!\n")
-        else:
-            raise NotImplementedError(f'midi file format {self._format} not implemented')
-        return True
+    compact=True trades exact event types for size: note-offs become
+    NOTEON velocity 0 so running status holds across whole note runs,
+    zero-length notes are dropped, the tempo map goes into the first track
+    only with repeated values merged, and EOT gets no extra delta.
+    """
 
-    def read_track(self) -> bool:
-        hdr = self._read(4)
-        if hdr != b'MTrk':
-            raise ValueError('bad midifile: MTrk expected')
-        length = self.read_long()
-        endPos = self.curPos + length
+    def __init__(self, mf: 'MidiFile', compact: bool = False):
+        self.mf = mf
+        self.out = bytearray()
         self.status = -1
-        self.sstatus = -1
-        self.click = 0
-        track = MidiTrack(self)
-        self._tracks.append(track)
-
-        while True:
-            event = MidiEvent()
-            rv = self.read_event(event)
-            # print("Read an event!")
-            if rv == 0:
-                track.events()[self.click] = event
-            elif rv == 2:
-                break
-
-        if self.curPos != endPos:
-            # attempt to skip remaining bytes if any
-            if self.curPos < endPos:
-                self.skip(endPos - self.curPos)
-        return True
+        self.compact = compact
 
-    def read_event(self, event: MidiEvent) -> int:
-        nclick = self.getvl()
-        if nclick == -1:
-            raise ValueError('readEvent: error 1(getvl)')
-        self.click += nclick
-
-        # read status or system bytes, skipping unknown F1..FE except F7
-        while True:
-            me = self._read_byte()
-            if 0xf1 <= me <= 0xfe and me != 0xf7:
-                # skip/ignore
-                continue
-            break
-
-        # sysex
-        if me == 0xf0 or me == 0xf7:
-            self.status = -1
-            length = self.getvl()
-            if length == -1:
-                raise ValueError('readEvent: error 3')
-            data = self._read(length)
-            if data and data[-1] != 0xf7:
-                # could be more to come; ignore
-                pass
-            return 1
-
-        # meta
-        if me == 0xff:
-            self.status = -1
-            mtype = self._read_byte()
-            dataLen = self.getvl()
-            if dataLen == -1:
-                raise ValueError('readEvent: error 6')
-            data = b''
-            if dataLen:
-                data = self._read(dataLen)
-            if mtype == MetaEventConstants.META_TEMPO and dataLen >= 3:
-                tempo = (data[0] << 16) + (data[1] << 8) + data[2] # stored as usec per beat
-                t = 1000000.0 / float(tempo) # 1,000,000 usec per second / tempo in usec per beat = beats per second
-                self._tempoMap[self.click] = t
-            if mtype == MetaEventConstants.META_EOT:
-                return 2
-            return 1
-
-        # normal midi events: running status support
-        if me & 0x80:
-            self.status = me
-            self.sstatus = self.status
-            a = self._read_byte()
-        else:
-            if self.status == -1:
-                if self.sstatus == -1:
-                    return 0
-                self.status = self.sstatus
-            a = me
-
-        channel = self.status & 0x0f
-        b = 0
-        t = MidiEventType(self.status & 0xf0)
-        if t in (MidiEventType.NOTEOFF, MidiEventType.NOTEON, MidiEventType.POLYAFTER,
-                 MidiEventType.CONTROLLER, MidiEventType.PITCHBEND):
-            b = self._read_byte()
-
-        if t in (MidiEventType.NOTEOFF, MidiEventType.NOTEON, MidiEventType.CONTROLLER,
-                 MidiEventType.PITCHBEND, MidiEventType.POLYAFTER):
-            event.set(t, channel, a, b)
-        elif t in (MidiEventType.PROGRAM, MidiEventType.AFTERTOUCH):
-            event.set(t, channel, a, 0)
-        else:
-            raise ValueError(f'BAD STATUS: 0x{me:02x} at 0x{self.curPos:x}', t)
-
-        if (a & 0x80) or (b & 0x80):
-            if b & 0x80:
-                # try to fix: interpret as status
-                self.status = b
-                self.sstatus = self.status
-                return 0
-            raise ValueError('readEvent: error 16')
-        return 0
-
-    # ------------------------- write support -------------------------
-    def write(self, path: str) -> bool:
-        with open(path, 'wb') as f:
-            return self.write_to_file(f)
-
-    def write_to_file(self, f: BinaryIO) -> bool:
-        self.fp = f
+    def write_file(self) -> bytearray:
+        mf = self.mf
         self._write(b'MThd')
         self.write_long(6)
-        self.write_short(self._format)
-        self.write_short(len(self._tracks))
-        self.write_short(self._division)
-        for t in self._tracks:
+        self.write_short(mf._format)
+        self.write_short(len(mf._tracks))
+        self.write_short(mf._division)
+        for t in mf._tracks:
             self.write_track(t)
-        return True
+        return self.out
 
     def _write(self, data: bytes):
-        written = self.fp.write(data)
-        if written != len(data):
-            raise IOError('write midifile failed')
+        self.out += data
 
     def put(self, val: int):
         self._write(bytes([val & 0xff]))
@@ -313,74 +310,459 @@ class MidiFile:
             self.put(nstat)
 
     def write_event(self, event: MidiEvent):
-        if event.type in (MidiEventType.NOTEON, MidiEventType.NOTEOFF,
-                          MidiEventType.CONTROLLER, MidiEventType.PITCHBEND):
-            self.write_status(event.type, event.channel)
-            self.put(event.a & 0x7f)
-            self.put(event.b & 0x7f)
-        elif event.type in (MidiEventType.PROGRAM, MidiEventType.AFTERTOUCH):
-            self.write_status(event.type, event.channel)
-            self.put(event.a & 0x7f)
-        elif getattr(event, "type", None) == MidiEventType.META or hasattr(event, "meta_type"):
+        t = event.type()
+        if t in (MidiEventType.NOTEON, MidiEventType.NOTEOFF, MidiEventType.POLYAFTER,
+                 MidiEventType.CONTROLLER, MidiEventType.PITCHBEND):
+            self.write_status(t, event.channel())
+            self.put(event.dataA() & 0x7f)
+            self.put(event.dataB() & 0x7f)
+        elif t in (MidiEventType.PROGRAM, MidiEventType.AFTERTOUCH):
+            self.write_status(t, event.channel())
+            self.put(event.dataA() & 0x7f)
+        elif t == MidiEventType.META:
             # meta event: 0xFF, type, length (vlq), data
             # meta events are not subject to running status
             self.status = -1
             self.put(0xff)
-            self.put(event.meta_type & 0xff)
-            self.putvl(len(event.meta_data))
-            if event.meta_data:
-                self._write(event.meta_data)
-        else:
-            # unsupported: sysex etc in this writer
-            pass
-
-    def write_track(self, t: MidiTrack) -> bool:
-        self._write(b'MTrk')
-        lenpos = self.fp.tell()
-        self.write_long(0)  # dummy
-        self.status = -1
+            self.put(event.metaType() & 0xff)
+            data = event.edata()
+            self.putvl(len(data))
+            if data:
+                self._write(data)
+        elif t in (MidiEventType.SYSEX, MidiEventType.ENDSYSEX):
+            # 0xF0/0xF7, length (vlq), data -- the data carries its own
+            # trailing 0xF7
+            self.status = -1
+            self.put(int(t))
+            data = event.edata()
+            self.putvl(len(data))
+            if data:
+                self._write(data)
 
+    def write_events(self, t: MidiTrack):
         # write tempo event at start of track
         # kinda scuffed since it only adds the starting tempo but hackathon lol
         self.put(0x00)
         self.put(0xff)
         self.put(MetaEventConstants.META_TEMPO)
         self.put(3)
-        bps = self._tempoMap.get(0, 2.0)
-        print("Tempo in beats per second: ", bps)
-        tempo = int((1.0/bps) * 1000000) # convert to microseconds per beat for MIDI storage
-        print("Tempo in microseconds per beat:", tempo)
+        bps = self.mf._tempoMap.get(0, 2.0)
+        # microseconds per beat for MIDI storage; rounded, since truncating
+        # 1/bps can write a tempo read from a file back 1 usec short
+        tempo = round(1000000.0 / bps)
+        if self.mf.verbose:
+            print("Tempo in beats per second: ", bps)
+            print("Tempo in microseconds per beat:", tempo)
         self.put((tempo >> 16) & 0xff)
         self.put((tempo >> 8) & 0xff)
         self.put(tempo & 0xff)
 
         tick = 0
-        for ntick, ev in sorted(t.events().items()):
+        for ntick, evs in sorted(t.events().items()):
+            for ev in evs:
+                if ev.type() is None:
+                    continue
+                if ev.isMeta() and ev.metaType() in (MetaEventConstants.META_TEMPO, MetaEventConstants.META_EOT):
+                    # tempo comes from _tempoMap (see above), EOT is added below
+                    continue
+                self.putvl(ntick - tick)
+                self.write_event(ev)
+                tick = ntick
+
+    def tempo_changes(self) -> List[Tuple[int, int]]:
+        """(tick, usec per beat) of the tempo map, starting at tick 0 and
+        leaving out entries that repeat the tempo before them."""
+        changes = [(0, round(1000000.0 / self.mf._tempoMap.get(0, 2.0)))]
+        for tick, bps in sorted(self.mf._tempoMap.items()):
+            tempo = round(1000000.0 / bps)
+            if tick > 0 and tempo != changes[-1][1]:
+                changes.append((tick, tempo))
+        return changes
+
+    def write_compact_events(self, t: MidiTrack, with_tempo: bool):
+        events = []
+        if with_tempo:
+            for tick, tempo in self.tempo_changes():
+                ev = MidiEvent()
+                ev.setMeta(MetaEventConstants.META_TEMPO, tempo.to_bytes(3, byteorder='big'))
+                events.append((tick, ev))
+
+        sounding: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}  # (channel, pitch) -> (tick, index)
+        for ntick, evs in sorted(t.events().items()):
+            for ev in evs:
+                kind = ev.type()
+                if kind is None:
+                    continue
+                if ev.isMeta() and ev.metaType() in (MetaEventConstants.META_TEMPO, MetaEventConstants.META_EOT):
+                    continue
+                if kind in (MidiEventType.NOTEON, MidiEventType.NOTEOFF):
+                    key = (ev.channel(), ev.dataA())
+                    if kind == MidiEventType.NOTEON and ev.dataB():
+                        sounding.setdefault(key, []).append((ntick, len(events)))
+                    else:
+                        ons = sounding.get(key)
+                        on = ons.pop() if ons else None
+                        if on is not None and on[0] == ntick and not ons:
+                            events[on[1]] = None  # zero length: drop the note-on and this note-off
+                            continue
+                        ev = MidiEvent(MidiEventType.NOTEON, ev.channel(), ev.dataA(), 0)
+                events.append((ntick, ev))
+
+        tick = 0
+        # stable sort: the tempo events stay ahead of others on their tick
+        for ntick, ev in sorted((e for e in events if e is not None), key=lambda e: e[0]):
             self.putvl(ntick - tick)
             self.write_event(ev)
             tick = ntick
 
+    def write_track(self, t: MidiTrack) -> bool:
+        self._write(b'MTrk')
+        lenpos = len(self.out)
+        self.write_long(0)  # dummy
+        self.status = -1
+
+        if self.compact:
+            self.write_compact_events(t, t is self.mf._tracks[0])
+            eot_delta = 0
+        else:
+            self.write_events(t)
+            eot_delta = 1
+
         self.status = -1
         
         # write end of track
-        self.putvl(1)
+        self.putvl(eot_delta)
         self.put(0xff)
         self.put(MetaEventConstants.META_EOT)
         self.putvl(0)
-        endpos = self.fp.tell()
+        endpos = len(self.out)
         # go back and write track length
-        self.fp.seek(lenpos)
-        self.write_long(endpos - lenpos - 4)
-        self.fp.seek(endpos)
+        self.out[lenpos:lenpos + 4] = (endpos - lenpos - 4).to_bytes(4, byteorder='big')
         return True
 
 
+class MidiFile:
+    """A parsed or constructed MIDI file.
+
+    Parse and write cursors (file position, running status) live in a
+    _Reader/_Writer made for each call, so one MidiFile can be written
+    from several threads and separate MidiFiles can be read concurrently.
+    read() only replaces the tracks and tempo map once the whole file has
+    been decoded.
+    """
+
+    def __init__(self):
+        self._format = 1
+        self._division = 480 # ticks per beat
+        self._tracks: List[MidiTrack] = []
+        self._tempoMap: Dict[int, float] = {} # beats per second
+        self.verbose = True # progress prints while reading/writing
+        self.bytes_read = 0 # size of the file the last read() consumed
+        self.bytes_written = 0 # size of the file the last write() produced
+
+    # ------------------------- high-level read -------------------------
+    def read(self, path: str) -> bool:
+        with open(path, 'rb') as f:
+            return self.read_from_file(f)
+
+    def read_from_file(self, f: BinaryIO) -> bool:
+        r = _Reader(f)
+        tracks: List[MidiTrack] = []
+        tempo_map: Dict[int, float] = {}
+
+        fmt, ntracks, division = self._read_header(r)
+        if fmt == 0:
+            self.read_track(r, tracks, tempo_map)
+        elif fmt == 1:
+            for i in range(ntracks):
+                if self.verbose:
+                    print(f"ReadING track {i+1} of {ntracks} at 0x{r.curPos:x}...")
+                self.read_track(r, tracks, tempo_map)
+                if self.verbose:
+                    print(f"Read track {i+1} of {ntracks} ending at 0x{r.curPos:x}!\n")
+        else:
+            raise NotImplementedError(f'midi file format {fmt} not implemented')
+
+        self._format = fmt
+        self._division = division
+        self._tracks = tracks
+        self._tempoMap = tempo_map
+        self.bytes_read = r.curPos
+        return True
+
+    def read_parallel(self, path: str, workers: Optional[int] = None,
+                      executor: Optional[Executor] = None) -> bool:
+        """Like read(), but decode the tracks of a format 1 file at once.
+
+        Every MTrk chunk states its length, so the chunk offsets are found
+        by reading only the 8-byte chunk headers. The bodies are then
+        decoded in a process pool (executor, or a new pool of workers
+        processes), each task mapping the file rather than being sent its
+        bytes. Tempo entries are merged in track order, so the result is
+        the same as read(): later tracks win on the same tick.
+        """
+        with open(path, 'rb') as f:
+            r = _Reader(f)
+            fmt, ntracks, division = self._read_header(r)
+            if fmt != 1 or ntracks < 2:
+                f.seek(0)
+                return self.read_from_file(f)
+            chunks = self.chunk_offsets(r, ntracks)
+
+        if executor is None:
+            with ProcessPoolExecutor(max_workers=workers or min(len(chunks), os.cpu_count() or 1)) as pool:
+                return self.read_parallel(path, executor=pool)
+
+        # largest first, so the longest track never starts last
+        order = sorted(range(len(chunks)), key=lambda i: -chunks[i][1])
+        futures = {i: executor.submit(_decode_chunk, path, *chunks[i]) for i in order}
+        tracks: List[MidiTrack] = []
+        tempo_map: Dict[int, float] = {}
+        for i in range(len(chunks)):
+            ticks, status, dataA, dataB, edata, eot, unread, track_tempo = futures[i].result()
+            track = MidiTrack(self)
+            track.ticks, track.status, track.dataA, track.dataB = ticks, status, dataA, dataB
+            track.edata = {row: memoryview(payload) for row, payload in edata.items()}
+            track.eot, track.unread = eot, unread
+            tracks.append(track)
+            tempo_map.update(track_tempo)
+            if self.verbose:
+                print(f"Read track {i+1} of {ntracks} at 0x{chunks[i][0]:x} ({chunks[i][1]} bytes)")
+
+        self._format = fmt
+        self._division = division
+        self._tracks = tracks
+        self._tempoMap = tempo_map
+        self.bytes_read = chunks[-1][0] + chunks[-1][1]
+        return True
+
+    def _read_header(self, r: _Reader) -> Tuple[int, int, int]:
+        """Read MThd; returns (format, track count, division)."""
+        hdr = r.read(4)
+        length = r.read_long()
+        if hdr != b'MThd' or length < 6:
+            raise ValueError('bad midifile: MThd expected')
+
+        fmt = r.read_short()
+        ntracks = r.read_short()
+        division = r.read_short()
+
+        if division & 0x8000:
+            # SMPTE style division handling (port of original logic); the
+            # C++ reads a signed short, read_short() doesn't
+            division -= 0x10000
+            division = (- (division // 256)) * (division & 0xff)
+        if length > 6:
+            r.skip(length - 6)
+        return fmt, ntracks, division
+
+    @staticmethod
+    def chunk_offsets(r: _Reader, ntracks: int) -> List[Tuple[int, int]]:
+        """(body offset, length) of the next ntracks MTrk chunks, reading
+        only their headers."""
+        chunks = []
+        for _ in range(ntracks):
+            if r.read(4) != b'MTrk':
+                raise ValueError('bad midifile: MTrk expected')
+            length = r.read_long()
+            chunks.append((r.curPos, length))
+            r.fp.seek(length, os.SEEK_CUR)
+            r.curPos += length
+        end = r.fp.seek(0, os.SEEK_END)
+        if r.curPos > end:
+            raise EOFError(f"bad midifile: unexpected EOF (track at 0x{chunks[-1][0]:02x} "
+                           f"needs {r.curPos - end} more bytes)")
+        return chunks
+
+    def read_track(self, r: _Reader, tracks: List[MidiTrack], tempo_map: Dict[int, float]) -> bool:
+        hdr = r.read(4)
+        if hdr != b'MTrk':
+            raise ValueError('bad midifile: MTrk expected')
+        length = r.read_long()
+        start = r.curPos
+        track = MidiTrack(self)
+        tracks.append(track)
+        # the chunk length is known up front, so decode from memory instead
+        # of one fp.read() per byte
+        self._decode_track(r.read(length), track, start, tempo_map)
+        return True
+
+    def _decode_track(self, buf: bytes, track: MidiTrack, start: int = 0,
+                      tempo_map: Optional[Dict[int, float]] = None):
+        """Decode one MTrk body into track's columns.
+
+        Behaves like MuseScore's readEvent: running status survives meta and
+        sysex events (via sstatus), 0xf1-0xfe system bytes are skipped, and a
+        status byte found in the second data byte is taken as the new
+        running status. Tempo changes go into tempo_map (the file's own
+        tempo map if not given).
+        """
+        if tempo_map is None:
+            tempo_map = self._tempoMap
+        kind_of = _STATUS_KIND
+        len_of = _STATUS_LEN
+        end = len(buf)
+        view = memoryview(buf)
+        payloads = track.edata
+
+        # every event takes at least two bytes (delta + data byte)
+        cap = end // 2 + 1
+        ticks = array('q', bytes(8 * cap))
+        stat = array('B', bytes(cap))
+        col_a = array('B', bytes(cap))
+        col_b = array('B', bytes(cap))
+
+        pos = 0
+        row = 0
+        click = 0
+        status = -1
+        sstatus = -1
+        eot = False
+        try:
+            while pos < end:
+                c = buf[pos]
+                pos += 1
+                nclick = c & 0x7f
+                if c & 0x80:
+                    for _ in range(15):
+                        c = buf[pos]
+                        pos += 1
+                        nclick = (nclick << 7) | (c & 0x7f)
+                        if not (c & 0x80):
+                            break
+                    else:
+                        raise ValueError('readEvent: error 1(getvl)')
+                click += nclick
+
+                me = buf[pos]
+                pos += 1
+                kind = kind_of[me]
+                while kind == KIND_SKIP:
+                    me = buf[pos]
+                    pos += 1
+                    kind = kind_of[me]
+
+                if kind == KIND_CHANNEL:
+                    status = sstatus = me
+                    a = buf[pos]
+                    pos += 1
+                elif kind == KIND_DATA:
+                    if status == -1:
+                        if sstatus == -1:
+                            # no status to run on: stored as an empty event
+                            ticks[row] = click
+                            row += 1
+                            continue
+                        status = sstatus
+                    a = me
+                elif kind == KIND_META:
+                    status = -1
+                    mtype = buf[pos]
+                    dataLen, pos = _getvl(buf, pos + 1)
+                    if dataLen == -1:
+                        raise ValueError('readEvent: error 6')
+                    if pos + dataLen > end:
+                        raise IndexError
+                    if mtype == MetaEventConstants.META_EOT:
+                        pos += dataLen
+                        eot = True
+                        break
+                    if mtype == MetaEventConstants.META_TEMPO and dataLen >= 3:
+                        tempo = (buf[pos] << 16) + (buf[pos + 1] << 8) + buf[pos + 2] # stored as usec per beat
+                        tempo_map[click] = 1000000.0 / float(tempo) # beats per second
+                    ticks[row] = click
+                    stat[row] = 0xff
+                    col_a[row] = mtype
+                    if dataLen:
+                        payloads[row] = view[pos:pos + dataLen]
+                    row += 1
+                    pos += dataLen
+                    continue
+                else:
+                    # sysex
+                    status = -1
+                    length, pos = _getvl(buf, pos)
+                    if length == -1:
+                        raise ValueError('readEvent: error 3')
+                    if pos + length > end:
+                        raise IndexError
+                    ticks[row] = click
+                    stat[row] = me
+                    if length:
+                        payloads[row] = view[pos:pos + length]
+                    row += 1
+                    pos += length
+                    continue
+
+                nbytes = len_of[status]
+                if nbytes == 2:
+                    b = buf[pos]
+                    pos += 1
+                elif nbytes == 1:
+                    b = 0
+                else:
+                    raise ValueError(f'BAD STATUS: 0x{me:02x} at 0x{start + pos:x}', MidiEventType(status & 0xf0))
+
+                ticks[row] = click
+                stat[row] = status
+                col_a[row] = a
+                col_b[row] = b
+                row += 1
+
+                if (a & 0x80) or (b & 0x80):
+                    if b & 0x80:
+                        # try to fix: interpret as status
+                        status = sstatus = b
+                        continue
+                    raise ValueError('readEvent: error 16')
+        except IndexError:
+            raise EOFError(f"bad midifile: unexpected EOF in track at 0x{start:02x}") from None
+
+        del ticks[row:]
+        del stat[row:]
+        del col_a[row:]
+        del col_b[row:]
+        track.ticks, track.status, track.dataA, track.dataB = ticks, stat, col_a, col_b
+        track.eot = eot
+        track.unread = end - pos
+
+    # ------------------------- write support -------------------------
+    def write(self, path: str, compact: bool = False) -> bool:
+        with open(path, 'wb') as f:
+            return self.write_to_file(f, compact)
+
+    def write_to_file(self, f: BinaryIO, compact: bool = False) -> bool:
+        """Encode the whole file in memory, then write it with one call (f
+        doesn't need to be seekable). See _Writer for what compact changes."""
+        data = _Writer(self, compact).write_file()
+        written = f.write(data)
+        if written is not None and written != len(data):
+            raise IOError('write midifile failed')
+        self.bytes_written = len(data)
+        return True
+
+    def compact_savings(self) -> Tuple[int, int]:
+        """(plain size, compact size) in bytes of this file as written."""
+        verbose, self.verbose = self.verbose, False
+        try:
+            return len(_Writer(self).write_file()), len(_Writer(self, True).write_file())
+        finally:
+            self.verbose = verbose
+
+
 if __name__ == '__main__':
     # simple smoke test when run directly
     import sys
     if len(sys.argv) < 2:
-        print('Usage: midifile.py <midi-file>')
+        print('Usage: midifile.py <midi-file> [compact-output]')
     else:
         mf = MidiFile()
         mf.read(sys.argv[1])
         print('Read OK, tracks:', len(mf._tracks))
+        if len(sys.argv) > 2:
+            # midifile.py <in> <out>: rewrite in compact mode
+            mf.verbose = False
+            plain, compact = mf.compact_savings()
+            mf.write(sys.argv[2], compact=True)
+            print(f'Compact write: {compact} bytes, {plain - compact} saved '
+                  f'({100.0 * (plain - compact) / plain:.1f}% of {plain})')
@@ -0,0 +1,242 @@
+"""Columnar, memory-mapped index over a corpus of MIDI files.
+
+build_index() parses every .mid under a corpus directory once (in a
+process pool) and stores all event columns back to back in one .npy file
+per column, plus an offsets table (events of file i are rows
+offsets[i]:offsets[i + 1]) and a manifest with each file's mtime/size.
+Re-running it only re-parses files whose mtime or size changed.
+
+MidiIndex opens the store with np.load(mmap_mode='r') and answers corpus
+questions with vectorized filters and per-file reductions, e.g.
+
+    idx = MidiIndex('midi-index')
+    idx.files_where(idx.note_on() & (idx.pitch > 84))
+    idx.note_density().mean()
+"""
+
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from midifile import MidiFile
+
+MANIFEST = 'manifest.json'
+OFFSETS = 'offsets.npy'
+
+# column name -> dtype
+COLUMNS = {
+    'track': np.uint16,
+    'tick': np.int64,
+    'status': np.uint8,
+    'dataA': np.uint8,
+    'dataB': np.uint8,
+}
+
+
+def scan_corpus(corpus_dir):
+    """Relative paths of every .mid/.midi file under corpus_dir, sorted."""
+    found = []
+    for root, _, files in os.walk(corpus_dir):
+        for name in files:
+            if name.lower().endswith(('.mid', '.midi')):
+                found.append(os.path.relpath(os.path.join(root, name), corpus_dir))
+    return sorted(found)
+
+
+def parse_file(path):
+    """Parse one file into concatenated event columns plus file info."""
+    mf = MidiFile()
+    mf.verbose = False
+    mf.read(path)
+    parts = {name: [] for name in COLUMNS}
+    for i, track in enumerate(mf._tracks):
+        ticks, status, dataA, dataB = track.columns()
+        parts['track'].append(np.full(len(ticks), i, dtype=COLUMNS['track']))
+        parts['tick'].append(np.frombuffer(ticks, dtype=np.int64))
+        parts['status'].append(np.frombuffer(status, dtype=np.uint8))
+        parts['dataA'].append(np.frombuffer(dataA, dtype=np.uint8))
+        parts['dataB'].append(np.frombuffer(dataB, dtype=np.uint8))
+    cols = {name: np.concatenate(p) if p else np.zeros(0, COLUMNS[name]) for name, p in parts.items()}
+    info = {
+        'format': mf._format,
+        'division': mf._division,
+        'ntracks': len(mf._tracks),
+        'tempo': mf._tempoMap.get(0, 2.0),  # beats per second at tick 0
+        'last_tick': int(cols['tick'].max()) if len(cols['tick']) else 0,
+    }
+    return cols, info
+
+
+def _parse_entry(args):
+    path, rel = args
+    try:
+        cols, info = parse_file(path)
+    except (ValueError, EOFError, NotImplementedError) as e:
+        return rel, None, {'error': str(e)}
+    return rel, cols, info
+
+
+def load_manifest(index_dir):
+    path = os.path.join(index_dir, MANIFEST)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)['files']
+
+
+def build_index(corpus_dir, index_dir, workers=None):
+    """Create or refresh the index of corpus_dir in index_dir.
+
+    Files whose mtime and size match the manifest are copied over from the
+    existing store without being parsed again. Files that fail to parse are
+    kept in the manifest with an 'error' and no events.
+    Returns (number parsed, number reused).
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    old_entries = load_manifest(index_dir)
+    old = {e['path']: i for i, e in enumerate(old_entries)}
+    old_idx = MidiIndex(index_dir) if old_entries else None
+
+    entries = []
+    todo = []
+    for rel in scan_corpus(corpus_dir):
+        st = os.stat(os.path.join(corpus_dir, rel))
+        entry = {'path': rel, 'mtime': st.st_mtime, 'size': st.st_size}
+        prev = old_entries[old[rel]] if rel in old else None
+        if prev is not None and prev['mtime'] == entry['mtime'] and prev['size'] == entry['size']:
+            entries.append(dict(prev))
+        else:
+            entries.append(entry)
+            todo.append((os.path.join(corpus_dir, rel), rel))
+
+    parsed = {}
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for rel, cols, info in pool.map(_parse_entry, todo, chunksize=8):
+                parsed[rel] = (cols, info)
+
+    # sizes first, so each column can be written straight into its memmap
+    lengths = []
+    for entry in entries:
+        rel = entry['path']
+        if rel in parsed:
+            cols, info = parsed[rel]
+            entry.pop('error', None)
+            entry.update(info)
+            lengths.append(len(cols['tick']) if cols is not None else 0)
+        else:
+            i = old[rel]
+            lengths.append(int(old_idx.offsets[i + 1] - old_idx.offsets[i]))
+    offsets = np.zeros(len(entries) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    # write to temporary files, then swap them in, so the old store stays
+    # readable while it is being copied from
+    for name, dtype in COLUMNS.items():
+        tmp = os.path.join(index_dir, name + '.tmp.npy')
+        out = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=(int(offsets[-1]),))
+        for i, entry in enumerate(entries):
+            rel = entry['path']
+            if rel in parsed:
+                cols = parsed[rel][0]
+                if cols is not None:
+                    out[offsets[i]:offsets[i + 1]] = cols[name]
+            else:
+                j = old[rel]
+                src = getattr(old_idx, name)
+                out[offsets[i]:offsets[i + 1]] = src[old_idx.offsets[j]:old_idx.offsets[j + 1]]
+        out.flush()
+        del out
+    old_idx = None
+
+    for name in COLUMNS:
+        os.replace(os.path.join(index_dir, name + '.tmp.npy'), os.path.join(index_dir, name + '.npy'))
+    np.save(os.path.join(index_dir, OFFSETS), offsets)
+    with open(os.path.join(index_dir, MANIFEST), 'w') as f:
+        json.dump({'corpus': os.path.abspath(corpus_dir), 'files': entries}, f, indent=1)
+    return len(todo), len(entries) - len(todo)
+
+
+class MidiIndex:
+    """Read-only view of an index built by build_index()."""
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.files = load_manifest(index_dir)
+        self.offsets = np.load(os.path.join(index_dir, OFFSETS))
+        for name in COLUMNS:
+            setattr(self, name, np.load(os.path.join(index_dir, name + '.npy'), mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.files)
+
+    @property
+    def pitch(self):
+        return self.dataA
+
+    @property
+    def velocity(self):
+        return self.dataB
+
+    def file_of(self, rows):
+        """File number of each event row."""
+        return np.searchsorted(self.offsets, rows, side='right') - 1
+
+    def note_on(self):
+        """Mask of NOTEON events with velocity > 0."""
+        return ((self.status & 0xf0) == 0x90) & (self.velocity > 0)
+
+    def per_file_count(self, mask):
+        """Number of rows of mask set in each file."""
+        csum = np.concatenate([[0], np.cumsum(mask, dtype=np.int64)])
+        return csum[self.offsets[1:]] - csum[self.offsets[:-1]]
+
+    def per_file_max(self, values, where, initial=-1):
+        """Max of values over the rows where `where` is set, per file."""
+        out = np.full(len(self.files), initial, dtype=np.int64)
+        rows = np.flatnonzero(where)
+        np.maximum.at(out, self.file_of(rows), np.asarray(values)[rows])
+        return out
+
+    def files_where(self, mask):
+        """Paths of the files with at least one row matching mask."""
+        return [self.files[i]['path'] for i in np.flatnonzero(self.per_file_count(mask))]
+
+    def durations(self):
+        """Length of each file in seconds, assuming its starting tempo."""
+        div = np.array([f.get('division', 0) or 1 for f in self.files], dtype=np.float64)
+        bps = np.array([f.get('tempo', 2.0) for f in self.files], dtype=np.float64)
+        last = np.array([f.get('last_tick', 0) for f in self.files], dtype=np.float64)
+        return last / div / bps
+
+    def note_density(self):
+        """Note-ons per second for each file (0 for empty files)."""
+        secs = self.durations()
+        notes = self.per_file_count(self.note_on())
+        return np.divide(notes, secs, out=np.zeros(len(secs)), where=secs > 0)
+
+    def pitch_histogram(self, mask=None):
+        """Note-on count per MIDI pitch across the corpus (or the masked rows)."""
+        m = self.note_on() if mask is None else mask
+        return np.bincount(self.pitch[m], minlength=128)
+
+
+def main():
+    if len(sys.argv) < 3:
+        print('Usage: midiindex.py <corpus-dir> <index-dir>')
+        return
+    parsed, reused = build_index(sys.argv[1], sys.argv[2])
+    idx = MidiIndex(sys.argv[2])
+    print(f'{len(idx)} files, {idx.offsets[-1]} events ({parsed} parsed, {reused} unchanged)')
+    density = idx.note_density()
+    if len(density):
+        print(f'average note density: {density.mean():.2f} notes/s')
+    top = idx.per_file_max(idx.pitch, idx.note_on())
+    print(f'highest pitch: {top.max() if len(top) else None}')
+
+
+if __name__ == '__main__':
+    main()
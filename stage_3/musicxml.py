@@ -0,0 +1,327 @@
+"""MusicXML export of quantized stage 3 output.
+
+MuseScore re-quantizes a MIDI import and guesses the measures again. A
+MusicXML file carries our own grid instead. The writer takes the
+quantized notes (in ticks, with divisions = the MIDI division), the tempo
+map and the chords.json timeline. It cuts the notes into measures of the
+file's time signatures, starting a new <time> wherever the meter changes,
+and ties anything that crosses a barline. Each chord is written as a
+<harmony> at the beat where it starts. The key signature is only written
+when a key is given (e.g. the one pitch_correction.estimate_key found);
+without one there is no <key> rather than a made-up C major.
+
+Output is streamed one measure at a time to a .musicxml file or to the
+score.xml entry of a compressed .mxl zip. No DOM is built, so memory
+stays flat however long the score is.
+
+    python musicxml.py aligned.mid out.mxl [--chords chords.json] [--key "A minor"] [--title T]
+"""
+
+import argparse
+import json
+import zipfile
+from fractions import Fraction
+from typing import Iterator, List, Optional
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from midifile import MidiFile
+from notepairs import NoteArrays, pair_notes
+from timing import ROOTS, seconds_ticks
+from validate_midi import time_signatures
+
+STEPS = [('C', 0), ('C', 1), ('D', 0), ('D', 1), ('E', 0), ('F', 0),
+         ('F', 1), ('G', 0), ('G', 1), ('A', 0), ('A', 1), ('B', 0)]
+
+# (length in quarters, type, dots, triplet) for note and rest pieces
+NOTE_VALUES = [
+    (Fraction(4), 'whole', 0, False),
+    (Fraction(3), 'half', 1, False),
+    (Fraction(2), 'half', 0, False),
+    (Fraction(3, 2), 'quarter', 1, False),
+    (Fraction(1), 'quarter', 0, False),
+    (Fraction(3, 4), 'eighth', 1, False),
+    (Fraction(1, 2), 'eighth', 0, False),
+    (Fraction(3, 8), '16th', 1, False),
+    (Fraction(1, 4), '16th', 0, False),
+    (Fraction(1, 8), '32nd', 0, False),
+    (Fraction(4, 3), 'half', 0, True),
+    (Fraction(2, 3), 'quarter', 0, True),
+    (Fraction(1, 3), 'eighth', 0, True),
+    (Fraction(1, 6), '16th', 0, True),
+]
+
+HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML 4.0 Partwise//EN" "http://www.musicxml.org/dtds/partwise.dtd">
+<score-partwise version="4.0">
+  <work><work-title>{title}</work-title></work>
+  <part-list>
+    <score-part id="P1"><part-name>Melody</part-name></score-part>
+  </part-list>
+  <part id="P1">
+'''
+FOOTER = '''  </part>
+</score-partwise>
+'''
+CONTAINER = '''<?xml version="1.0" encoding="UTF-8"?>
+<container>
+  <rootfiles>
+    <rootfile full-path="score.xml" media-type="application/vnd.recordare.musicxml+xml"/>
+  </rootfiles>
+</container>
+'''
+
+
+def chords_per_beat(chords, tempo_map, division, last_tick):
+    """(tick, chord name) at each beat where the sounding chord changes.
+
+    chords.json changes many times a second; sampling it once per beat
+    keeps the symbols readable.
+    """
+    if not chords:
+        return []
+    change = seconds_ticks([c['time'] for c in chords], tempo_map, division)
+    beats = np.arange(0, last_tick + 1, division)
+    idx = np.searchsorted(change, beats, side='right') - 1
+    keep = (idx >= 0) & np.concatenate([[True], idx[1:] != idx[:-1]])
+    return [(int(t), chords[i]['chord']) for t, i in zip(beats[keep].tolist(), idx[keep].tolist())]
+
+
+def _pieces(ticks, division):
+    """Split a length into note values: (ticks, type, dots, triplet)."""
+    values = [(int(q * division), t, d, tr) for q, t, d, tr in NOTE_VALUES if (q * division).denominator == 1]
+    straight_unit = min(v[0] for v in values if not v[3])
+    out = []
+    while ticks > 0:
+        # triplet values only for what the straight grid can't spell
+        triplet = ticks % straight_unit != 0
+        fitting = [v for v in values if v[0] <= ticks]
+        if not fitting:
+            # shorter than any value: lengthen the previous piece and
+            # spell it as the value nearest its new length
+            if out:
+                ticks += out.pop()[0]
+            nearest = min(values, key=lambda v: abs(v[0] - ticks))
+            out.append((ticks,) + nearest[1:])
+            break
+        piece = next((v for v in fitting if v[3] == triplet), fitting[0])
+        out.append(piece)
+        ticks -= piece[0]
+    return out
+
+
+def _note_xml(pitches, kind, tie_start, tie_stop):
+    length, ntype, dots, triplet = kind
+    extra = ''.join('<dot/>' for _ in range(dots))
+    if triplet:
+        extra += '<time-modification><actual-notes>3</actual-notes><normal-notes>2</normal-notes></time-modification>'
+    if pitches is None:
+        return f'      <note><rest/><duration>{length}</duration><type>{ntype}</type>{extra}</note>\n'
+    out = []
+    for i, p in enumerate(pitches):
+        step, alter = STEPS[p % 12]
+        ties = ('<tie type="stop"/>' if tie_stop else '') + ('<tie type="start"/>' if tie_start else '')
+        tied = ('<tied type="stop"/>' if tie_stop else '') + ('<tied type="start"/>' if tie_start else '')
+        out.append(
+            '      <note>' + ('<chord/>' if i else '')
+            + f'<pitch><step>{step}</step>' + (f'<alter>{alter}</alter>' if alter else '')
+            + f'<octave>{p // 12 - 1}</octave></pitch><duration>{length}</duration>{ties}'
+            + f'<voice>1</voice><type>{ntype}</type>{extra}'
+            + (f'<notations>{tied}</notations>' if tied else '') + '</note>\n')
+    return ''.join(out)
+
+
+def _harmony_xml(name, offset):
+    root, _, quality = name.partition(' ')
+    if root not in ROOTS:
+        return ''
+    step, alter = STEPS[ROOTS.index(root)]
+    kind = 'minor' if quality.startswith('min') else 'major'
+    return ('      <harmony><root><root-step>' + step + '</root-step>'
+            + (f'<root-alter>{alter}</root-alter>' if alter else '') + '</root>'
+            + f'<kind>{kind}</kind>' + (f'<offset>{offset}</offset>' if offset else '') + '</harmony>\n')
+
+
+def key_fifths(key):
+    """<fifths> of a (tonic pitch class, 'major' or 'minor') key."""
+    tonic, mode = key
+    major = (tonic + 3) % 12 if mode == 'minor' else tonic
+    fifths = major * 7 % 12
+    return fifths - 12 if fifths > 6 else fifths
+
+
+def parse_key(name):
+    """'A minor' or 'Eb major' -> (tonic pitch class, mode)."""
+    root, _, mode = name.partition(' ')
+    flat = root.endswith('b') and len(root) > 1
+    tonic = ROOTS.index(root[:-1] if flat else root) - flat
+    return tonic % 12, 'minor' if mode.lower().startswith('min') else 'major'
+
+
+def bars(time_sigs, division, last):
+    """(start tick, length, beats, beat type) of every measure needed to
+    reach last. A meter takes effect at its tick; a measure that would run
+    past a change is cut short there."""
+    if np.ndim(time_sigs[0]) == 0:  # a single (beats, beat type)
+        time_sigs = [(0,) + tuple(time_sigs)]
+    changes = [t for t, _, _ in time_sigs[1:]] + [None]
+    pos, i = 0, 0
+    while True:
+        while changes[i] is not None and changes[i] <= pos:
+            i += 1
+        _, beats, beat_type = time_sigs[i]
+        length = division * 4 * beats // beat_type
+        if changes[i] is not None:
+            length = min(length, changes[i] - pos)
+        yield pos, length, beats, beat_type
+        pos += length
+        if pos >= last:
+            return
+
+
+def note_groups(notes: NoteArrays):
+    """(onset, duration, pitches) with notes that start together merged
+    into one chord and overlaps cut at the next onset (a single voice)."""
+    order = np.lexsort((notes.pitch, notes.onset))
+    onset, end, pitch = notes.onset[order], notes.end()[order], notes.pitch[order]
+    starts = np.flatnonzero(np.concatenate([[True], onset[1:] != onset[:-1]]))
+    bounds = np.append(starts, len(onset))
+    group_onset = onset[starts]
+    group_end = np.minimum.reduceat(end, starts) if len(starts) else end[:0]
+    group_end = np.minimum(group_end, np.append(group_onset[1:], np.iinfo(np.int64).max))
+    for g in range(len(starts)):
+        dur = int(group_end[g] - group_onset[g])
+        if dur > 0:
+            yield int(group_onset[g]), dur, pitch[bounds[g]:bounds[g + 1]].tolist()
+
+
+def measures(notes: NoteArrays, division, time_sig=(4, 4), bpm=None, harmonies=(), key=None) -> Iterator[str]:
+    """MusicXML <measure> elements, one string per measure.
+
+    time_sig is a (beats, beat type) pair or a list of (tick, beats, beat
+    type) meter changes as validate_midi.time_signatures returns.
+    """
+    groups = note_groups(notes)
+    harmonies = list(harmonies)
+    h = 0
+    group = next(groups, None)
+    last = int(notes.end().max()) if len(notes) else 0
+    layout = list(bars(time_sig, division, last))
+    nmeasures = len(layout)
+    carry = None  # (pitches, ticks left) of a note tied over the barline
+    meter = None
+
+    for m, (m0, bar, beats, beat_type) in enumerate(layout):
+        m1 = m0 + bar
+        out = [f'    <measure number="{m + 1}">\n']
+        time_xml = f'<time><beats>{beats}</beats><beat-type>{beat_type}</beat-type></time>'
+        if m == 0:
+            out.append(f'      <attributes><divisions>{division}</divisions>'
+                       + (f'<key><fifths>{key_fifths(key)}</fifths><mode>{key[1]}</mode></key>' if key else '')
+                       + time_xml + '<clef><sign>G</sign><line>2</line></clef></attributes>\n')
+            if bpm:
+                out.append(f'      <direction placement="above"><direction-type><metronome>'
+                           f'<beat-unit>quarter</beat-unit><per-minute>{bpm:g}</per-minute></metronome>'
+                           f'</direction-type><sound tempo="{bpm:g}"/></direction>\n')
+        elif (beats, beat_type) != meter:
+            out.append(f'      <attributes>{time_xml}</attributes>\n')
+        meter = (beats, beat_type)
+        pos = m0
+        while pos < m1:
+            if carry is not None:
+                pitches, left = carry
+                tie_stop = True
+            elif group is not None and group[0] <= pos:
+                _, left, pitches = group
+                tie_stop = False
+                group = next(groups, None)
+            else:
+                pitches = None
+                left = (min(group[0], m1) if group is not None else m1) - pos
+                tie_stop = False
+            length = min(left, m1 - pos)
+            carry = (pitches, left - length) if pitches is not None and left > length else None
+
+            pieces = _pieces(length, division)
+            piece_pos = pos
+            for i, kind in enumerate(pieces):
+                while h < len(harmonies) and harmonies[h][0] < piece_pos + kind[0]:
+                    if harmonies[h][0] >= m0:
+                        out.append(_harmony_xml(harmonies[h][1], max(0, harmonies[h][0] - piece_pos)))
+                    h += 1
+                if pitches is None:
+                    out.append(_note_xml(None, kind, False, False))
+                else:
+                    more = i < len(pieces) - 1 or carry is not None
+                    out.append(_note_xml(pitches, kind, more, tie_stop or i > 0))
+                piece_pos += kind[0]
+            pos += length
+        if m == nmeasures - 1:
+            out.append('      <barline location="right"><bar-style>light-heavy</bar-style></barline>\n')
+        out.append('    </measure>\n')
+        yield ''.join(out)
+
+
+def write_musicxml(path, notes: NoteArrays, division, tempo_map=None, time_sig=(4, 4),
+                   chords: Optional[List[dict]] = None, title='Transcription', key=None):
+    """Stream a score to path; a .mxl path gets a compressed MusicXML zip.
+
+    key is a (tonic pitch class, 'major' or 'minor') pair, as
+    pitch_correction.estimate_key returns; None leaves the key out.
+    """
+    tempo_map = tempo_map or {0: 2.0}
+    last = int(notes.end().max()) if len(notes) else 0
+    harmonies = chords_per_beat(chords, tempo_map, division, last)
+    bpm = round(tempo_map.get(0, 2.0) * 60.0, 2)
+    parts = measures(notes, division, time_sig, bpm, harmonies, key)
+    head = HEADER.format(title=escape(title))
+
+    if str(path).endswith('.mxl'):
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr('mimetype', 'application/vnd.recordare.musicxml', compress_type=zipfile.ZIP_STORED)
+            z.writestr('META-INF/container.xml', CONTAINER)
+            with z.open('score.xml', 'w') as f:
+                f.write(head.encode())
+                for measure in parts:
+                    f.write(measure.encode())
+                f.write(FOOTER.encode())
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(head)
+            for measure in parts:
+                f.write(measure)
+            f.write(FOOTER)
+    return path
+
+
+def midi_to_musicxml(mf: MidiFile, path, chords=None, title='Transcription', key=None):
+    """Write every track's notes of a (quantized) MidiFile as one part."""
+    tracks = [pair_notes(t) for t in mf._tracks]
+    notes = NoteArrays(*(np.concatenate([getattr(n, f) for n in tracks] or [np.zeros(0, np.int64)])
+                         for f in ('onset', 'duration', 'pitch', 'channel', 'velocity')))
+    return write_musicxml(path, notes, mf._division, mf._tempoMap, time_signatures(mf), chords, title, key)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a quantized MIDI file to MusicXML")
+    parser.add_argument("midi")
+    parser.add_argument("output", help=".musicxml or .mxl")
+    parser.add_argument("--chords", help="chords.json from stage 2")
+    parser.add_argument("--key", help='key signature, e.g. "A minor" (left out if not given)')
+    parser.add_argument("--title", default="Transcription")
+    args = parser.parse_args()
+
+    mf = MidiFile()
+    mf.verbose = False
+    mf.read(args.midi)
+    chords = None
+    if args.chords:
+        with open(args.chords) as f:
+            chords = json.load(f)
+    midi_to_musicxml(mf, args.output, chords, args.title, parse_key(args.key) if args.key else None)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
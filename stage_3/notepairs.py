@@ -0,0 +1,99 @@
+"""Pair the NOTEON/NOTEOFF events of a MidiTrack into note arrays.
+
+MidiTrack only stores independent on/off events; quantizing those one by
+one can collapse or invert a note. pair_notes() matches them up once so
+the rest of stage 3 can work on (onset, duration) arrays instead.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from midifile import MidiTrack
+
+
+@dataclass
+class NoteArrays:
+    onset: np.ndarray       # absolute tick of the note-on
+    duration: np.ndarray    # ticks until the matching note-off
+    pitch: np.ndarray
+    channel: np.ndarray
+    velocity: np.ndarray
+    unmatched_on: int = 0   # note-ons never switched off (closed at the last tick)
+    unmatched_off: int = 0  # note-offs with no sounding note to end
+
+    def __len__(self) -> int:
+        return len(self.onset)
+
+    def end(self) -> np.ndarray:
+        return self.onset + self.duration
+
+    def take(self, idx) -> 'NoteArrays':
+        return NoteArrays(self.onset[idx], self.duration[idx], self.pitch[idx],
+                          self.channel[idx], self.velocity[idx],
+                          self.unmatched_on, self.unmatched_off)
+
+
+def note_rows(track: MidiTrack):
+    """Split the track's rows into note-on rows, note-off rows and the rest.
+
+    A NOTEON with velocity 0 counts as a note-off.
+    """
+    ticks, status, dataA, dataB = track.columns()
+    st = np.frombuffer(status, dtype=np.uint8)
+    vel = np.frombuffer(dataB, dtype=np.uint8)
+    hi = st & 0xf0
+    is_on = (hi == 0x90) & (vel > 0)
+    is_off = (hi == 0x80) | ((hi == 0x90) & (vel == 0))
+    return is_on, is_off, ~(is_on | is_off)
+
+
+def pair_notes(track: MidiTrack) -> NoteArrays:
+    """Match note-ons to note-offs by (channel, pitch).
+
+    Each key keeps a stack of sounding note-ons, so a note-off ends the
+    most recent note-on of the same pitch. Notes come back ordered by
+    onset (then file order).
+    """
+    ticks, status, dataA, dataB = track.columns()
+    is_on, is_off, _ = note_rows(track)
+    rows = np.flatnonzero(is_on | is_off)
+
+    st = np.frombuffer(status, dtype=np.uint8)
+    keys = ((st[rows] & 0x0f).astype(np.int32) << 7) | (np.frombuffer(dataA, dtype=np.uint8)[rows] & 0x7f)
+
+    stacks = {}
+    on_rows = []
+    off_rows = []
+    unmatched_off = 0
+    for row, key, on in zip(rows.tolist(), keys.tolist(), is_on[rows].tolist()):
+        if on:
+            stacks.setdefault(key, []).append(row)
+        else:
+            stack = stacks.get(key)
+            if stack:
+                on_rows.append(stack.pop())
+                off_rows.append(row)
+            else:
+                unmatched_off += 1
+
+    # still sounding at the end of the track: close them at the last tick
+    open_rows = [row for stack in stacks.values() for row in stack]
+    last = len(ticks) - 1
+
+    on_idx = np.array(on_rows + open_rows, dtype=np.int64)
+    off_idx = np.array(off_rows + [last] * len(open_rows), dtype=np.int64)
+    order = np.argsort(on_idx, kind='stable')
+    on_idx = on_idx[order]
+    off_idx = off_idx[order]
+
+    tick = np.frombuffer(ticks, dtype=np.int64)
+    return NoteArrays(
+        onset=tick[on_idx],
+        duration=tick[off_idx] - tick[on_idx],
+        pitch=(np.frombuffer(dataA, dtype=np.uint8)[on_idx] & 0x7f).astype(np.int16),
+        channel=(st[on_idx] & 0x0f).astype(np.int16),
+        velocity=np.frombuffer(dataB, dtype=np.uint8)[on_idx].astype(np.int16),
+        unmatched_on=len(open_rows),
+        unmatched_off=unmatched_off,
+    )
@@ -0,0 +1,244 @@
+"""Piano-roll previews of stage 3 output, as PNG or SVG.
+
+The PNG path never draws a note at a time: note spans are scattered
+into per-pitch difference arrays and a cumulative sum along time turns
+them into coverage, so the cost is a few array passes over the image
+however many notes there are. Beat and bar lines come from the file's
+tempo map and first time signature. The chord timeline from stage 2's
+chords.json is a colour lane along the top: the hue is the root, and
+minor chords are darker. The SVG has the same layers, plus the chord
+names as text.
+
+    python pianoroll.py aligned.mid [--chords chords.json] [-o roll.png|roll.svg]
+
+png_bytes() output can be handed straight to tk.PhotoImage(data=...).
+
+A 10 minute song renders in a few tens of milliseconds (see
+bench_pianoroll.py).
+"""
+
+import argparse
+import json
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+from midifile import MidiFile
+from notepairs import pair_notes
+from timing import ROOTS, tick_seconds
+from validate_midi import bar_ticks
+
+PX_PER_SECOND = 20
+NOTE_HEIGHT = 4
+CHORD_LANE = 12
+
+BACKGROUND = (255, 255, 255)
+BLACK_KEY_ROW = (242, 242, 246)
+BEAT_LINE = (225, 225, 232)
+BAR_LINE = (160, 160, 175)
+NOTE = (70, 130, 180)
+NOTE_ONSET = (25, 60, 95)
+
+_BLACK_KEYS = np.array([0, 1, 0, 1, 0, 0, 1, 0, 1, 0, 1, 0], dtype=bool)
+
+
+@dataclass
+class Roll:
+    """Everything a preview draws, in seconds."""
+    start: np.ndarray
+    end: np.ndarray
+    pitch: np.ndarray
+    beats: np.ndarray           # beat line times
+    bars: np.ndarray            # bar line times
+    chords: Optional[List[dict]] = None  # [{"time": s, "chord": "C Maj"}, ...]
+
+
+def roll_from_midi(mf: MidiFile, chords=None) -> Roll:
+    """Notes of every track of mf, with beat and bar lines to the end."""
+    tracks = [pair_notes(t) for t in mf._tracks]
+    onset = np.concatenate([n.onset for n in tracks] or [np.zeros(0, np.int64)])
+    end = np.concatenate([n.end() for n in tracks] or [np.zeros(0, np.int64)])
+    pitch = np.concatenate([n.pitch for n in tracks] or [np.zeros(0, np.int64)])
+
+    last = int(end.max()) if len(end) else 0
+    div = mf._division
+    beat_ticks = np.arange(0, last + div, div)
+    bar_line_ticks = np.arange(0, last + div, bar_ticks(mf))
+    return Roll(
+        start=tick_seconds(onset, mf._tempoMap, div),
+        end=tick_seconds(end, mf._tempoMap, div),
+        pitch=pitch,
+        beats=tick_seconds(beat_ticks, mf._tempoMap, div),
+        bars=tick_seconds(bar_line_ticks, mf._tempoMap, div),
+        chords=chords,
+    )
+
+
+def _pitch_range(roll):
+    if not len(roll.pitch):
+        return 60, 72
+    return max(0, int(roll.pitch.min()) - 1), min(127, int(roll.pitch.max()) + 1)
+
+
+def chord_colours(chords):
+    """RGB per chord: hue from the root, minor chords darker, no chord
+    ("N") left as background."""
+    colours = np.zeros((len(chords), 3), dtype=np.uint8)
+    for i, c in enumerate(chords):
+        root, _, quality = c['chord'].partition(' ')
+        if root not in ROOTS:
+            colours[i] = BACKGROUND
+            continue
+        hue = ROOTS.index(root) / 12.0
+        value = 0.6 if quality.startswith('min') else 0.9
+        rgb = np.clip(np.abs((hue * 6.0 + np.array([0.0, 4.0, 2.0])) % 6.0 - 3.0) - 1.0, 0.0, 1.0)
+        colours[i] = np.round(255 * value * (0.55 + 0.45 * rgb))
+    return colours
+
+
+def render(roll: Roll, px_per_second=PX_PER_SECOND, note_height=NOTE_HEIGHT) -> np.ndarray:
+    """Draw roll into an (height, width, 3) uint8 image."""
+    low, high = _pitch_range(roll)
+    nrows = high - low + 1
+    duration = max(float(roll.end.max()) if len(roll.end) else 0.0,
+                   float(roll.beats[-1]) if len(roll.beats) else 0.0)
+    width = int(np.ceil(duration * px_per_second)) + 1
+    lane = CHORD_LANE if roll.chords else 0
+    img = np.empty((lane + nrows * note_height, width, 3), dtype=np.uint8)
+
+    # background: black-key rows shaded, highest pitch at the top
+    row_pitch = np.arange(high, low - 1, -1)
+    row_colour = np.where(_BLACK_KEYS[row_pitch % 12][:, None], BLACK_KEY_ROW, BACKGROUND).astype(np.uint8)
+    img[lane:] = np.repeat(row_colour, note_height, axis=0)[:, None, :]
+
+    def columns(times):
+        return np.clip(np.round(np.asarray(times) * px_per_second).astype(np.int64), 0, width - 1)
+
+    img[lane:, columns(roll.beats)] = BEAT_LINE
+    img[lane:, columns(roll.bars)] = BAR_LINE
+
+    if len(roll.pitch):
+        # coverage per pitch row: +1 at the note's first column, -1 after
+        # its last, cumulative sum along time
+        x0 = columns(roll.start)
+        x1 = np.maximum(columns(roll.end), x0 + 1)
+        row = (high - roll.pitch).astype(np.int64)
+        diff = np.zeros((nrows, width + 1), dtype=np.int32)
+        np.add.at(diff, (row, x0), 1)
+        np.add.at(diff, (row, x1), -1)
+        covered = np.cumsum(diff[:, :width], axis=1) > 0
+        onset = np.zeros((nrows, width), dtype=bool)
+        onset[row, x0] = True
+
+        # leave a 1px gap between rows
+        body = np.repeat(covered, note_height, axis=0)
+        heads = np.repeat(onset, note_height, axis=0)
+        if note_height > 2:
+            body[note_height - 1::note_height] = False
+            heads[note_height - 1::note_height] = False
+        notes = img[lane:]
+        notes[body] = NOTE
+        notes[heads] = NOTE_ONSET
+
+    if lane:
+        times = np.array([c['time'] for c in roll.chords], dtype=np.float64)
+        col_times = np.arange(width) / px_per_second
+        idx = np.searchsorted(times, col_times, side='right') - 1
+        colours = np.vstack([np.array([BACKGROUND], dtype=np.uint8), chord_colours(roll.chords)])
+        img[:lane - 1] = colours[idx + 1][None, :, :]
+        img[lane - 1] = BAR_LINE
+    return img
+
+
+def png_bytes(img: np.ndarray, level=1) -> bytes:
+    """Encode an RGB uint8 image as PNG (zlib only, no imaging library)."""
+    height, width, _ = img.shape
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    # filter type 0 in front of every scanline
+    raw = np.concatenate([np.zeros((height, 1), np.uint8), img.reshape(height, width * 3)], axis=1)
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw.tobytes(), level))
+            + chunk(b'IEND', b''))
+
+
+def render_svg(roll: Roll, px_per_second=PX_PER_SECOND, note_height=NOTE_HEIGHT) -> str:
+    low, high = _pitch_range(roll)
+    duration = max(float(roll.end.max()) if len(roll.end) else 0.0,
+                   float(roll.beats[-1]) if len(roll.beats) else 0.0)
+    width = duration * px_per_second
+    lane = CHORD_LANE if roll.chords else 0
+    height = lane + (high - low + 1) * note_height
+
+    def hex_colour(rgb):
+        return '#%02x%02x%02x' % tuple(int(v) for v in rgb)
+
+    out = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.0f}" height="{height}" '
+           f'viewBox="0 0 {width:.1f} {height}">',
+           f'<rect width="100%" height="100%" fill="{hex_colour(BACKGROUND)}"/>']
+    for p in range(low, high + 1):
+        if _BLACK_KEYS[p % 12]:
+            out.append(f'<rect x="0" y="{lane + (high - p) * note_height}" width="{width:.1f}" '
+                       f'height="{note_height}" fill="{hex_colour(BLACK_KEY_ROW)}"/>')
+    for times, colour in ((roll.beats, BEAT_LINE), (roll.bars, BAR_LINE)):
+        xs = np.asarray(times) * px_per_second
+        out.append(f'<path stroke="{hex_colour(colour)}" stroke-width="1" d="'
+                   + ''.join(f'M{x:.1f} {lane}V{height}' for x in xs.tolist()) + '"/>')
+
+    xs = (roll.start * px_per_second).tolist()
+    ws = np.maximum((roll.end - roll.start) * px_per_second, 1.0).tolist()
+    ys = (lane + (high - roll.pitch) * note_height).tolist()
+    out.append(f'<g fill="{hex_colour(NOTE)}">')
+    out.extend(f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{note_height - 1}"/>'
+               for x, y, w in zip(xs, ys, ws))
+    out.append('</g>')
+
+    if roll.chords:
+        colours = chord_colours(roll.chords)
+        ends = [c['time'] for c in roll.chords[1:]] + [duration]
+        for c, end, colour in zip(roll.chords, ends, colours):
+            x, w = c['time'] * px_per_second, max(0.0, end - c['time']) * px_per_second
+            out.append(f'<rect x="{x:.1f}" y="0" width="{w:.1f}" height="{lane - 1}" '
+                       f'fill="{hex_colour(colour)}"><title>{c["chord"]}</title></rect>')
+            if w > 30 and c['chord'].partition(' ')[0] in ROOTS:
+                out.append(f'<text x="{x + 2:.1f}" y="{lane - 3}" font-size="{lane - 3}" '
+                           f'font-family="sans-serif">{c["chord"]}</text>')
+    out.append('</svg>')
+    return '\n'.join(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a piano-roll preview of a MIDI file")
+    parser.add_argument("midi")
+    parser.add_argument("--chords", help="chords.json from stage 2")
+    parser.add_argument("-o", "--output", default="pianoroll.png", help=".png or .svg")
+    parser.add_argument("--px-per-second", type=float, default=PX_PER_SECOND)
+    parser.add_argument("--note-height", type=int, default=NOTE_HEIGHT)
+    args = parser.parse_args()
+
+    mf = MidiFile()
+    mf.verbose = False
+    mf.read(args.midi)
+    chords = None
+    if args.chords:
+        with open(args.chords) as f:
+            chords = json.load(f)
+    roll = roll_from_midi(mf, chords)
+    if args.output.endswith('.svg'):
+        with open(args.output, 'w') as f:
+            f.write(render_svg(roll, args.px_per_second, args.note_height))
+    else:
+        with open(args.output, 'wb') as f:
+            f.write(png_bytes(render(roll, args.px_per_second, args.note_height)))
+    print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
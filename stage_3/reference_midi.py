@@ -0,0 +1,218 @@
+"""A plain reference decoder for checking MidiFile against.
+
+This is MuseScore's MidiFile::read/readEvent written out again one byte
+at a time, without the dispatch tables, columns or buffer tricks of
+midifile.py, and sharing no code with it. It is slow on purpose: every
+rule is one readable branch, so when the two disagree it is easy to tell
+which one is wrong. bench_midifile.py runs both over random files.
+
+The rules it pins down:
+
+- a delta time or length is a VLQ of at most 16 bytes (ValueError past
+  that); running out of bytes anywhere is an EOFError
+- 0xf1-0xfe (except 0xf7) where a status is expected are skipped
+- 0xf0/0xf7 are sysex and 0xff meta; both end running status, but the
+  last channel status (sstatus) comes back for a data byte after them
+- a data byte with no status ever seen is an empty event
+- PROGRAM and AFTERTOUCH take one data byte, other channel messages two;
+  a second data byte with the high bit set is stored, then becomes the
+  running status; a first one with it set is a ValueError
+- EOT ends the track; bytes after it are left unread
+- a negative division is SMPTE: frames per second (the negated high
+  byte) times ticks per frame (the low byte)
+- format 0 reads one track, format 1 as many as the header says,
+  anything else is NotImplementedError
+
+decode() returns the same shape as midifile_state() for a MidiFile, and
+after_write() what MidiFile.write() makes of a decoded file.
+"""
+
+META = 0xff
+META_EOT = 0x2f
+META_TEMPO = 0x51
+
+
+class _Cursor:
+    def __init__(self, data, pos=0, end=None):
+        self.data = data
+        self.pos = pos
+        self.end = len(data) if end is None else end
+
+    def get(self):
+        if self.pos >= self.end:
+            raise EOFError('reference: unexpected EOF')
+        c = self.data[self.pos]
+        self.pos += 1
+        return c
+
+    def take(self, n):
+        if self.pos + n > self.end:
+            raise EOFError('reference: unexpected EOF')
+        chunk = bytes(self.data[self.pos:self.pos + n])
+        self.pos += n
+        return chunk
+
+    def number(self, n):
+        return int.from_bytes(self.take(n), 'big')
+
+    def getvl(self):
+        value = 0
+        for _ in range(16):
+            c = self.get()
+            value = (value << 7) | (c & 0x7f)
+            if not c & 0x80:
+                return value
+        raise ValueError('reference: VLQ longer than 16 bytes')
+
+
+def _decode_track(cur, tempo_map):
+    """Rows (tick, status, a, b, payload), EOT seen, bytes left."""
+    rows = []
+    tick = 0
+    status = sstatus = -1
+    while cur.pos < cur.end:
+        tick += cur.getvl()
+        me = cur.get()
+        while 0xf1 <= me <= 0xfe and me != 0xf7:
+            me = cur.get()
+
+        if me == META:
+            status = -1
+            kind = cur.get()
+            payload = cur.take(cur.getvl())
+            if kind == META_EOT:
+                return rows, True, cur.end - cur.pos
+            if kind == META_TEMPO and len(payload) >= 3:
+                tempo_map[tick] = 1000000.0 / float(int.from_bytes(payload[:3], 'big'))
+            rows.append((tick, META, kind, 0, payload))
+            continue
+        if me in (0xf0, 0xf7):
+            status = -1
+            rows.append((tick, me, 0, 0, cur.take(cur.getvl())))
+            continue
+
+        if me & 0x80:
+            status = sstatus = me
+            a = cur.get()
+        else:
+            if status == -1:
+                if sstatus == -1:
+                    rows.append((tick, 0, 0, 0, b''))
+                    continue
+                status = sstatus
+            a = me
+
+        kind = status & 0xf0
+        if kind in (0x80, 0x90, 0xa0, 0xb0, 0xe0):
+            b = cur.get()
+        elif kind in (0xc0, 0xd0):
+            b = 0
+        else:
+            raise ValueError(f'reference: 0x{status:02x} is not a channel status')
+        rows.append((tick, status, a, b, b''))
+        if b & 0x80:
+            status = sstatus = b
+        elif a & 0x80:
+            raise ValueError('reference: status byte in place of data')
+    return rows, False, 0
+
+
+def decode(data):
+    """('ok', format, division, tempo map, bytes read, tracks) with tracks
+    a list of (rows, eot, unread), or ('error', exception class name)."""
+    try:
+        cur = _Cursor(data)
+        tag = cur.take(4)
+        length = cur.number(4)
+        if tag != b'MThd' or length < 6:
+            raise ValueError('reference: MThd expected')
+        fmt = cur.number(2)
+        ntracks = cur.number(2)
+        division = cur.number(2)
+        if division & 0x8000:
+            fps = 0x100 - (division >> 8)
+            division = fps * (division & 0xff)
+        cur.take(length - 6)
+
+        if fmt == 0:
+            ntracks = 1
+        elif fmt != 1:
+            raise NotImplementedError(f'reference: format {fmt}')
+        tempo_map = {}
+        tracks = []
+        for _ in range(ntracks):
+            if cur.take(4) != b'MTrk':
+                raise ValueError('reference: MTrk expected')
+            length = cur.number(4)
+            body = _Cursor(data, cur.pos, cur.pos + length)
+            cur.take(length)
+            tracks.append(_decode_track(body, tempo_map))
+        return ('ok', fmt, division, tempo_map, cur.pos, tracks)
+    except (EOFError, ValueError, NotImplementedError, ZeroDivisionError) as e:
+        return ('error', type(e).__name__)
+
+
+def midifile_state(mf):
+    """A read MidiFile in the shape decode() returns."""
+    tracks = []
+    for track in mf._tracks:
+        ticks, status, dataA, dataB = track.columns()
+        rows = [(ticks[i], status[i], dataA[i], dataB[i], bytes(track.edata.get(i, b'')))
+                for i in range(len(ticks))]
+        tracks.append((rows, track.eot, track.unread))
+    return ('ok', mf._format, mf._division, dict(mf._tempoMap), mf.bytes_read, tracks)
+
+
+def after_write(state):
+    """What decode() should give for MidiFile.write() of a file that
+    decoded to state: a tempo event from the tick 0 tempo (default 120
+    bpm) at the start of every track, tempo and empty events dropped,
+    data bytes masked to 7 bits, EOT one tick after the last event."""
+    _, fmt, division, tempo_map, _, tracks = state
+    usec = round(1000000.0 / tempo_map.get(0, 2.0))
+    tempo = bytes([(usec >> 16) & 0xff, (usec >> 8) & 0xff, usec & 0xff])
+    written = []
+    size = 14
+    for rows, _, _ in tracks:
+        kept = [(0, META, META_TEMPO, 0, tempo)]
+        for tick, status, a, b, payload in rows:
+            if status == 0 or (status == META and a == META_TEMPO):
+                continue
+            if status < 0xf0:
+                b = b & 0x7f if status & 0xf0 not in (0xc0, 0xd0) else 0
+                kept.append((tick, status, a & 0x7f, b, payload))
+            else:
+                kept.append((tick, status, a if status == META else 0, 0, payload))
+        written.append((kept, True, 0))
+        size += 8 + _track_size(kept)
+    read_tempo = {0: 1000000.0 / float(int.from_bytes(tempo, 'big'))}
+    return ('ok', fmt, division, read_tempo, size, written)
+
+
+def _vlq_size(value):
+    size = 1
+    while value >> 7:
+        value >>= 7
+        size += 1
+    return size
+
+
+def _track_size(rows):
+    """Bytes of an MTrk body MidiFile.write() gives rows (running status
+    within channel messages, EOT one tick after the last row)."""
+    size = 0
+    tick = 0
+    status = -1
+    for row_tick, st, _, _, payload in rows:
+        size += _vlq_size(row_tick - tick)
+        tick = row_tick
+        if st == META:
+            size += 2 + _vlq_size(len(payload)) + len(payload)
+            status = -1
+        elif st >= 0xf0:
+            size += 1 + _vlq_size(len(payload)) + len(payload)
+            status = -1
+        else:
+            size += (st != status) + (1 if st & 0xf0 in (0xc0, 0xd0) else 2)
+            status = st
+    return size + 4  # \x01 \xff \x2f \x00
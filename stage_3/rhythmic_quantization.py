@@ -1,10 +1,22 @@
 """MIDI Encoding and Parsing Based on MuseScore MIDI tools, by Werner Schweer"""
 """https://github.com/musescore/MuseScore/tree/master/tools/miditools"""
 
+from array import array
+
+import numpy as np
+
 from midifile import MidiFile
 from midifile import MidiTrack
 from midievent import MidiEventType
 from tempomap import TempoMap
+from notepairs import NoteArrays, note_rows, pair_notes
+from grid_inference import snap_beats_dp
+from musicxml import midi_to_musicxml
+
+# Note values a quantized duration may snap to, in beats: sixteenth,
+# eighth-note triplet, eighth, quarter, half, whole. Notes longer than the
+# last value snap to multiples of it (tied whole notes)
+NOTE_VALUES = (0.25, 1.0 / 3.0, 0.5, 1.0, 2.0, 4.0)
 
 def ticks_to_seconds(delta_tick, tempo, division):
     return (delta_tick * (1 / division) * (1 / tempo)) * 60.0
@@ -22,8 +34,6 @@ def align_midi_ticks(midi, bpm, sixteenth, triplet_u):
     aligned = MidiFile()
     
     # 1) Copy Header
-    aligned.curPos = 0
-
     aligned._format = midi._format
     aligned._division = midi._division
     # aligned._tempoMap = midi._tempoMap
@@ -47,7 +57,7 @@ def align_midi_ticks(midi, bpm, sixteenth, triplet_u):
         align_click_acc = 0
 
         # 2) For each OG Track Event
-        for click, og_event in sorted(og_track.events().items()):
+        for click, og_events in sorted(og_track.events().items()):
             # og_track_tempo = midi._tempoMap[click]
             # og_track_tempo = 1000000.0 / midi._tempoMap[0] # assuming for now the base midi don't change tempo
             # og_tempo_raw = None
@@ -83,17 +93,139 @@ def align_midi_ticks(midi, bpm, sixteenth, triplet_u):
             new_tick_delta = seconds_to_ticks(rounded_seconds, bpm, midi._division)
             print(click, "->", new_tick_delta, " og track tempo:", og_track_tempo)
             align_click_acc += new_tick_delta
-            aligned._tracks[-1].events()[align_click_acc] = og_event
+            # meta/sysex (track name, time and key signature...) move with
+            # the notes so they survive the round trip
+            for og_event in og_events:
+                aligned._tracks[-1].insert(align_click_acc, og_event)
             aligned._tempoMap[align_click_acc] = float(bpm / 60.0)
             
-    aligned.status = midi.status
-    aligned.sstatus = midi.sstatus
     # print(midi._division)
     return aligned
 
-def verify_header(midi):
-    hdr = midi._read(4)
-    length = midi.read_long()
+def beat_scale(midi, bpm):
+    """Factor taking the source file's beats to beats at bpm.
+
+    Like align_midi_ticks this assumes the source doesn't change tempo.
+    """
+    og_bps = midi._tempoMap.get(0, 2.0) if midi._tempoMap else 2.0
+    return (bpm / 60.0) / og_bps
+
+def snap_beats(beats):
+    """Snap beat positions to the nearer of the 16th and eighth-triplet grids."""
+    track_16th = np.round(beats * 4.0) / 4.0
+    track_12th = np.round(beats * 3.0) / 3.0
+    return np.where(np.abs(beats - track_16th) <= np.abs(beats - track_12th), track_16th, track_12th)
+
+def snap_durations(dur, note_values=NOTE_VALUES):
+    """Snap durations in beats to the nearest of note_values, or to a
+    multiple of the longest one past it."""
+    values = np.asarray(note_values, dtype=np.float64)
+    top = values[-1]
+    nearest = values[np.argmin(np.abs(dur[:, None] - values[None, :]), axis=1)]
+    return np.where(dur > top, np.maximum(np.rint(dur / top), 1) * top, nearest)
+
+def clamp_to_next_onset(onset, end, channel, pitch):
+    """Cut each note off at the next onset of the same (channel, pitch).
+
+    Snapped separately, a note's end can land past the next onset of its
+    key, and pair_notes' stack would then pair the two back crosswise.
+    Of notes of one key starting on the same tick only the longest is
+    kept. Returns (end, keep mask).
+    """
+    order = np.lexsort((-end, onset, pitch, channel))  # by key, onset, longest first
+    key = channel[order].astype(np.int64) * 128 + pitch[order]
+    o = onset[order]
+    first = np.ones(len(o), dtype=bool)
+    first[1:] = (key[1:] != key[:-1]) | (o[1:] != o[:-1])
+    kept = order[first]
+    same_key = key[first][1:] == key[first][:-1]
+    end = end.copy()
+    end[kept[:-1]] = np.where(same_key, np.minimum(end[kept[:-1]], onset[kept[1:]]), end[kept[:-1]])
+    keep = np.zeros(len(onset), dtype=bool)
+    keep[kept] = True
+    return end, keep
+
+def quantize_notes(notes, division, scale=1.0, note_values=NOTE_VALUES, grid='nearest'):
+    """Snap onsets to the grid and durations to note_values in one pass.
+
+    notes are in source ticks; scale (see beat_scale) converts source beats
+    to beats at the target tempo. Returns notes in target ticks.
+    grid='nearest' picks the grid per onset, grid='dp' per beat (see
+    grid_inference). Notes are cut off at the next onset of their key (see
+    clamp_to_next_onset).
+    """
+    snap = snap_beats_dp if grid == 'dp' else snap_beats
+    onset = np.rint(snap(notes.onset * (scale / division)) * division).astype(np.int64)
+    dur = np.rint(snap_durations(notes.duration * (scale / division), note_values) * division).astype(np.int64)
+    end, keep = clamp_to_next_onset(onset, onset + dur, notes.channel, notes.pitch)
+    return NoteArrays(
+        onset=onset,
+        duration=end - onset,
+        pitch=notes.pitch,
+        channel=notes.channel,
+        velocity=notes.velocity,
+        unmatched_on=notes.unmatched_on,
+        unmatched_off=notes.unmatched_off,
+    ).take(keep)
+
+def notes_to_track(track, notes, other_ticks, other_rows, og_track):
+    """Fill track's columns with notes plus og_track's non-note rows.
+
+    Note-offs sort before anything else at the same tick, note-ons after.
+    """
+    n = len(notes)
+    ticks = np.concatenate([notes.onset + notes.duration, other_ticks, notes.onset])
+    kind = np.concatenate([np.zeros(n, np.int8), np.ones(len(other_rows), np.int8), np.full(n, 2, np.int8)])
+    order = np.lexsort((kind, ticks))
+
+    og_status = np.frombuffer(og_track.status, dtype=np.uint8)
+    og_a = np.frombuffer(og_track.dataA, dtype=np.uint8)
+    og_b = np.frombuffer(og_track.dataB, dtype=np.uint8)
+    ch = notes.channel.astype(np.uint8)
+    status = np.concatenate([0x80 | ch, og_status[other_rows], 0x90 | ch])
+    data_a = np.concatenate([notes.pitch.astype(np.uint8), og_a[other_rows], notes.pitch.astype(np.uint8)])
+    data_b = np.concatenate([np.zeros(n, np.uint8), og_b[other_rows], notes.velocity.astype(np.uint8)])
+
+    track.ticks = array('q', ticks[order].astype(np.int64).tobytes())
+    track.status = array('B', status[order].tobytes())
+    track.dataA = array('B', data_a[order].tobytes())
+    track.dataB = array('B', data_b[order].tobytes())
+
+    # carry meta/sysex payloads over to their new rows
+    new_row = np.empty(len(order), dtype=np.int64)
+    new_row[order] = np.arange(len(order))
+    for i, og_row in enumerate(other_rows.tolist()):
+        if og_row in og_track.edata:
+            track.edata[int(new_row[n + i])] = og_track.edata[og_row]
+    return track
+
+def align_midi_notes(midi, bpm, note_values=NOTE_VALUES, grid='nearest'):
+    """Quantize whole notes instead of single events.
+
+    Note-ons and note-offs are paired first (see notepairs), so a note can't
+    collapse to zero length or end before it starts; durations snap to
+    note_values. Other events are snapped to the onset grid.
+    """
+    aligned = MidiFile()
+    aligned._format = midi._format
+    aligned._division = midi._division
+    aligned._tempoMap = {0: bpm / 60.0}
+    aligned._tracks.clear()
+
+    scale = beat_scale(midi, bpm)
+    for og_track in midi._tracks:
+        notes = quantize_notes(pair_notes(og_track), midi._division, scale, note_values, grid)
+        _, _, other = note_rows(og_track)
+        other_rows = np.flatnonzero(other)
+        other_ticks = np.frombuffer(og_track.ticks, dtype=np.int64)[other_rows]
+        other_ticks = np.rint(snap_beats(other_ticks * (scale / midi._division)) * midi._division).astype(np.int64)
+        aligned._tracks.append(notes_to_track(MidiTrack(aligned), notes, other_ticks, other_rows, og_track))
+    return aligned
+
+def verify_header(path):
+    with open(path, 'rb') as f:
+        hdr = f.read(4)
+        length = int.from_bytes(f.read(4), byteorder='big')
     if hdr != b'MThd' or length < 6:
         raise ValueError('bad midifile: MThd expected, got {this} of length {L} instead', hdr, length)
     return
@@ -106,26 +238,21 @@ def main():
 
     song_tempo = float(input("Enter a tempo (beats per minute): "))
 
-    sixteenth_note_duration = 0
-    eighth_triplet_unit_duration = 0
-
     # 1) Pre-Processing:
     if base_midi._division > 0:
-        sixteenth_note_duration = song_tempo / (240.0)
-        eighth_triplet_unit_duration = song_tempo / (180.0)
-        aligned_midi = align_midi_ticks(base_midi, song_tempo, sixteenth_note_duration, eighth_triplet_unit_duration)
+        aligned_midi = align_midi_notes(base_midi, song_tempo)
     else:
         print("TODO: Implementation for SMPTE timecode division")
         return
 
-    f = open("stage_3/mil_dreams_aligned.mid", 'wb')
-    aligned_midi.write_to_file(f)
+    aligned_midi.write("stage_3/mil_dreams_aligned.mid")
+    midi_to_musicxml(aligned_midi, "stage_3/mil_dreams_aligned.mxl")
 
     # verification
     aligned_midi.read("stage_3/mil_dreams_aligned.mid")
 
-    # verify_header(base_midi)
-    # verify_header(aligned_midi)
+    # verify_header("stage_3/mil_dreams_low_priority.mid")
+    # verify_header("stage_3/mil_dreams_aligned.mid")
 
     return
     # align_midi_ticks(tempo, sixteenth_note_duration, eighth_triplet_unit_duration)
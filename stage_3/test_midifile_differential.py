@@ -0,0 +1,36 @@
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench_midifile import MALFORMED, VARIANTS, check, generate, midi_file, read, write
+from reference_midi import decode
+
+
+@pytest.mark.parametrize('variant', list(VARIANTS) + [MALFORMED])
+def test_midifile_agrees_with_the_reference(variant):
+    for i, data in enumerate(generate(variant, files=8, events=150)):
+        assert check(data) == [], f'{variant} #{i}'
+
+
+def test_malformed_files_are_rejected_not_crashed():
+    errors = {decode(d)[1] for d in generate(MALFORMED, files=40, events=50) if decode(d)[0] == 'error'}
+    assert errors and errors <= {'EOFError', 'ValueError', 'NotImplementedError'}
+
+
+def test_smpte_division():
+    # -25 fps, 40 ticks per frame
+    data = midi_file([b'\x00\xff\x2f\x00'], fmt=0, division=0xe728)
+    assert read(data)._division == 1000
+    assert decode(data)[2] == 1000
+
+
+def test_tempo_survives_rewriting():
+    # 1 / (1e6 / 400002) * 1e6 is 400001.99..., which used to be truncated
+    data = midi_file([b'\x00\xff\x51\x03\x06\x1a\x82' + b'\x00\xff\x2f\x00'], fmt=0)
+    written = write(read(data))
+    assert b'\xff\x51\x03\x06\x1a\x82' in written
+    assert write(read(written)) == written
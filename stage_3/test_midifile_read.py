@@ -0,0 +1,156 @@
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from midifile import MidiFile
+from midievent import MidiEventType
+
+
+def make_midi(track_data, fmt=0, division=480):
+    hdr = b'MThd' + (6).to_bytes(4, 'big') + fmt.to_bytes(2, 'big') + (1).to_bytes(2, 'big') + division.to_bytes(2, 'big')
+    return hdr + b'MTrk' + len(track_data).to_bytes(4, 'big') + track_data
+
+
+def read_bytes(data):
+    mf = MidiFile()
+    mf.read_from_file(io.BytesIO(data))
+    return mf
+
+
+def test_running_status_and_columns():
+    # note on, running-status note on (velocity 0), program change, EOT
+    data = make_midi(b'\x00\x90\x3c\x64' + b'\x81\x70\x3c\x00' + b'\x10\xc1\x05' + b'\x00\xff\x2f\x00')
+    track = read_bytes(data)._tracks[0]
+
+    assert list(track.ticks) == [0, 240, 256]
+    assert list(track.status) == [0x90, 0x90, 0xc1]
+    assert list(track.dataA) == [0x3c, 0x3c, 0x05]
+    assert list(track.dataB) == [0x64, 0x00, 0x00]
+
+    ev, = track.events()[256]
+    assert ev.type() == MidiEventType.PROGRAM
+    assert ev.channel() == 1
+    assert ev.dataA() == 5
+
+
+def test_running_status_survives_meta_and_skips_system_bytes():
+    # tempo meta between two running-status events, and a clock byte (0xf8)
+    # in front of a status byte
+    data = make_midi(b'\x00\x90\x3c\x64'
+                     + b'\x00\xff\x51\x03\x07\xa1\x20'
+                     + b'\x10\x3e\x64'
+                     + b'\x10\xf8\x80\x3c\x00'
+                     + b'\x00\xff\x2f\x00')
+    mf = read_bytes(data)
+    track = mf._tracks[0]
+
+    assert list(track.status) == [0x90, 0xff, 0x90, 0x80]
+    assert list(track.dataA) == [0x3c, 0x51, 0x3e, 0x3c]
+    assert mf._tempoMap == {0: 2.0}
+
+
+def test_status_in_second_data_byte_becomes_running_status():
+    data = make_midi(b'\x00\x90\x3c\x80' + b'\x00\x3e\x00' + b'\x00\xff\x2f\x00')
+    track = read_bytes(data)._tracks[0]
+
+    assert list(track.status) == [0x90, 0x80]
+    assert list(track.dataA) == [0x3c, 0x3e]
+
+
+def test_data_byte_in_first_position_is_an_error():
+    data = make_midi(b'\x00\x90\x80\x00' + b'\x00\xff\x2f\x00')
+    with pytest.raises(ValueError):
+        read_bytes(data)
+
+
+def test_truncated_track_raises_eof():
+    data = make_midi(b'\x00\x90\x3c')
+    with pytest.raises(EOFError):
+        read_bytes(data)
+
+
+def test_meta_and_sysex_round_trip():
+    data = make_midi(b'\x00\xff\x03\x04Lead'
+                     + b'\x00\xff\x58\x04\x03\x02\x18\x08'
+                     + b'\x00\xff\x59\x02\xfd\x00'
+                     + b'\x00\xf0\x05\x7e\x7f\x09\x01\xf7'
+                     + b'\x00\x90\x3c\x64'
+                     + b'\x60\xff\x05\x02la'
+                     + b'\x00\x3c\x00'
+                     + b'\x00\xff\x2f\x00')
+    track = read_bytes(data)._tracks[0]
+
+    # payloads are views into the chunk buffer until accessed
+    assert isinstance(track.edata[0], memoryview)
+    name, timesig, keysig, sysex, note = track.events()[0]
+    assert name.text() == 'Lead'
+    assert bytes(timesig.edata()) == b'\x03\x02\x18\x08'
+    assert keysig.metaType() == 0x59
+    assert sysex.isSysex() and bytes(sysex.edata()) == b'\x7e\x7f\x09\x01\xf7'
+    assert note.type() == MidiEventType.NOTEON
+
+    mf = read_bytes(data)
+    out = io.BytesIO()
+    mf.write_to_file(out)
+    again = read_bytes(out.getvalue())._tracks[0]
+    # the writer adds a tempo event at tick 0
+    assert [e.type() for e in again.events()[0] if not (e.isMeta() and e.metaType() == 0x51)] == \
+        [MidiEventType.META, MidiEventType.META, MidiEventType.META, MidiEventType.SYSEX, MidiEventType.NOTEON]
+    lyric, off = again.events()[0x60]
+    assert lyric.text() == 'la'
+    assert off.dataB() == 0
+
+
+def test_concurrent_writes_and_failed_read_keep_state():
+    from concurrent.futures import ThreadPoolExecutor
+
+    data = make_midi(b'\x00\x90\x3c\x64' + b'\x60\x3c\x00' + b'\x00\xff\x2f\x00')
+    mf = read_bytes(data)
+    mf.verbose = False
+
+    def write(_):
+        out = io.BytesIO()
+        mf.write_to_file(out)
+        return out.getvalue()
+
+    with ThreadPoolExecutor(8) as pool:
+        outputs = set(pool.map(write, range(64)))
+    assert len(outputs) == 1
+
+    # a read that fails half way leaves the previous contents alone
+    with pytest.raises(EOFError):
+        mf.read_from_file(io.BytesIO(data[:-3]))
+    assert list(mf._tracks[0].ticks) == [0, 96]
+    assert mf.bytes_read == len(data)
+
+
+def test_compact_write():
+    # alternating NOTEON/NOTEOFF, a zero-length note, and a tempo entry per
+    # event the way align_midi_ticks leaves the tempo map
+    data = make_midi(b'\x00\x90\x3c\x64' + b'\x60\x80\x3c\x40'
+                     + b'\x00\x90\x3e\x64' + b'\x00\x80\x3e\x40'
+                     + b'\x00\x90\x40\x64' + b'\x60\x80\x40\x40'
+                     + b'\x00\x90\x41\x64' + b'\x60\x80\x41\x40'
+                     + b'\x00\xff\x2f\x00')
+    mf = read_bytes(data)
+    mf.verbose = False
+    mf._tempoMap = {0: 2.0, 0x60: 2.0, 0xc0: 2.0, 0x120: 1.5}
+
+    plain, compact = mf.compact_savings()
+    out = io.BytesIO()
+    mf.write_to_file(out, compact=True)
+    assert mf.bytes_written == compact == len(out.getvalue()) < plain
+
+    again = read_bytes(out.getvalue())
+    ticks, status, dataA, dataB = again._tracks[0].columns()
+    notes = [(t, a, b) for t, s, a, b in zip(ticks, status, dataA, dataB) if s != 0xff]
+    # one status byte for the whole track, the zero-length 0x3e is gone
+    assert set(s for s in status if s != 0xff) == {0x90}
+    assert notes == [(0, 0x3c, 0x64), (0x60, 0x3c, 0), (0x60, 0x40, 0x64), (0xc0, 0x40, 0),
+                     (0xc0, 0x41, 0x64), (0x120, 0x41, 0)]
+    assert sorted(again._tempoMap) == [0, 0x120]
+    assert out.getvalue().endswith(b"\x00\xff\x2f\x00")  # no extra delta before EOT
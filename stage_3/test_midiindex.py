@@ -0,0 +1,38 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from midiindex import MidiIndex, build_index
+
+
+def write_midi(path, track_data):
+    hdr = b'MThd' + (6).to_bytes(4, 'big') + (0).to_bytes(2, 'big') + (1).to_bytes(2, 'big') + (480).to_bytes(2, 'big')
+    with open(path, 'wb') as f:
+        f.write(hdr + b'MTrk' + len(track_data).to_bytes(4, 'big') + track_data)
+
+
+def test_build_query_and_refresh(tmp_path):
+    corpus = tmp_path / 'corpus'
+    corpus.mkdir()
+    # 1 note at 60, one second long at the default 120 bpm
+    write_midi(corpus / 'low.mid', b'\x00\x90\x3c\x64\x87\x40\x3c\x00\x00\xff\x2f\x00')
+    # 2 notes, one above 84
+    write_midi(corpus / 'high.mid', b'\x00\x90\x3c\x64\x00\x58\x64\x87\x40\x3c\x00\x00\x58\x00\x00\xff\x2f\x00')
+    (corpus / 'notes.txt').write_text('not midi')
+    index = str(tmp_path / 'index')
+
+    assert build_index(str(corpus), index, workers=2) == (2, 0)
+    idx = MidiIndex(index)
+    assert [f['path'] for f in idx.files] == ['high.mid', 'low.mid']
+    assert list(idx.offsets) == [0, 4, 6]
+    assert idx.files_where(idx.note_on() & (idx.pitch > 84)) == ['high.mid']
+    assert idx.note_density().tolist() == [2.0, 1.0]
+    assert idx.pitch_histogram()[60] == 2
+
+    # only the changed file is parsed again
+    write_midi(corpus / 'low.mid', b'\x00\x90\x60\x64\x87\x40\x60\x00\x00\xff\x2f\x00')
+    os.utime(corpus / 'low.mid', (1, 1))
+    assert build_index(str(corpus), index, workers=2) == (1, 1)
+    idx = MidiIndex(index)
+    assert idx.files_where(idx.note_on() & (idx.pitch > 84)) == ['high.mid', 'low.mid']
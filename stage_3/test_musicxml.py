@@ -0,0 +1,90 @@
+import io
+import os
+import sys
+import xml.etree.ElementTree as ET
+import zipfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from midifile import MidiFile
+from musicxml import _pieces, midi_to_musicxml, parse_key, write_musicxml
+from notepairs import NoteArrays
+
+
+def notes(onset, duration, pitch):
+    n = len(onset)
+    return NoteArrays(np.array(onset), np.array(duration), np.array(pitch),
+                      np.zeros(n, np.int64), np.full(n, 90))
+
+
+def test_measures_ties_and_harmony(tmp_path):
+    # three triplet eighths, then a note over the barline of a 3/4 bar
+    score = notes([0, 160, 320, 480], [160, 160, 160, 1320], [60, 62, 64, 65])
+    chords = [{"time": 0.0, "chord": "C Maj"}, {"time": 1.1, "chord": "A# min"}]
+    path = tmp_path / "score.mxl"
+    write_musicxml(path, score, 480, {0: 2.0}, (3, 4), chords)
+
+    with zipfile.ZipFile(path) as z:
+        assert "META-INF/container.xml" in z.namelist()
+        root = ET.fromstring(z.read("score.xml"))
+    measures = root.findall(".//measure")
+    assert len(measures) == 2
+    for m in measures:
+        assert sum(int(n.find("duration").text) for n in m.findall("note")) == 1440
+
+    first, second = measures
+    assert len(first.findall("note/time-modification")) == 3
+    assert first.findall("note")[-1].find("tie").get("type") == "start"
+    assert second.find("note/tie").get("type") == "stop"
+    assert second.find("note/pitch/step").text == "F"
+    # A# minor changes mid-beat and is written on the next beat, the downbeat
+    harmony = second.find("harmony")
+    assert harmony.find("root/root-step").text == "A"
+    assert harmony.find("root/root-alter").text == "1"
+    assert harmony.find("kind").text == "minor"
+
+
+def read_score(path):
+    return ET.parse(path).getroot()
+
+
+def test_key_is_written_only_when_given(tmp_path):
+    score = notes([0], [480], [69])
+    path = tmp_path / "score.musicxml"
+    write_musicxml(path, score, 480)
+    assert read_score(path).find(".//key") is None
+
+    for key, fifths in [((9, 'minor'), 0), ((2, 'major'), 2), ((5, 'major'), -1), (parse_key("Eb major"), -3)]:
+        write_musicxml(path, score, 480, key=key)
+        found = read_score(path).find(".//key")
+        assert int(found.find("fifths").text) == fifths
+        assert found.find("mode").text == key[1]
+
+
+def test_meter_changes_start_a_new_time(tmp_path):
+    # 4/4, a whole note, then 3/4 from tick 1920 and a dotted half
+    track = (b'\x00\xff\x58\x04\x04\x02\x18\x08'
+             + b'\x00\x90\x3c\x64' + b'\x8f\x00\x3c\x00'
+             + b'\x00\xff\x58\x04\x03\x02\x18\x08'
+             + b'\x00\x3e\x64' + b'\x8b\x20\x3e\x00'
+             + b'\x00\xff\x2f\x00')
+    hdr = b'MThd' + (6).to_bytes(4, 'big') + (0).to_bytes(2, 'big') + (1).to_bytes(2, 'big') + (480).to_bytes(2, 'big')
+    mf = MidiFile()
+    mf.read_from_file(io.BytesIO(hdr + b'MTrk' + len(track).to_bytes(4, 'big') + track))
+    path = tmp_path / "score.musicxml"
+    midi_to_musicxml(mf, path)
+
+    measures = read_score(path).findall(".//measure")
+    assert len(measures) == 2
+    assert [m.find("attributes/time/beats").text for m in measures] == ["4", "3"]
+    assert [sum(int(n.find("duration").text) for n in m.findall("note")) for m in measures] == [1920, 1440]
+    assert measures[1].find("note/type").text == "half"
+    assert measures[1].find("note/dot") is not None
+
+
+def test_a_lengthened_piece_gets_the_type_of_its_new_length():
+    # 200 ticks: an eighth triplet (160) leaves 40, too short for anything,
+    # so the piece becomes 200 ticks and is spelled as a dotted 16th (180)
+    assert _pieces(200, 480) == [(200, '16th', 1, False)]
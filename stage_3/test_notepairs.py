@@ -0,0 +1,134 @@
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from midifile import MidiFile
+from notepairs import pair_notes
+from rhythmic_quantization import align_midi_notes, quantize_notes
+
+
+def read_track(track_data, division=480):
+    hdr = b'MThd' + (6).to_bytes(4, 'big') + (0).to_bytes(2, 'big') + (1).to_bytes(2, 'big') + division.to_bytes(2, 'big')
+    mf = MidiFile()
+    mf.read_from_file(io.BytesIO(hdr + b'MTrk' + len(track_data).to_bytes(4, 'big') + track_data))
+    return mf
+
+
+def test_pairs_by_channel_and_pitch_with_velocity_zero_offs():
+    mf = read_track(b'\x00\x90\x3c\x64'          # C4 on, ch 0
+                    + b'\x00\x91\x3c\x50'        # C4 on, ch 1
+                    + b'\x83\x60\x90\x3c\x00'    # 480: C4 off (vel 0), ch 0
+                    + b'\x00\x90\x3e\x64'        # 480: D4 on
+                    + b'\x81\x70\x81\x3c\x00'    # 720: C4 off, ch 1
+                    + b'\x00\x80\x40\x00'        # stray off
+                    + b'\x00\xff\x2f\x00')
+    notes = pair_notes(mf._tracks[0])
+
+    assert notes.onset.tolist() == [0, 0, 480]
+    assert notes.duration.tolist() == [480, 720, 240]  # D4 is closed at the last tick
+    assert notes.pitch.tolist() == [0x3c, 0x3c, 0x3e]
+    assert notes.channel.tolist() == [0, 1, 0]
+    assert notes.unmatched_on == 1
+    assert notes.unmatched_off == 1
+
+
+def test_repeated_pitch_uses_a_stack():
+    mf = read_track(b'\x00\x90\x3c\x64' + b'\x10\x3c\x64' + b'\x10\x3c\x00' + b'\x10\x3c\x00' + b'\x00\xff\x2f\x00')
+    notes = pair_notes(mf._tracks[0])
+
+    assert notes.onset.tolist() == [0, 16]
+    assert notes.duration.tolist() == [48, 16]
+
+
+def test_quantize_snaps_onsets_and_durations():
+    mf = read_track(b'\x00\x90\x3c\x64' + b'\x83\x55\x3c\x00'      # 0..469 -> quarter
+                    + b'\x0d\x3e\x64' + b'\x81\x16\x3e\x00'       # 482..632 -> eighth triplet at 480
+                    + b'\x00\xff\x2f\x00')
+    notes = quantize_notes(pair_notes(mf._tracks[0]), 480)
+
+    assert notes.onset.tolist() == [0, 480]
+    assert notes.duration.tolist() == [480, 160]
+
+
+def test_align_midi_notes_keeps_notes_apart():
+    # the first note's end and the second note's start snap to the same
+    # tick; the note-off has to come first
+    mf = read_track(b'\x00\xff\x58\x04\x04\x02\x18\x08'
+                    + b'\x00\x90\x3c\x64' + b'\x64\x3c\x00'
+                    + b'\x1e\x3e\x64' + b'\x64\x3e\x00'
+                    + b'\x00\xff\x2f\x00')
+    aligned = align_midi_notes(mf, 120)
+    track = aligned._tracks[0]
+
+    assert list(track.status) == [0xff, 0x90, 0x80, 0x90, 0x80]
+    assert list(track.ticks) == [0, 0, 120, 120, 240]
+    assert bytes(track.events()[0][0].edata()) == b'\x04\x02\x18\x08'
+
+
+def test_dp_grid_keeps_one_subdivision_per_beat():
+    from grid_inference import snap_beats_dp
+    from rhythmic_quantization import snap_beats
+
+    # straight 16ths in beat 0 with the third one late enough to look like
+    # a triplet, then a clean triplet beat
+    beats = np.array([0.0, 0.25, 0.62, 0.75, 1.0, 1.0 + 1 / 3, 1.0 + 2 / 3])
+    assert snap_beats(beats)[2] == 2 / 3
+    assert np.allclose(snap_beats_dp(beats), [0.0, 0.25, 0.5, 0.75, 1.0, 1 + 1 / 3, 1 + 2 / 3])
+
+
+def test_quantized_notes_of_one_key_do_not_overlap():
+    # A 0-384 snaps to a quarter and B 408-648 to an eighth at 360: A has
+    # to end where B starts, or the stack pairs them back as 0-600, 360-480
+    mf = read_track(b'\x00\x90\x3c\x64' + b'\x83\x00\x3c\x00'
+                    + b'\x18\x3c\x64' + b'\x81\x70\x3c\x00'
+                    + b'\x00\xff\x2f\x00')
+    notes = quantize_notes(pair_notes(mf._tracks[0]), 480)
+    assert notes.onset.tolist() == [0, 360]
+    assert notes.duration.tolist() == [360, 240]
+
+    again = pair_notes(align_midi_notes(mf, 120)._tracks[0])
+    assert again.onset.tolist() == [0, 360]
+    assert again.duration.tolist() == [360, 240]
+
+
+def test_long_notes_snap_to_whole_note_multiples():
+    # 12.2 beats: three tied whole notes, not one
+    mf = read_track(b'\x00\x90\x3c\x64' + b'\xad\x60\x3c\x00' + b'\x00\xff\x2f\x00')
+    assert pair_notes(mf._tracks[0]).duration.tolist() == [5856]
+    assert quantize_notes(pair_notes(mf._tracks[0]), 480).duration.tolist() == [5760]
+
+
+def test_viterbi_matches_a_plain_one():
+    from grid_inference import viterbi_grids
+
+    rng = np.random.default_rng(0)
+    for nbeats in [1, 2, 7, 50, 1001]:
+        cost = rng.uniform(0, 0.3, (nbeats, 2))
+        best = cost[0].copy()
+        for row in cost[1:]:
+            best = row + np.minimum(best, best.min() + 0.08)
+        path = viterbi_grids(cost, 0.08)
+        total = cost[np.arange(nbeats), path].sum() + 0.08 * np.count_nonzero(np.diff(path))
+        assert np.isclose(total, best.min())
+    with pytest.raises(ValueError):
+        viterbi_grids(np.zeros((5, 3)))
+
+
+def test_align_midi_notes_keeps_an_empty_conductor_track():
+    conductor = b'\x00\xff\x51\x03\x07\xa1\x20' + b'\x00\xff\x2f\x00'
+    melody = b'\x00\x90\x3c\x64' + b'\x83\x55\x3c\x00' + b'\x00\xff\x2f\x00'
+    hdr = b'MThd' + (6).to_bytes(4, 'big') + (1).to_bytes(2, 'big') + (2).to_bytes(2, 'big') + (480).to_bytes(2, 'big')
+    mf = MidiFile()
+    mf.read_from_file(io.BytesIO(hdr + b''.join(b'MTrk' + len(t).to_bytes(4, 'big') + t for t in (conductor, melody))))
+    aligned = align_midi_notes(mf, 120)
+
+    assert len(pair_notes(aligned._tracks[0])) == 0
+    assert list(aligned._tracks[0].status) == [0xff]
+    notes = pair_notes(aligned._tracks[1])
+    assert notes.onset.tolist() == [0]
+    assert notes.duration.tolist() == [480]
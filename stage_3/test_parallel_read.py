@@ -0,0 +1,59 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from midifile import MidiFile
+
+HERE = os.path.dirname(__file__)
+
+
+def read(path, parallel, **kwargs):
+    mf = MidiFile()
+    mf.verbose = False
+    if parallel:
+        mf.read_parallel(path, **kwargs)
+    else:
+        mf.read(path)
+    return mf
+
+
+def tempo_event(tick, bpm):
+    usec = round(60_000_000 / bpm)
+    return bytes([tick, 0xff, 0x51, 3]) + usec.to_bytes(3, 'big')
+
+
+def track(body):
+    body += b'\x00\xff\x2f\x00'
+    return b'MTrk' + len(body).to_bytes(4, 'big') + body
+
+
+def test_parallel_read_matches_read(tmp_path):
+    path = os.path.join(HERE, 'mil_dreams_low_priority.mid')
+    seq, par = read(path, False), read(path, True, workers=2)
+    assert len(par._tracks) == len(seq._tracks)
+    for a, b in zip(seq._tracks, par._tracks):
+        assert a.columns() == b.columns()
+        assert {r: bytes(v) for r, v in a.edata.items()} == {r: bytes(v) for r, v in b.edata.items()}
+    assert par._tempoMap == seq._tempoMap and par.bytes_read == seq.bytes_read
+
+    # tempo entries from every track, later tracks winning on the same tick
+    data = (b'MThd\x00\x00\x00\x06\x00\x01\x00\x03\x01\xe0'
+            + track(tempo_event(0, 120))
+            + track(tempo_event(0, 90) + tempo_event(10, 60) + b'\x00\x90\x3c\x40')
+            + track(tempo_event(20, 100)))
+    synthetic = tmp_path / 'tempo.mid'
+    synthetic.write_bytes(data)
+    # a thread pool runs the same tasks without spawning processes
+    with ThreadPoolExecutor(3) as pool:
+        par = read(str(synthetic), True, executor=pool)
+    seq = read(str(synthetic), False)
+    assert par._tempoMap == seq._tempoMap
+    assert sorted(par._tempoMap) == [0, 10, 20] and round(par._tempoMap[0] * 60) == 90
+
+    synthetic.write_bytes(data[:-3])
+    with pytest.raises(EOFError):
+        read(str(synthetic), True, workers=2)
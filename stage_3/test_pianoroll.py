@@ -0,0 +1,32 @@
+import os
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from pianoroll import NOTE, NOTE_ONSET, Roll, png_bytes, render
+
+
+def test_render_draws_notes_and_encodes_png():
+    roll = Roll(start=np.array([0.0, 1.0]), end=np.array([0.5, 2.0]), pitch=np.array([60, 64]),
+                beats=np.arange(0, 2.5, 0.5), bars=np.array([0.0, 2.0]),
+                chords=[{"time": 0.0, "chord": "C Maj"}, {"time": 1.0, "chord": "A min"}])
+    img = render(roll, px_per_second=10, note_height=4)
+    lane = 12
+    # rows run from pitch 65 (one above the highest note) down to 59
+    row_64 = lane + (65 - 64) * 4
+    assert tuple(img[row_64, 10]) == NOTE_ONSET
+    assert tuple(img[row_64, 15]) == NOTE
+    assert tuple(img[row_64, 5]) != NOTE
+    # the chord lane changes colour where the chord does
+    assert tuple(img[0, 5]) != tuple(img[0, 15])
+
+    png = png_bytes(img)
+    width, height = struct.unpack('>II', png[16:24])
+    assert (height, width) == img.shape[:2]
+    idat = png[png.index(b'IDAT') + 4:png.index(b'IEND') - 8]
+    raw = np.frombuffer(zlib.decompress(idat), np.uint8).reshape(height, 1 + width * 3)
+    assert np.array_equal(raw[:, 1:].reshape(img.shape), img)
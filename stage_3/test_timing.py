@@ -0,0 +1,20 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from timing import seconds_ticks, tick_seconds
+
+
+def test_tick_seconds_follows_tempo_changes():
+    # 120 bpm for two beats, then 60 bpm
+    seconds = tick_seconds([0, 480, 960, 1440], {0: 2.0, 960: 1.0}, 480)
+    assert np.allclose(seconds, [0.0, 0.5, 1.0, 2.0])
+
+
+def test_seconds_ticks_inverts_tick_seconds():
+    tempo_map = {0: 2.0, 960: 1.0}
+    ticks = np.array([0, 480, 960, 1440, 2000])
+    assert np.allclose(seconds_ticks(tick_seconds(ticks, tempo_map, 480), tempo_map, 480), ticks)
@@ -0,0 +1,46 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from validate_midi import validate_file
+
+
+def write_midi(path, track_data, extra=b''):
+    hdr = b'MThd' + (6).to_bytes(4, 'big') + (0).to_bytes(2, 'big') + (1).to_bytes(2, 'big') + (480).to_bytes(2, 'big')
+    with open(path, 'wb') as f:
+        f.write(hdr + b'MTrk' + len(track_data).to_bytes(4, 'big') + track_data + extra)
+
+
+def test_clean_file(tmp_path):
+    path = str(tmp_path / 'ok.mid')
+    # 3/4 time, two quarter notes
+    write_midi(path, b'\x00\xff\x58\x04\x03\x02\x18\x08'
+               + b'\x00\x90\x3c\x64\x83\x60\x3c\x00' + b'\x00\x3e\x64\x83\x60\x3e\x00'
+               + b'\x00\xff\x2f\x00')
+    report = validate_file(path, monophonic=True)
+
+    assert report['ok']
+    assert report['stats']['notes'] == 2
+    assert report['stats']['pitch_histogram'] == {'60': 1, '62': 1}
+    assert report['stats']['notes_per_bar'] == [2]
+
+
+def test_problems_are_counted(tmp_path):
+    path = str(tmp_path / 'bad.mid')
+    write_midi(path, b'\x00\x90\x3c\x64\x00\x3c\x00'      # zero length
+               + b'\x00\x3e\x64\x10\x40\x64\x10\x3e\x00'  # overlapping
+               + b'\x00\x80\x45\x00',                     # stray off, no EOT
+               extra=b'\x00\x00')
+    report = validate_file(path, monophonic=True)
+
+    assert not report['ok']
+    assert report['problems'] == {
+        'zero_duration': 1,
+        'unmatched_note_on': 1,
+        'unmatched_note_off': 1,
+        'overlapping_notes': 1,
+        'bad_data_bytes': 0,
+        'track_length_mismatch': 1,
+        'trailing_bytes': 2,
+    }
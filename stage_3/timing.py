@@ -0,0 +1,37 @@
+"""Pitch names and tempo-map time conversion shared by the score writers.
+
+Tempo maps are MidiFile._tempoMap dicts, tick -> beats per second, with
+2.0 (120 bpm) before the first entry. Only NumPy is imported, so stage 2
+can use this as stage_3.timing without putting stage_3 on sys.path.
+"""
+import numpy as np
+
+# pitch class -> name, as in the chords JSON ("C# min")
+ROOTS = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+
+def _segments(tempo_map, division):
+    """(tick, seconds, beats per second) at the start of each tempo."""
+    change = sorted(tempo_map.items())
+    if not change or change[0][0] != 0:
+        change.insert(0, (0, 2.0))
+    at = np.array([c[0] for c in change], dtype=np.float64)
+    bps = np.array([c[1] for c in change], dtype=np.float64)
+    seconds_at = np.concatenate([[0.0], np.cumsum(np.diff(at) / (division * bps[:-1]))])
+    return at, seconds_at, bps
+
+
+def tick_seconds(ticks, tempo_map, division):
+    """Seconds of absolute ticks under tempo_map."""
+    ticks = np.asarray(ticks, dtype=np.float64)
+    at, seconds_at, bps = _segments(tempo_map, division)
+    i = np.searchsorted(at, ticks, side='right') - 1
+    return seconds_at[i] + (ticks - at[i]) / (division * bps[i])
+
+
+def seconds_ticks(seconds, tempo_map, division):
+    """Absolute ticks of times in seconds under tempo_map."""
+    seconds = np.asarray(seconds, dtype=np.float64)
+    at, seconds_at, bps = _segments(tempo_map, division)
+    i = np.searchsorted(seconds_at, seconds, side='right') - 1
+    return at[i] + (seconds - seconds_at[i]) * division * bps[i]
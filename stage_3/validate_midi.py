@@ -0,0 +1,182 @@
+"""Single-pass validation and statistics for MIDI files.
+
+Parses a file once with MidiFile, pairs its notes (see notepairs) and runs
+every check on the track columns:
+
+- zero or negative note durations
+- note-ons that are never switched off, note-offs with nothing to end
+- overlapping notes (only for tracks expected to be monophonic)
+- data bytes with the high bit set, or data with no status to run on
+- MTrk chunks whose length doesn't match their events (no EOT, or bytes
+  left after it), and bytes after the last chunk
+
+Results are plain dicts, ready for json.dumps. Usage:
+
+    python validate_midi.py [--mono] [--workers N] file-or-dir ...
+
+exits with status 1 if any file has problems, so it can gate a pipeline.
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from midievent import MetaEventConstants
+from midifile import MidiFile
+from notepairs import pair_notes
+
+CHECKS = (
+    'zero_duration',
+    'unmatched_note_on',
+    'unmatched_note_off',
+    'overlapping_notes',
+    'bad_data_bytes',
+    'track_length_mismatch',
+)
+
+
+def time_signature(mf: MidiFile):
+    """(beats, beat type) of the first time signature, 4/4 if none."""
+    for track in mf._tracks:
+        rows = np.flatnonzero((np.frombuffer(track.status, dtype=np.uint8) == 0xff)
+                              & (np.frombuffer(track.dataA, dtype=np.uint8) == MetaEventConstants.META_TIME_SIGNATURE))
+        for row in rows.tolist():
+            data = track.edata.get(row)
+            if data is not None and len(data) >= 2:
+                return data[0], 1 << data[1]
+    return 4, 4
+
+
+def time_signatures(mf: MidiFile):
+    """(tick, beats, beat type) of every meter change, by tick. The meter
+    at tick 0 is 4/4 unless the file says otherwise."""
+    found = {}
+    for track in mf._tracks:
+        ticks = np.frombuffer(track.ticks, dtype=np.int64)
+        rows = np.flatnonzero((np.frombuffer(track.status, dtype=np.uint8) == 0xff)
+                              & (np.frombuffer(track.dataA, dtype=np.uint8) == MetaEventConstants.META_TIME_SIGNATURE))
+        for row in rows.tolist():
+            data = track.edata.get(row)
+            if data is not None and len(data) >= 2:
+                found[int(ticks[row])] = (data[0], 1 << data[1])
+    found.setdefault(0, (4, 4))
+    out = []
+    for tick, sig in sorted(found.items()):
+        if not out or out[-1][1:] != sig:
+            out.append((tick,) + sig)
+    return out
+
+
+def bar_ticks(mf: MidiFile) -> int:
+    """Bar length in ticks from the first time signature (4/4 if none)."""
+    beats, beat_type = time_signature(mf)
+    return max(1, mf._division * 4 * beats // beat_type)
+
+
+def check_track(track, monophonic=False):
+    """Problem counts and notes of one track."""
+    ticks, status, dataA, dataB = track.columns()
+    st = np.frombuffer(status, dtype=np.uint8)
+    chan = (st > 0) & (st < 0xf0)
+    data = np.frombuffer(dataA, dtype=np.uint8) | np.frombuffer(dataB, dtype=np.uint8)
+
+    notes = pair_notes(track)
+    problems = dict.fromkeys(CHECKS, 0)
+    problems['zero_duration'] = int(np.count_nonzero(notes.duration <= 0))
+    problems['unmatched_note_on'] = notes.unmatched_on
+    problems['unmatched_note_off'] = notes.unmatched_off
+    problems['bad_data_bytes'] = int(np.count_nonzero(chan & (data >= 0x80)) + np.count_nonzero(st == 0))
+    problems['track_length_mismatch'] = int((not track.eot) or track.unread > 0)
+    if monophonic and len(notes) > 1:
+        # notes come sorted by onset; a note overlaps if it starts before
+        # every earlier note has ended
+        sounding_until = np.maximum.accumulate(notes.end()[:-1])
+        problems['overlapping_notes'] = int(np.count_nonzero(notes.onset[1:] < sounding_until))
+    return problems, notes
+
+
+def validate_file(path, monophonic=False):
+    """Validate one file; returns {'path', 'ok', 'problems', 'stats'}."""
+    report = {'path': path, 'ok': False, 'problems': dict.fromkeys(CHECKS, 0), 'stats': {}}
+    mf = MidiFile()
+    mf.verbose = False
+    try:
+        mf.read(path)
+    except (ValueError, EOFError, NotImplementedError) as e:
+        report['problems']['parse_error'] = str(e)
+        return report
+
+    problems = report['problems']
+    onsets = []
+    pitches = []
+    nevents = 0
+    for track in mf._tracks:
+        track_problems, notes = check_track(track, monophonic)
+        for k, v in track_problems.items():
+            problems[k] += v
+        onsets.append(notes.onset)
+        pitches.append(notes.pitch)
+        nevents += len(track.ticks)
+    trailing = os.path.getsize(path) - mf.bytes_read
+    if trailing:
+        problems['trailing_bytes'] = trailing
+
+    onsets = np.concatenate(onsets) if onsets else np.zeros(0, np.int64)
+    pitches = np.concatenate(pitches) if pitches else np.zeros(0, np.int16)
+    per_bar = np.bincount(onsets // bar_ticks(mf)) if len(onsets) else np.zeros(0, np.int64)
+    hist = np.bincount(pitches, minlength=128) if len(pitches) else np.zeros(128, np.int64)
+    report['stats'] = {
+        'format': mf._format,
+        'division': mf._division,
+        'tracks': len(mf._tracks),
+        'events': nevents,
+        'notes': int(len(onsets)),
+        'pitch_range': [int(pitches.min()), int(pitches.max())] if len(pitches) else None,
+        'pitch_histogram': {str(p): int(hist[p]) for p in np.flatnonzero(hist)},
+        'bars': int(len(per_bar)),
+        'notes_per_bar': per_bar.tolist(),
+        'mean_notes_per_bar': float(per_bar.mean()) if len(per_bar) else 0.0,
+    }
+    report['ok'] = not any(problems.values())
+    return report
+
+
+def _collect(paths):
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            for root, _, names in os.walk(p):
+                files.extend(os.path.join(root, n) for n in sorted(names) if n.lower().endswith(('.mid', '.midi')))
+        else:
+            files.append(p)
+    return files
+
+
+def validate_paths(paths, monophonic=False, workers=None):
+    """Validate files and directories (recursively) in a process pool."""
+    files = _collect(paths)
+    if len(files) <= 1:
+        return [validate_file(f, monophonic) for f in files]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(validate_file, files, [monophonic] * len(files), chunksize=4))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Validate MIDI files and report statistics as JSON.')
+    parser.add_argument('paths', nargs='+', help='MIDI files or directories')
+    parser.add_argument('--mono', action='store_true', help='treat every track as monophonic')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    reports = validate_paths(args.paths, args.mono, args.workers)
+    json.dump(reports, sys.stdout, indent=2)
+    print()
+    return 0 if all(r['ok'] for r in reports) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,24 @@
+from main import parse_importtime
+
+# trimmed from `python -X importtime -c "import numpy"`
+IMPORTTIME_STDERR = """\
+import time: self [us] | cumulative | imported package
+import time:       131 |        131 |   _io
+import time:        48 |         48 |   marshal
+import time:      1022 |       1201 |     numpy._globals
+import time:     12053 |      48760 | numpy
+numpy: ModuleNotFoundError: No module named 'spleeter'
+"""
+
+
+def test_parse_importtime_reads_rows_and_skips_the_rest():
+    assert parse_importtime(IMPORTTIME_STDERR) == [
+        (131, 131, "_io"),
+        (48, 48, "marshal"),
+        (1022, 1201, "numpy._globals"),
+        (12053, 48760, "numpy"),
+    ]
+
+
+def test_parse_importtime_of_nothing():
+    assert parse_importtime("") == []
@@ -0,0 +1,138 @@
+import json
+import shutil
+
+import pytest
+
+from pipeline import RunManifest, StageFailed, run_stage
+
+
+def write_stage(run_dir, calls):
+    """A stage writing text * times to <run_dir>/out.txt."""
+    def fn(src, times):
+        calls.append(times)
+        out = run_dir / "out.txt"
+        out.write_text(src.read_text() * times)
+        return {"out": out}
+    return fn
+
+
+def test_outputs_are_recorded_and_resume_skips(tmp_path):
+    src = tmp_path / "in.txt"
+    src.write_text("ab")
+    manifest = RunManifest(tmp_path)
+    calls = []
+    fn = write_stage(tmp_path, calls)
+
+    outputs = run_stage(manifest, "double", fn, {"src": src}, {"times": 2})
+    assert outputs == {"out": str(tmp_path / "out.txt")}
+    record = manifest.load("double")
+    assert record["status"] == "ok"
+    assert record["params"] == {"times": 2}
+    assert record["inputs"]["src"]["path"] == str(src)
+    assert len(record["outputs"]["out"]["sha256"]) == 64
+    assert manifest.stages() == ["double"]
+
+    states = []
+    again = run_stage(manifest, "double", fn, {"src": src}, {"times": 2}, resume=True,
+                      progress=lambda stage, state: states.append(state))
+    assert again == outputs
+    assert calls == [2]
+    assert states == ["skipped"]
+
+
+@pytest.mark.parametrize("change", ["input", "param", "output"])
+def test_changes_force_a_rerun(tmp_path, change):
+    src = tmp_path / "in.txt"
+    src.write_text("ab")
+    manifest = RunManifest(tmp_path)
+    calls = []
+    fn = write_stage(tmp_path, calls)
+    run_stage(manifest, "double", fn, {"src": src}, {"times": 2})
+
+    times = 2
+    if change == "input":
+        src.write_text("cd")
+    elif change == "param":
+        times = 3
+    else:
+        (tmp_path / "out.txt").write_text("edited")
+    run_stage(manifest, "double", fn, {"src": src}, {"times": times}, resume=True)
+    assert calls == [2, times]
+    assert (tmp_path / "out.txt").read_text() == src.read_text() * times
+
+
+def test_failure_is_recorded_and_raised(tmp_path):
+    manifest = RunManifest(tmp_path)
+
+    def broken(src):
+        raise ValueError("no audio")
+
+    states = []
+    with pytest.raises(StageFailed) as e:
+        run_stage(manifest, "melody", broken, {"src": "missing.wav"},
+                  progress=lambda stage, state: states.append(state))
+    assert e.value.stage == "melody"
+    record = manifest.load("melody")
+    assert record["status"] == "failed"
+    assert record["error"] == "ValueError: no audio"
+    assert "Traceback" in record["traceback"]
+    assert states == ["running", "failed"]
+
+
+def test_an_output_named_like_a_stage_survives(tmp_path):
+    # a stage writing <run_dir>/chords.json must not lose it to the manifest
+    manifest = RunManifest(tmp_path)
+    calls = []
+
+    def chords():
+        calls.append(1)
+        path = tmp_path / "chords.json"
+        path.write_text(json.dumps([{"time": 0.0, "chord": "C Maj"}]))
+        return {"chords": path}
+
+    outputs = run_stage(manifest, "chords", chords, {})
+    assert json.loads(open(outputs["chords"]).read()) == [{"time": 0.0, "chord": "C Maj"}]
+    run_stage(manifest, "chords", chords, {}, resume=True)
+    assert calls == [1]
+
+
+def test_pipeline_corrects_the_melody_against_the_chord_timeline(tmp_path, monkeypatch):
+    import soundfile as sf
+
+    import stage_1.audio_separation as audio_separation
+    from main import run_pipeline
+    from stage_1.bench_separation import synthetic_mix
+
+    mix, _, _ = synthetic_mix(8.0, sr=22050)
+    song = tmp_path / "song.wav"
+    sf.write(song, mix.T, 22050)
+
+    # no YouTube or ffmpeg here: "downloading" copies the wav
+    def fake_download(url, out_dir=None, concurrent_fragments=1):
+        out_dir.mkdir(parents=True, exist_ok=True)
+        return shutil.copy(song, out_dir / "song.mp3")
+
+    def fake_convert(mp3, out_dir=None):
+        return shutil.copy(mp3, out_dir / "song.wav")
+
+    monkeypatch.setattr(audio_separation, "url_to_mp3", fake_download)
+    monkeypatch.setattr(audio_separation, "mp3_to_wav", fake_convert)
+
+    run_dir = tmp_path / "run"
+    states = []
+    outputs = run_pipeline("https://example.com/song", run_dir=run_dir, correct_pitch=True,
+                           separation="fast", melody_backend="yin", dedupe=False,
+                           progress=lambda stage, state: states.append((stage, state)))
+
+    timeline = json.loads(open(outputs["chords"]).read())
+    assert isinstance(timeline, list) and {"time", "chord"} <= set(timeline[0])
+    assert outputs["midi"].endswith("melody_corrected.mid")
+    import pretty_midi
+    assert pretty_midi.PrettyMIDI(outputs["midi"]).instruments[0].notes
+    assert ("correct", "done") in states
+
+    states.clear()
+    run_pipeline("https://example.com/song", run_dir=run_dir, resume=True, correct_pitch=True,
+                 separation="fast", melody_backend="yin", dedupe=False,
+                 progress=lambda stage, state: states.append((stage, state)))
+    assert {state for _, state in states} == {"skipped"}
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from functools import partial
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+
+from server import TranscriptionService
+
+
+def fake_job(job_dir, url=None, upload=None):
+    """Stands in for transcribe_job: "downloads" from the local stand-in
+    for YouTube and writes fixed outputs."""
+    data = urllib.request.urlopen(url).read() if url else Path(upload).read_bytes()
+    if data.startswith(b"sleep"):
+        time.sleep(float(data.split()[1]))
+    if data == b"fail":
+        raise ValueError("unreadable audio")
+    if data == b"crash":
+        os._exit(1)
+    midi = Path(job_dir) / "melody.mid"
+    midi.write_bytes(b"MThd" + data)
+    chords = Path(job_dir) / "chords.json"
+    chords.write_text(json.dumps([{"time": 0.0, "chord": "C Maj"}]))
+    return {"midi": str(midi), "chords": str(chords)}
+
+
+def warm_unless_broken():
+    """A warm-up that fails in worker processes started once the test has
+    set WORKERS_BROKEN."""
+    if os.environ.get("WORKERS_BROKEN"):
+        raise RuntimeError("models won't load")
+
+
+class FakeYouTube(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = self.path.strip("/").replace("_", " ").encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def request(port, method, path, body=None, ctype="application/json"):
+    req = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=body, method=method,
+                                 headers={"Content-Type": ctype})
+    try:
+        with urllib.request.urlopen(req) as r:
+            return r.status, r.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+async def wait_for_status(port, job_id, statuses=("done", "failed", "timeout")):
+    for _ in range(200):
+        _, body = await asyncio.to_thread(request, port, "GET", f"/jobs/{job_id}")
+        job = json.loads(body)
+        if job["status"] in statuses:
+            return job
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"job {job_id} stuck in {job['status']}")
+
+
+def run_service(tmp_path, check, warm=None, **kwargs):
+    youtube = HTTPServer(("127.0.0.1", 0), FakeYouTube)
+    threading.Thread(target=youtube.serve_forever, daemon=True).start()
+
+    async def main():
+        service = TranscriptionService(job_fn=fake_job, warm=warm, jobs_dir=tmp_path, **kwargs)
+        port = await service.start(port=0)
+        try:
+            await check(service, port, f"http://127.0.0.1:{youtube.server_port}")
+        finally:
+            await service.stop()
+
+    try:
+        asyncio.run(main())
+    finally:
+        youtube.shutdown()
+
+
+def test_url_upload_and_failed_jobs(tmp_path):
+    async def check(service, port, youtube):
+        post = partial(asyncio.to_thread, request, port, "POST", "/jobs")
+        status, body = await post(json.dumps({"url": f"{youtube}/some_song"}).encode())
+        assert status == 202
+        url_job = json.loads(body)["id"]
+        status, body = await post(b"raw audio", "audio/wav")
+        upload_job = json.loads(body)["id"]
+        status, body = await post(b"fail", "audio/wav")
+        failed_job = json.loads(body)["id"]
+        assert (await post(b"{}"))[0] == 400
+        assert (await post(json.dumps({"url": f"{youtube}/x", "separation": "magic"}).encode()))[0] == 400
+
+        assert (await wait_for_status(port, url_job))["status"] == "done"
+        status, midi = await asyncio.to_thread(request, port, "GET", f"/jobs/{url_job}/midi")
+        assert status == 200 and midi == b"MThdsome song"
+        status, chords = await asyncio.to_thread(request, port, "GET", f"/jobs/{url_job}/chords")
+        assert json.loads(chords) == [{"time": 0.0, "chord": "C Maj"}]
+
+        assert (await wait_for_status(port, upload_job))["status"] == "done"
+        job = await wait_for_status(port, failed_job)
+        assert job["status"] == "failed" and "unreadable audio" in job["error"]
+        status, _ = await asyncio.to_thread(request, port, "GET", f"/jobs/{failed_job}/midi")
+        assert status == 409
+
+        _, body = await asyncio.to_thread(request, port, "GET", "/metrics")
+        metrics = json.loads(body)
+        assert metrics["jobs"]["done"] == 2 and metrics["jobs"]["failed"] == 1
+        assert metrics["workers_alive"] == 2
+
+    run_service(tmp_path, check, workers=2)
+
+
+def test_backpressure_and_timeout(tmp_path):
+    async def check(service, port, youtube):
+        post = partial(asyncio.to_thread, request, port, "POST", "/jobs")
+        slow = json.loads((await post(b"sleep 30", "audio/wav"))[1])["id"]
+        await wait_for_status(port, slow, ("running",))
+        queued = json.loads((await post(b"quick", "audio/wav"))[1])["id"]
+        status, _ = await post(b"one too many", "audio/wav")
+        assert status == 503
+
+        job = await wait_for_status(port, slow)
+        assert job["status"] == "timeout"
+        # the replacement worker picks up the queued job
+        assert (await wait_for_status(port, queued))["status"] == "done"
+
+        _, body = await asyncio.to_thread(request, port, "GET", "/metrics")
+        metrics = json.loads(body)
+        assert metrics["rejected"] == 1 and metrics["worker_restarts"] == 1
+        assert metrics["workers_alive"] == 1
+
+    run_service(tmp_path, check, workers=1, queue_size=1, timeout=1.0)
+
+
+def test_a_worker_that_cannot_restart_is_reported_dead(tmp_path, monkeypatch):
+    async def check(service, port, youtube):
+        post = partial(asyncio.to_thread, request, port, "POST", "/jobs")
+        monkeypatch.setenv("WORKERS_BROKEN", "1")
+        crashed = json.loads((await post(b"crash", "audio/wav"))[1])["id"]
+        job = await wait_for_status(port, crashed)
+        assert job["status"] == "failed" and job["error"] == "worker process died"
+
+        _, body = await asyncio.to_thread(request, port, "GET", "/metrics")
+        metrics = json.loads(body)
+        assert metrics["workers_dead"] == 1 and metrics["workers_alive"] == 0
+        assert metrics["worker_restarts"] == 3
+        assert service.workers[0].error.startswith("EOFError")
+
+    run_service(tmp_path, check, warm=warm_unless_broken, workers=1)
+
+
+def test_a_worker_killed_between_jobs_fails_the_job_and_restarts(tmp_path):
+    async def check(service, port, youtube):
+        post = partial(asyncio.to_thread, request, port, "POST", "/jobs")
+        await asyncio.to_thread(service.workers[0].kill)
+        lost = json.loads((await post(b"quick", "audio/wav"))[1])["id"]
+        job = await wait_for_status(port, lost)
+        assert job["status"] == "failed" and "BrokenPipeError" in job["error"]
+
+        again = json.loads((await post(b"quick", "audio/wav"))[1])["id"]
+        assert (await wait_for_status(port, again))["status"] == "done"
+        _, body = await asyncio.to_thread(request, port, "GET", "/metrics")
+        metrics = json.loads(body)
+        assert metrics["workers_dead"] == 0 and metrics["worker_restarts"] == 1
+
+    run_service(tmp_path, check, workers=1)
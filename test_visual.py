@@ -0,0 +1,183 @@
+import multiprocessing
+import queue
+import signal
+import time
+
+import pretty_midi
+
+import main
+import pipeline
+import visual
+from visual import TranscribeApp
+
+
+class Widget:
+    """Stands in for the Tk widgets; there's no display here."""
+
+    def __init__(self):
+        self.value = None
+        self.calls = []
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+
+class LateQueue:
+    """A queue whose first get_nowait misses what is already in it, like
+    a child that sent its last event just after the poll looked."""
+
+    def __init__(self, events):
+        self.events = events
+        self.missed = False
+
+    def get_nowait(self):
+        if not self.missed:
+            self.missed = True
+            raise queue.Empty
+        return self.events.get_nowait()
+
+    def get(self, timeout=None):
+        return self.events.get(timeout=timeout)
+
+
+def send_and_exit(events):
+    events.put(("stage", "download", "running"))
+    events.put(("notes", [(0.0, 0.5, 60), (0.5, 1.0, 62)]))
+    events.put(("done", {"midi": "melody.mid"}))
+
+
+def send_and_linger(events):
+    send_and_exit(events)
+    time.sleep(60)
+
+
+def make_app():
+    app = TranscribeApp.__new__(TranscribeApp)
+    app.root = Widget()
+    app.button, app.cancel_button = Widget(), Widget()
+    app.status = Widget()
+    app.canvas = Widget()
+    app.ctx = multiprocessing.get_context("spawn")
+    app.process = None
+    app.events = None
+    app.pending = visual.collections.deque()
+    app.finished = False
+    app.width = 0
+    return app
+
+
+def poll_until_finished(app, timeout=30):
+    deadline = time.monotonic() + timeout
+    app.poll()
+    while not app.finished or app.pending:
+        assert time.monotonic() < deadline
+        time.sleep(visual.POLL_MS / 1000)
+        app.poll()
+
+
+def test_poll_handles_stages_notes_and_done():
+    app = make_app()
+    app.events = app.ctx.Queue()
+    app.process = app.ctx.Process(target=send_and_exit, args=(app.events,))
+    app.process.start()
+    poll_until_finished(app)
+
+    assert app.status.get() == "Done: melody.mid"
+    drawn = [args for name, args, _ in app.canvas.calls if name == "create_rectangle"]
+    assert len(drawn) == 2
+    assert app.width == 1.0 * visual.PX_PER_SECOND
+    app.process.join(timeout=10)
+    app.reap(app.process)
+    assert not app.process.is_alive()
+
+
+def test_a_child_still_exiting_is_reaped_later():
+    app = make_app()
+    app.events = app.ctx.Queue()
+    app.process = app.ctx.Process(target=send_and_linger, args=(app.events,))
+    app.process.start()
+    try:
+        began = time.monotonic()
+        poll_until_finished(app)
+        assert time.monotonic() - began < 30
+        assert app.status.get() == "Done: melody.mid"
+        assert ("after", (visual.POLL_MS, app.reap, app.process), {}) in app.root.calls
+    finally:
+        app.process.kill()
+        app.process.join()
+
+
+def test_the_melody_is_sent_when_its_stage_is_done(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "RUNS_DIR", tmp_path)
+    monkeypatch.setattr(visual.os, "setpgrp", lambda: None, raising=False)
+    events = queue.Queue()
+    seen_by_chords = []
+
+    def melody(run_dir):
+        midi = pretty_midi.PrettyMIDI()
+        midi.instruments.append(pretty_midi.Instrument(program=0))
+        midi.instruments[0].notes.append(pretty_midi.Note(velocity=100, pitch=60, start=0.0, end=0.5))
+        midi.write(str(run_dir / "melody.mid"))
+        return {"midi": run_dir / "melody.mid"}
+
+    def chords(run_dir):
+        seen_by_chords.extend(e[0] for e in list(events.queue))
+        (run_dir / "chords.json").write_text("[]")
+        return {"chords": run_dir / "chords.json"}
+
+    def run_pipeline(url, resume, run_dir, progress):
+        manifest = pipeline.RunManifest(run_dir)
+        outputs = pipeline.run_stage(manifest, "melody", melody, {"run_dir": run_dir}, progress=progress)
+        outputs.update(pipeline.run_stage(manifest, "chords", chords, {"run_dir": run_dir}, progress=progress))
+        return outputs
+
+    monkeypatch.setattr(main, "run_pipeline", run_pipeline)
+    visual.transcribe_worker("https://example.com/song", events)
+
+    assert seen_by_chords == ["stage", "stage", "clear", "notes", "stage"]
+    sent = [events.get_nowait() for _ in range(events.qsize())]
+    assert sent[3] == ("notes", [(0.0, 0.5, 60)])
+    assert sent[-1][0] == "done"
+
+
+def test_events_left_by_an_exited_child_are_not_lost():
+    app = make_app()
+    events = app.ctx.Queue()
+    app.process = app.ctx.Process(target=send_and_exit, args=(events,))
+    app.process.start()
+    app.process.join()
+    app.events = LateQueue(events)
+    poll_until_finished(app)
+
+    assert app.status.get() == "Done: melody.mid"
+
+
+def test_a_child_exiting_without_a_result_is_reported():
+    app = make_app()
+    app.events = app.ctx.Queue()
+    app.process = app.ctx.Process(target=time.sleep, args=(0,))
+    app.process.start()
+    app.process.join()
+    poll_until_finished(app)
+
+    assert app.status.get() == "Transcription process exited unexpectedly"
+
+
+def test_cancel_kills_the_child():
+    app = make_app()
+    app.events = app.ctx.Queue()
+    app.process = app.ctx.Process(target=time.sleep, args=(60,))
+    app.process.start()
+    app.cancel()
+
+    assert not app.process.is_alive()
+    assert app.process.exitcode == -signal.SIGKILL
+    assert app.status.get() == "Cancelled"
+    assert app.finished
+    assert ("configure", (), {"state": visual.tk.NORMAL}) in app.button.calls
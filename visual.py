@@ -1,18 +1,216 @@
+"""Tk front end for the pipeline.
+
+The pipeline takes minutes, so it runs in a child process. Stage progress
+and the melody's notes, as soon as the stage that writes them is done,
+come back through a multiprocessing queue that the window polls with
+root.after. Each poll handles events and draws
+notes for at most DRAW_BUDGET seconds, so a long score shows up bit by
+bit instead of freezing the window. Cancel kills the child and everything
+it started (ffmpeg, spleeter); the checkpointed stages that finished are
+reused when the same URL is transcribed again.
+"""
 # Tkinter image help from https://stackoverflow.com/questions/10133856/how-to-add-an-image-in-tkinter
-import tkinter as tk
-from PIL import Image, ImageTk
+import collections
+import multiprocessing
 import os
+import queue
+import signal
+import sys
+import time
+import tkinter as tk
+
+from main import STAGES
+
+POLL_MS = 50
+DRAW_BUDGET = 0.015   # seconds of work per poll
+NOTE_BATCH = 256      # notes per queue message
+PX_PER_SECOND = 40
+NOTE_HEIGHT = 4
+LOW_PITCH, HIGH_PITCH = 36, 96  # drawn range; notes outside are clamped
+
+
+def note_batches(midi_path, size=NOTE_BATCH):
+    """(start s, end s, pitch) tuples of a MIDI file's notes, in batches."""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "stage_3"))
+    from midifile import MidiFile
+    from notepairs import pair_notes
+
+    mf = MidiFile()
+    mf.verbose = False
+    mf.read(midi_path)
+    # like the rest of stage 3, assume the tempo doesn't change
+    seconds_per_tick = 1.0 / (mf._division * mf._tempoMap.get(0, 2.0))
+    for track in mf._tracks:
+        notes = pair_notes(track)
+        start = (notes.onset * seconds_per_tick).tolist()
+        end = (notes.end() * seconds_per_tick).tolist()
+        pitch = notes.pitch.tolist()
+        for i in range(0, len(notes), size):
+            yield list(zip(start[i:i + size], end[i:i + size], pitch[i:i + size]))
+
+
+def transcribe_worker(url, events):
+    """Child process: run the pipeline, sending a melody's notes as soon as
+    the stage that wrote it is done."""
+    from main import run_pipeline
+    from pipeline import RUNS_DIR, RunManifest, run_id
+
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()  # own process group, so cancel also stops ffmpeg/spleeter
+    manifest = RunManifest(RUNS_DIR / run_id(url))
+
+    def progress(stage, state):
+        events.put(("stage", stage, state))
+        if state in ("done", "skipped", "reused"):
+            midi = manifest.load(stage)["outputs"].get("midi")
+            if midi:
+                # a later stage's melody (the corrected one) replaces this one
+                events.put(("clear",))
+                for batch in note_batches(midi["path"]):
+                    events.put(("notes", batch))
+
+    try:
+        outputs = run_pipeline(url, resume=True, run_dir=manifest.run_dir, progress=progress)
+        events.put(("done", outputs))
+    except Exception as e:
+        events.put(("error", f"{type(e).__name__}: {e}"))
+
+
+class TranscribeApp:
+    def __init__(self, root):
+        self.root = root
+        tk.Label(root, text="C# Transcript Software").grid(row=0, column=0, columnspan=2)
+
+        self.entry = tk.Entry(root, width=50)
+        self.entry.grid(row=1, column=0, columnspan=2)
+        self.button = tk.Button(root, text="Transcribe!", command=self.start)
+        self.button.grid(row=2, column=0)
+        self.cancel_button = tk.Button(root, text="Cancel", command=self.cancel, state=tk.DISABLED)
+        self.cancel_button.grid(row=2, column=1)
+
+        self.img = tk.PhotoImage(file="music_note.png")
+        self.img = self.img.subsample(16, 16) # scale down the image by a factor of 2
+        tk.Label(root, image=self.img).grid(row=3, column=0, columnspan=2)
+
+        self.status = tk.StringVar(value="Paste a YouTube URL and press Transcribe!")
+        tk.Label(root, textvariable=self.status).grid(row=4, column=0, columnspan=2)
+
+        self.canvas = tk.Canvas(root, width=400, height=300, bg="white")
+        self.canvas.grid(row=5, column=0, columnspan=2)
+        scroll = tk.Scrollbar(root, orient=tk.HORIZONTAL, command=self.canvas.xview)
+        scroll.grid(row=6, column=0, columnspan=2, sticky="ew")
+        self.canvas.configure(xscrollcommand=scroll.set)
+
+        # spawn, not fork: the child loads TensorFlow and must not inherit Tk
+        self.ctx = multiprocessing.get_context("spawn")
+        self.process = None
+        self.events = None
+        self.pending = collections.deque()  # notes received, not drawn yet
+        self.finished = False
+        self.width = 0
+
+    # ------------------------- job control -------------------------
+    def start(self):
+        url = self.entry.get().strip()
+        if not url:
+            self.status.set("Enter a URL first")
+            return
+        self.canvas.delete("all")
+        self.pending.clear()
+        self.width = 0
+        self.finished = False
+        self.events = self.ctx.Queue()
+        self.process = self.ctx.Process(target=transcribe_worker, args=(url, self.events), daemon=True)
+        self.process.start()
+        self.button.configure(state=tk.DISABLED)
+        self.cancel_button.configure(state=tk.NORMAL)
+        self.status.set("Starting...")
+        self.root.after(POLL_MS, self.poll)
+
+    def cancel(self):
+        if self.process is None or not self.process.is_alive():
+            return
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (AttributeError, ProcessLookupError, PermissionError):
+            self.process.kill()
+        self.process.join()
+        self.finish("Cancelled")
+
+    def finish(self, message):
+        self.finished = True
+        self.status.set(message)
+        self.button.configure(state=tk.NORMAL)
+        self.cancel_button.configure(state=tk.DISABLED)
+
+    # ------------------------- event loop side -------------------------
+    def poll(self):
+        deadline = time.perf_counter() + DRAW_BUDGET
+        while time.perf_counter() < deadline:
+            if self.pending:
+                self.draw_note(*self.pending.popleft())
+                continue
+            if self.finished:
+                break
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                if self.process.is_alive():
+                    break
+                # the child may have sent its last event and exited since
+                # get_nowait looked, so drain once more before giving up
+                try:
+                    event = self.events.get(timeout=POLL_MS / 1000)
+                except queue.Empty:
+                    self.finish("Transcription process exited unexpectedly")
+                    break
+            self.handle(event)
+
+        if self.pending:
+            self.canvas.configure(scrollregion=(0, 0, self.width, NOTE_HEIGHT * (HIGH_PITCH - LOW_PITCH + 1)))
+        if self.pending or not self.finished:
+            self.root.after(POLL_MS, self.poll)
+
+    def handle(self, event):
+        kind = event[0]
+        if kind == "stage":
+            _, stage, state = event
+            step = STAGES.index(stage) + 1 if stage in STAGES else "?"
+            self.status.set(f"{stage}: {state} ({step}/{len(STAGES)})")
+        elif kind == "clear":
+            self.canvas.delete("all")
+            self.pending.clear()
+            self.width = 0
+        elif kind == "notes":
+            self.pending.extend(event[1])
+        elif kind == "done":
+            self.finish(f"Done: {event[1]['midi']}")
+            self.reap(self.process)
+        elif kind == "error":
+            self.finish(f"Failed: {event[1]}")
+            self.reap(self.process)
+
+    def reap(self, process):
+        """Join the child once it has exited, checking back with root.after
+        so the window never waits on it."""
+        if process.is_alive():
+            self.root.after(POLL_MS, self.reap, process)
+        else:
+            process.join()
 
-root = tk.Tk()
-label = tk.Label(root, text="C# Transcript Software").grid(row=0, column=0)
+    def draw_note(self, start, end, pitch):
+        x0, x1 = start * PX_PER_SECOND, max(end * PX_PER_SECOND, start * PX_PER_SECOND + 1)
+        y = (HIGH_PITCH - min(max(pitch, LOW_PITCH), HIGH_PITCH)) * NOTE_HEIGHT
+        self.canvas.create_rectangle(x0, y, x1, y + NOTE_HEIGHT, fill="steelblue", outline="")
+        self.width = max(self.width, x1)
 
-entry = tk.Entry(root).grid(row=1, column=0)
-button = tk.Button(root, text="Transcribe!").grid(row=2, column=0)
 
-img = tk.PhotoImage(file="music_note.png")
-img = img.subsample(16, 16) # scale down the image by a factor of 2
-panel = tk.Label(root, image=img).grid(row=3, column=0)
+def main():
+    root = tk.Tk()
+    app = TranscribeApp(root)
+    root.protocol("WM_DELETE_WINDOW", lambda: (app.cancel(), root.destroy()))
+    root.mainloop()
 
-canvas = tk.Canvas(root, width=400, height=300).grid(row=4, column=0)
 
-root.mainloop()
\ No newline at end of file
+if __name__ == "__main__":
+    main()